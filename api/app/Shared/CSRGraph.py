@@ -0,0 +1,441 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.Shared.Graph import Graph, creates_reverse_edge
+from app.Shared.Snapshot import PackedStrings, read_snapshot, write_snapshot
+from app.Shared.SpatialIndex import SpatialIndex
+
+SNAPSHOT_FILENAME = "graph.bin"
+
+# Arrays written to and memory-mapped from snapshots, by attribute name
+SNAPSHOT_ARRAYS = (
+    "lats",
+    "lons",
+    "offsets",
+    "sources",
+    "targets",
+    "weights",
+    "reverse_offsets",
+    "reverse_slots",
+    "reverse_sources",
+    "reverse_weights",
+    "edge_refs",
+    "edge_reversed",
+    "category_codes",
+    "parent_codes",
+    "oneway_codes",
+    "coords",
+    "coord_offsets",
+)
+
+
+class StringTable:
+    """Interns repeated string values (categories, oneway tags) as small integer codes."""
+
+    def __init__(self):
+        self.values: List = []
+        self.codes: Dict = {}
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    @classmethod
+    def from_values(cls, values: List):
+        table = cls()
+        for value in values:
+            table.code(value)
+        return table
+
+    def __getitem__(self, code: int):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class CSRGraph:
+    """Compact, integer-indexed representation of the graph.
+
+    Nodes are numbered 0..n-1 and the outgoing edges of node i are stored in the
+    slots offsets[i]:offsets[i + 1] of the edge arrays (compressed sparse row).
+    OSM node IDs and API edge IDs are only needed when translating results back at
+    the API edge, so they are kept in side tables.
+
+    Edge geometries are kept once per source edge in one flat coordinate buffer,
+    coords[coord_offsets[ref]:coord_offsets[ref + 1]], and read backwards for
+    reverse edge slots.
+    """
+
+    def __init__(
+        self,
+        node_ids: Union[List[str], PackedStrings],
+        lats: np.ndarray,
+        lons: np.ndarray,
+        offsets: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        weights: np.ndarray,
+        edge_refs: np.ndarray,
+        edge_reversed: np.ndarray,
+        category_codes: np.ndarray,
+        parent_codes: np.ndarray,
+        oneway_codes: np.ndarray,
+        categories: StringTable,
+        parents: StringTable,
+        oneways: StringTable,
+        coords: np.ndarray,
+        coord_offsets: np.ndarray,
+        reverse_offsets: Optional[np.ndarray] = None,
+        reverse_slots: Optional[np.ndarray] = None,
+        reverse_sources: Optional[np.ndarray] = None,
+        reverse_weights: Optional[np.ndarray] = None,
+        fingerprint: Optional[str] = None,
+    ):
+        self.node_ids = node_ids
+        self.lats = lats
+        self.lons = lons
+
+        self.offsets = offsets
+        self.sources = sources
+        self.targets = targets
+        self.weights = weights
+
+        # Incoming edges per node for backward searches: the slot of each incoming edge
+        # plus copies of its source and weight so they can be sliced contiguously.
+        # Snapshots store these, so they are only derived for freshly built graphs.
+        if reverse_slots is None:
+            reverse_slots = np.argsort(targets, kind="stable").astype(np.int32)
+            reverse_sources = sources[reverse_slots]
+            reverse_weights = weights[reverse_slots]
+            reverse_offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+            np.cumsum(
+                np.bincount(targets, minlength=len(node_ids)),
+                out=reverse_offsets[1:],
+            )
+        self.reverse_offsets = reverse_offsets
+        self.reverse_slots = reverse_slots
+        self.reverse_sources = reverse_sources
+        self.reverse_weights = reverse_weights
+
+        # Edge slot -> index of the edge in the source data, and whether the slot is
+        # the generated reverse edge ("<index>_r")
+        self.edge_refs = edge_refs
+        self.edge_reversed = edge_reversed
+
+        self.category_codes = category_codes
+        self.parent_codes = parent_codes
+        self.oneway_codes = oneway_codes
+        self.categories = categories
+        self.parents = parents
+        self.oneways = oneways
+
+        self.coords = coords
+        self.coord_offsets = coord_offsets
+
+        self._fingerprint = fingerprint
+        # Built on first use, a snapshot opens without touching every node
+        self._node_index = None
+        self._spatial_index = None
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.targets)
+
+    def __repr__(self):
+        return f"CSRGraph(nodes={self.n_nodes}, edges={self.n_edges})"
+
+    @property
+    def node_index(self) -> Dict[str, int]:
+        """OSM node ID -> node index."""
+        if self._node_index is None:
+            self._node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        return self._node_index
+
+    @property
+    def spatial_index(self) -> SpatialIndex:
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(self.lats, self.lons)
+        return self._spatial_index
+
+    @property
+    def fingerprint(self) -> str:
+        """Short digest of the topology and weights, used to match precomputed data
+        (landmark tables etc.) to the graph they were built from."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for array in (self.offsets, self.targets, self.weights):
+                digest.update(np.ascontiguousarray(array).tobytes())
+            self._fingerprint = digest.hexdigest()[:16]
+        return self._fingerprint
+
+    @classmethod
+    def from_records(
+        cls,
+        nodes: Iterable[Tuple[str, float, float]],
+        edges: Iterable[Tuple[str, str, float, str, str, str, str, list]],
+    ):
+        """Build the CSR arrays from plain records.
+
+        Args:
+            nodes: (id, lon, lat) per node
+            edges: (u, v, length, oneway, oneway:bicycle, category, parent,
+                coordinates) per edge, in source order. Reverse edges are generated
+                with the same rules as Graph.add_edge.
+        """
+        node_ids, lons, lats = [], [], []
+        for node_id, lon, lat in nodes:
+            node_ids.append(str(node_id))
+            lons.append(lon)
+            lats.append(lat)
+        node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+
+        categories, parents, oneways = StringTable(), StringTable(), StringTable()
+        sources, targets, weights, refs, reversed_ = [], [], [], [], []
+        category_codes, parent_codes, oneway_codes = [], [], []
+        coords, coord_offsets = [], [0]
+
+        for ref, (
+            u,
+            v,
+            length,
+            oneway,
+            onewaybicycle,
+            category,
+            parent,
+            coordinates,
+        ) in enumerate(edges):
+            u, v = node_index[str(u)], node_index[str(v)]
+            coords.extend(coordinates)
+            coord_offsets.append(len(coords))
+            codes = (
+                categories.code(category),
+                parents.code(parent),
+                oneways.code(oneway),
+            )
+            directions = [(u, v, False)]
+            if creates_reverse_edge(oneway, onewaybicycle):
+                directions.append((v, u, True))
+
+            for source, target, is_reversed in directions:
+                sources.append(source)
+                targets.append(target)
+                weights.append(length)
+                refs.append(ref)
+                reversed_.append(is_reversed)
+                category_codes.append(codes[0])
+                parent_codes.append(codes[1])
+                oneway_codes.append(codes[2])
+
+        # Sort edge slots by source node so each node's edges are contiguous
+        sources = np.asarray(sources, dtype=np.int32)
+        order = np.argsort(sources, kind="stable")
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=offsets[1:])
+
+        return cls(
+            node_ids=node_ids,
+            lats=np.asarray(lats, dtype=np.float64),
+            lons=np.asarray(lons, dtype=np.float64),
+            offsets=offsets,
+            sources=sources[order],
+            targets=np.asarray(targets, dtype=np.int32)[order],
+            weights=np.asarray(weights, dtype=np.float32)[order],
+            edge_refs=np.asarray(refs, dtype=np.int32)[order],
+            edge_reversed=np.asarray(reversed_, dtype=bool)[order],
+            category_codes=np.asarray(category_codes, dtype=np.uint8)[order],
+            parent_codes=np.asarray(parent_codes, dtype=np.uint8)[order],
+            oneway_codes=np.asarray(oneway_codes, dtype=np.uint8)[order],
+            categories=categories,
+            parents=parents,
+            oneways=oneways,
+            coords=np.asarray(coords, dtype=np.float64).reshape(-1, 2),
+            coord_offsets=np.asarray(coord_offsets, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Instantiate a CSRGraph from the dictionary format written by Graph.export_graph_to_json."""
+        nodes = (
+            (
+                node["properties"]["id"],
+                node["properties"]["lon"],
+                node["properties"]["lat"],
+            )
+            for node in data.get("nodes", [])
+        )
+        edges = (
+            (
+                edge["properties"]["u"],
+                edge["properties"]["v"],
+                edge["properties"]["length"],
+                edge["properties"]["oneway"],
+                edge["properties"]["oneway:bicycle"],
+                edge["properties"]["category"],
+                edge["properties"]["parent"],
+                edge["geometry"]["coordinates"],
+            )
+            for edge in data.get("edges", [])
+        )
+        return cls.from_records(nodes, edges)
+
+    @classmethod
+    def from_json_file(cls, filename: str):
+        """Instantiate a CSRGraph from a JSON file without building Node/Edge objects."""
+        with open(filename, "r") as f:
+            data = json.load(f)
+
+        return cls.from_dict(data)
+
+    @classmethod
+    def from_graph(cls, graph: Graph):
+        """Compile an object Graph into CSR arrays.
+
+        Reverse edges are regenerated by from_records, so only the forward edges
+        are read from the Graph.
+        """
+        nodes = ((node.id, node.lon, node.lat) for node in graph.nodes.values())
+        forward_edges = sorted(
+            (edge for edge in graph.edges.values() if not edge.reversed),
+            key=lambda edge: int(edge.id),
+        )
+        edges = (
+            (
+                edge.u,
+                edge.v,
+                edge.distance,
+                edge.oneway,
+                edge.onewaybicycle,
+                edge.category,
+                edge.parentCategory,
+                edge.coordinates.tolist(),
+            )
+            for edge in forward_edges
+        )
+        return cls.from_records(nodes, edges)
+
+    @classmethod
+    def from_snapshot(cls, filename: str):
+        """Open a binary snapshot written by save_snapshot.
+
+        All arrays are memory-mapped views of the file, so opening is independent of
+        the graph size and worker processes share the same physical pages.
+        """
+        arrays, meta = read_snapshot(filename)
+        return cls(
+            node_ids=PackedStrings(
+                arrays.pop("node_id_data"), arrays.pop("node_id_offsets")
+            ),
+            categories=StringTable.from_values(meta["categories"]),
+            parents=StringTable.from_values(meta["parents"]),
+            oneways=StringTable.from_values(meta["oneways"]),
+            fingerprint=meta["fingerprint"],
+            **arrays,
+        )
+
+    def save_snapshot(self, filename: str):
+        """Write the graph as a binary snapshot, see Snapshot.write_snapshot."""
+        node_ids = self.node_ids
+        if not isinstance(node_ids, PackedStrings):
+            node_ids = PackedStrings.from_list(node_ids)
+
+        arrays = {name: getattr(self, name) for name in SNAPSHOT_ARRAYS}
+        arrays["node_id_data"] = node_ids.data
+        arrays["node_id_offsets"] = node_ids.offsets
+
+        meta = {
+            "categories": self.categories.values,
+            "parents": self.parents.values,
+            "oneways": self.oneways.values,
+            "fingerprint": self.fingerprint,
+        }
+        write_snapshot(filename, arrays, meta)
+
+    def edge_coordinates(self, slot: int) -> np.ndarray:
+        """(lon, lat) coordinates of an edge slot, in travel direction."""
+        ref = int(self.edge_refs[slot])
+        coordinates = self.coords[self.coord_offsets[ref] : self.coord_offsets[ref + 1]]
+        return coordinates[::-1] if self.edge_reversed[slot] else coordinates
+
+    def edge_id(self, slot: int) -> str:
+        """Translate an edge slot to the edge ID used by Graph and the API."""
+        ref = int(self.edge_refs[slot])
+        return f"{ref}_r" if self.edge_reversed[slot] else str(ref)
+
+    def edge_ids(self, slots: Iterable[int]) -> List[str]:
+        return [self.edge_id(slot) for slot in slots]
+
+    def find_closest_node(self, lat: float, lon: float) -> int:
+        """Find the index of the node closest to a coordinate."""
+        return self.spatial_index.nearest(lat, lon)
+
+    def find_closest_nodes(self, lats, lons) -> np.ndarray:
+        """Find the indices of the nodes closest to each coordinate in a batch."""
+        _, indices = self.spatial_index.query(lats, lons)
+        return indices
+
+    def validate(self):
+        """Check the structure of the arrays, raising ValueError if it is broken."""
+        n_nodes, n_edges = self.n_nodes, self.n_edges
+        if n_nodes == 0 or n_edges == 0:
+            raise ValueError(f"{self} is empty")
+        if len(self.lats) != n_nodes or len(self.lons) != n_nodes:
+            raise ValueError("Node coordinates do not match the number of nodes")
+        for name in ("offsets", "reverse_offsets"):
+            offsets = getattr(self, name)
+            if (
+                len(offsets) != n_nodes + 1
+                or offsets[0] != 0
+                or offsets[-1] != n_edges
+                or np.any(np.diff(offsets) < 0)
+            ):
+                raise ValueError(f"Invalid {name}")
+        for name in ("sources", "targets", "reverse_sources"):
+            nodes = getattr(self, name)
+            if len(nodes) != n_edges or nodes.min() < 0 or nodes.max() >= n_nodes:
+                raise ValueError(f"{name} out of range")
+        if not np.all(np.isfinite(self.weights)) or self.weights.min() < 0:
+            raise ValueError("Edge weights must be finite and non-negative")
+        if self.coord_offsets[-1] != len(self.coords):
+            raise ValueError("Edge geometries do not match the coordinate buffer")
+
+    def nbytes(self) -> int:
+        """Size of the numeric arrays in bytes."""
+        return sum(getattr(self, name).nbytes for name in SNAPSHOT_ARRAYS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert the graph JSON file to a binary snapshot next to it."
+    )
+    parser.add_argument(
+        "--graph", type=str, default="app/data/Graph/graph.json", help="Graph JSON file"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help=f"Snapshot file, defaults to {SNAPSHOT_FILENAME} next to the graph",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    graph = CSRGraph.from_json_file(args.graph)
+    outfp = args.output or os.path.join(os.path.dirname(args.graph), SNAPSHOT_FILENAME)
+    graph.save_snapshot(outfp)
+    logging.info(f"Saved {graph} to {outfp}")
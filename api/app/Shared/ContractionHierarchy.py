@@ -0,0 +1,378 @@
+import argparse
+import heapq
+import logging
+import multiprocessing
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.Shared.CSRGraph import CSRGraph
+from app.Shared.Snapshot import read_snapshot, write_snapshot
+
+HIERARCHY_FILENAME = "hierarchy.bin"
+
+# Witness searches give up after settling this many nodes and keep the shortcut, which
+# is always safe but makes the hierarchy a bit larger
+SETTLE_LIMIT = 200
+
+# Batches smaller than this are processed in-process, forking workers is not worth it
+PARALLEL_THRESHOLD = 2000
+
+INFINITY = float("infinity")
+
+# Arrays of a hierarchy file, in the order ContractionHierarchy takes them
+HIERARCHY_ARRAYS = (
+    "rank",
+    "up_offsets",
+    "up_targets",
+    "up_weights",
+    "up_edges",
+    "down_offsets",
+    "down_targets",
+    "down_weights",
+    "down_edges",
+    "shortcut_first",
+    "shortcut_second",
+)
+
+# Remaining graph during contraction, shared with forked workers. Each entry maps a
+# neighbor to (weight, edge id) of the single shortest edge to/from that neighbor.
+_out_edges: List[Dict[int, Tuple[float, int]]] = []
+_in_edges: List[Dict[int, Tuple[float, int]]] = []
+_excluded: set = set()
+
+
+def witness_search(
+    source: int, targets: set, max_distance: float, excluded: set
+) -> dict:
+    """Bounded Dijkstra from source over the remaining graph, skipping excluded nodes.
+
+    Stops once all targets are settled, the distance bound is passed or the settle
+    limit is reached.
+    """
+    distances = {source: 0}
+    priority_queue = [(0, source)]
+    remaining = set(targets)
+    settled = 0
+
+    while priority_queue and remaining:
+        current_distance, current_node = heapq.heappop(priority_queue)
+        if current_distance > distances[current_node]:
+            continue
+        if current_distance > max_distance or settled >= SETTLE_LIMIT:
+            break
+        settled += 1
+        remaining.discard(current_node)
+
+        for neighbor_node, (weight, _) in _out_edges[current_node].items():
+            if neighbor_node in excluded:
+                continue
+            distance = current_distance + weight
+            if distance < distances.get(neighbor_node, INFINITY):
+                distances[neighbor_node] = distance
+                heapq.heappush(priority_queue, (distance, neighbor_node))
+
+    return distances
+
+
+def find_shortcuts(node: int, excluded: set) -> List[Tuple[int, int, float, int, int]]:
+    """Shortcuts needed to keep all shortest paths through node once it is removed.
+
+    Returns:
+        List[Tuple]: (u, w, weight, first edge id, second edge id) per shortcut u->w
+    """
+    excluded = excluded | {node}
+    outgoing = list(_out_edges[node].items())
+    shortcuts = []
+
+    for u, (weight_in, edge_in) in _in_edges[node].items():
+        candidates = [
+            (w, weight_in + weight_out, edge_out)
+            for w, (weight_out, edge_out) in outgoing
+            if w != u
+        ]
+        if not candidates:
+            continue
+
+        distances = witness_search(
+            u,
+            {c[0] for c in candidates},
+            max(c[1] for c in candidates),
+            excluded,
+        )
+        for w, weight, edge_out in candidates:
+            if distances.get(w, INFINITY) > weight:
+                shortcuts.append((u, w, weight, edge_in, edge_out))
+
+    return shortcuts
+
+
+def _count_shortcuts(nodes: List[int]) -> List[int]:
+    return [len(find_shortcuts(node, set())) for node in nodes]
+
+
+def _shortcuts_for(nodes: List[int]) -> list:
+    return [find_shortcuts(node, _excluded) for node in nodes]
+
+
+def map_nodes(task, nodes: List[int], workers: int) -> list:
+    """Run a task over chunks of nodes, in forked workers when there is enough work.
+
+    Workers inherit the current contraction state through fork, so nothing but the
+    node lists and results cross process boundaries.
+    """
+    if workers > 1 and len(nodes) >= PARALLEL_THRESHOLD:
+        chunk_size = -(-len(nodes) // (workers * 4))
+        chunks = [nodes[i : i + chunk_size] for i in range(0, len(nodes), chunk_size)]
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            return [result for chunk in pool.map(task, chunks) for result in chunk]
+    return task(nodes)
+
+
+class ContractionHierarchy:
+    """Contraction Hierarchies over a CSRGraph.
+
+    Nodes are contracted one by one in rank order, adding shortcut edges between
+    their neighbors where needed to keep shortest path distances. Queries then only
+    relax edges towards higher ranked nodes, from both ends.
+
+    Edge IDs below the number of CSR edge slots are original slots. Higher IDs are
+    shortcuts, each made of two child edges (first, second) that are unpacked
+    recursively when the route is built.
+    """
+
+    def __init__(
+        self,
+        rank: np.ndarray,
+        up_offsets: np.ndarray,
+        up_targets: np.ndarray,
+        up_weights: np.ndarray,
+        up_edges: np.ndarray,
+        down_offsets: np.ndarray,
+        down_targets: np.ndarray,
+        down_weights: np.ndarray,
+        down_edges: np.ndarray,
+        shortcut_first: np.ndarray,
+        shortcut_second: np.ndarray,
+        n_original_edges: int,
+        fingerprint: str,
+    ):
+        self.rank = rank
+        # Upward edges v->w (rank[w] > rank[v]) indexed by v, for the forward search
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_edges = up_edges
+        # Edges u->v with rank[u] > rank[v] indexed by v, for the backward search
+        self.down_offsets = down_offsets
+        self.down_targets = down_targets
+        self.down_weights = down_weights
+        self.down_edges = down_edges
+
+        self.shortcut_first = shortcut_first
+        self.shortcut_second = shortcut_second
+        self.n_original_edges = n_original_edges
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return (
+            f"ContractionHierarchy(nodes={len(self.rank)}, "
+            f"shortcuts={len(self.shortcut_first)})"
+        )
+
+    @classmethod
+    def build(cls, graph: CSRGraph, workers: int = 1):
+        """Contract all nodes of the graph.
+
+        Each round computes the priority (edge difference plus contracted neighbors)
+        of nodes whose neighborhood changed, then contracts an independent set of
+        nodes whose priority is lower than all their neighbors. Nodes in the set share
+        no edges, so their shortcuts are computed in parallel, with witness searches
+        avoiding the whole set.
+        """
+        global _out_edges, _in_edges, _excluded
+
+        n = graph.n_nodes
+        n_original_edges = graph.n_edges
+        _out_edges = [{} for _ in range(n)]
+        _in_edges = [{} for _ in range(n)]
+
+        # Keep the shortest of any parallel edges and drop self loops
+        for slot, (u, w, weight) in enumerate(
+            zip(graph.sources.tolist(), graph.targets.tolist(), graph.weights.tolist())
+        ):
+            if u != w and weight < _out_edges[u].get(w, (INFINITY,))[0]:
+                _out_edges[u][w] = (weight, slot)
+                _in_edges[w][u] = (weight, slot)
+
+        shortcut_first, shortcut_second = [], []
+        up_edges: List[list] = [[] for _ in range(n)]
+        down_edges: List[list] = [[] for _ in range(n)]
+        contracted_neighbors = [0] * n
+        priorities = [0] * n
+        rank = np.full(n, -1, dtype=np.int64)
+        next_rank = 0
+
+        remaining = set(range(n))
+        dirty = list(range(n))
+
+        while remaining:
+            for node, n_shortcuts in zip(
+                dirty, map_nodes(_count_shortcuts, dirty, workers)
+            ):
+                priorities[node] = (
+                    n_shortcuts
+                    - len(_in_edges[node])
+                    - len(_out_edges[node])
+                    + contracted_neighbors[node]
+                )
+
+            independent = [
+                node
+                for node in remaining
+                if all(
+                    (priorities[node], node) < (priorities[neighbor], neighbor)
+                    for neighbors in (_in_edges[node], _out_edges[node])
+                    for neighbor in neighbors
+                )
+            ]
+
+            _excluded = set(independent)
+            shortcuts = map_nodes(_shortcuts_for, independent, workers)
+
+            neighbors = set()
+            for node, node_shortcuts in zip(independent, shortcuts):
+                rank[node] = next_rank
+                next_rank += 1
+
+                # All remaining neighbors rank higher, so these edges form the search graph
+                for w, (weight, edge) in _out_edges[node].items():
+                    up_edges[node].append((w, weight, edge))
+                    del _in_edges[w][node]
+                    neighbors.add(w)
+                for u, (weight, edge) in _in_edges[node].items():
+                    down_edges[node].append((u, weight, edge))
+                    del _out_edges[u][node]
+                    neighbors.add(u)
+                _out_edges[node], _in_edges[node] = {}, {}
+
+                for u, w, weight, first, second in node_shortcuts:
+                    if weight < _out_edges[u].get(w, (INFINITY,))[0]:
+                        edge = n_original_edges + len(shortcut_first)
+                        shortcut_first.append(first)
+                        shortcut_second.append(second)
+                        _out_edges[u][w] = (weight, edge)
+                        _in_edges[w][u] = (weight, edge)
+
+            remaining.difference_update(independent)
+            for neighbor in neighbors:
+                contracted_neighbors[neighbor] += 1
+            dirty = [node for node in neighbors if node in remaining]
+
+            logging.info(
+                f"Contracted {len(independent)} nodes, {len(remaining)} remaining, "
+                f"{len(shortcut_first)} shortcuts"
+            )
+
+        _out_edges, _in_edges, _excluded = [], [], set()
+
+        up = cls._pack(up_edges)
+        down = cls._pack(down_edges)
+        return cls(
+            rank,
+            *up,
+            *down,
+            np.asarray(shortcut_first, dtype=np.int64),
+            np.asarray(shortcut_second, dtype=np.int64),
+            n_original_edges,
+            graph.fingerprint,
+        )
+
+    @staticmethod
+    def _pack(adjacency: List[list]):
+        """Pack per-node (target, weight, edge id) lists into CSR arrays."""
+        offsets = np.zeros(len(adjacency) + 1, dtype=np.int64)
+        np.cumsum([len(edges) for edges in adjacency], out=offsets[1:])
+        flat = [edge for edges in adjacency for edge in edges]
+        targets = np.asarray([edge[0] for edge in flat], dtype=np.int32)
+        weights = np.asarray([edge[1] for edge in flat], dtype=np.float64)
+        edges = np.asarray([edge[2] for edge in flat], dtype=np.int64)
+        return offsets, targets, weights, edges
+
+    def unpack(self, edges: List[int]) -> List[int]:
+        """Expand hierarchy edge IDs into the original CSR edge slots, in order."""
+        n_original_edges = self.n_original_edges
+        first, second = memoryview(self.shortcut_first), memoryview(
+            self.shortcut_second
+        )
+        slots = []
+        stack = list(reversed(edges))
+        while stack:
+            edge = stack.pop()
+            if edge < n_original_edges:
+                slots.append(edge)
+            else:
+                shortcut = edge - n_original_edges
+                stack.append(second[shortcut])
+                stack.append(first[shortcut])
+        return slots
+
+    def save(self, filename: str):
+        """Write the hierarchy as a binary snapshot, see Snapshot.write_snapshot."""
+        write_snapshot(
+            filename,
+            {name: getattr(self, name) for name in HIERARCHY_ARRAYS},
+            {
+                "kind": "hierarchy",
+                "n_original_edges": self.n_original_edges,
+                "fingerprint": self.fingerprint,
+            },
+        )
+
+    @classmethod
+    def load(cls, filename: str, graph: CSRGraph):
+        """Open a hierarchy, checking that it was built for this graph.
+
+        The arrays are memory-mapped, so worker processes share one copy.
+        """
+        arrays, meta = read_snapshot(filename)
+        if meta.get("kind") != "hierarchy":
+            raise ValueError(f"{filename} does not hold a contraction hierarchy")
+        hierarchy = cls(
+            *(arrays[name] for name in HIERARCHY_ARRAYS),
+            meta["n_original_edges"],
+            meta["fingerprint"],
+        )
+
+        if hierarchy.fingerprint != graph.fingerprint:
+            raise ValueError(
+                f"Hierarchy in {filename} was built for graph {hierarchy.fingerprint}, "
+                f"not {graph.fingerprint}"
+            )
+        return hierarchy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the contraction hierarchy next to the graph file."
+    )
+    parser.add_argument(
+        "--graph", type=str, default="app/data/Graph/graph.json", help="Graph JSON file"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of processes used for witness searches",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    graph = CSRGraph.from_json_file(args.graph)
+    hierarchy = ContractionHierarchy.build(graph, workers=args.workers)
+
+    outfp = os.path.join(os.path.dirname(args.graph), HIERARCHY_FILENAME)
+    hierarchy.save(outfp)
+    logging.info(f"Saved {hierarchy} to {outfp}")
@@ -0,0 +1,83 @@
+import base64
+from math import cos, radians
+from typing import List
+
+import numpy as np
+import shapely
+
+from app.Shared.CSRGraph import CSRGraph
+from app.Shared.SpatialIndex import EARTH_RADIUS_M
+
+GEOMETRY_FORMATS = ("polyline", "packed")
+
+# Google encoded polyline precision, 5 decimals is about 1 m
+POLYLINE_PRECISION = 5
+
+METERS_PER_DEGREE = radians(1) * EARTH_RADIUS_M
+
+
+def route_coordinates(graph: CSRGraph, route: List[int]) -> np.ndarray:
+    """Merge the geometries of a route's edge slots into one (lon, lat) line.
+
+    Consecutive edges share their joining node, which is only kept once.
+    """
+    if not route:
+        return np.empty((0, 2))
+
+    parts = [graph.edge_coordinates(route[0])]
+    for slot in route[1:]:
+        parts.append(graph.edge_coordinates(slot)[1:])
+    return np.concatenate(parts)
+
+
+def simplify(coordinates: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker simplification with a tolerance in meters.
+
+    Coordinates are scaled to local meters (equirectangular around the first point)
+    so the tolerance means the same in both directions.
+    """
+    if tolerance <= 0 or len(coordinates) < 3:
+        return coordinates
+
+    scale = np.array(
+        [METERS_PER_DEGREE * cos(radians(coordinates[0, 1])), METERS_PER_DEGREE]
+    )
+    line = shapely.simplify(
+        shapely.linestrings(coordinates * scale), tolerance, preserve_topology=False
+    )
+    return shapely.get_coordinates(line) / scale
+
+
+def encode_polyline(
+    coordinates: np.ndarray, precision: int = POLYLINE_PRECISION
+) -> str:
+    """Encode (lon, lat) coordinates in Google's encoded polyline format.
+
+    The format stores (lat, lon) deltas between consecutive points as zigzag encoded
+    integers in chunks of five bits.
+    """
+    values = np.round(coordinates[:, ::-1] * 10**precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    deltas = deltas.ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chunks = bytearray()
+    for value in zigzag.tolist():
+        while value >= 0x20:
+            chunks.append((0x20 | (value & 0x1F)) + 63)
+            value >>= 5
+        chunks.append(value + 63)
+    return chunks.decode("ascii")
+
+
+def encode_packed(coordinates: np.ndarray) -> str:
+    """Base64 of the coordinates as little-endian float32 lon, lat pairs."""
+    return base64.b64encode(coordinates.astype("<f4").tobytes()).decode("ascii")
+
+
+def encode_geometry(coordinates: np.ndarray, format: str) -> str:
+    if format == "polyline":
+        return encode_polyline(coordinates)
+    if format == "packed":
+        return encode_packed(coordinates)
+    raise ValueError(f"Unknown geometry format {format}, expected {GEOMETRY_FORMATS}")
@@ -1,10 +1,66 @@
+import copy
 import json
+from array import array
+from itertools import chain
 from math import atan2, cos, radians, sin, sqrt
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib.collections import LineCollection
 from shapely.geometry import LineString, Point
 
+from app.Shared.SpatialIndex import SpatialIndex
+
+
+def creates_reverse_edge(oneway, onewaybicycle) -> bool:
+    """Check if an edge should also be traversable in the reverse direction.
+
+    Conditions for creating a reverse edge:
+    1. The oneway attribute is not set or is set to "-1"
+    2. The onewaybicycle attribute is set to "no"
+    """
+    if oneway == None or oneway == "-1":
+        return True
+    elif oneway == "yes" and onewaybicycle == "no":
+        return True
+    return False
+
+
+class GeometryStore:
+    """Coordinates of many edges in one flat array of doubles.
+
+    The points of geometry i are values[2 * offsets[i] : 2 * offsets[i + 1]] as
+    lon, lat pairs. This takes a fraction of the memory of one shapely LineString
+    per edge, LineStrings are only built when asked for.
+    """
+
+    def __init__(self):
+        self.values = array("d")
+        self.offsets = array("q", [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, coordinates: List[Tuple[float, float]]) -> int:
+        """Append the (lon, lat) points of a geometry, returning its index."""
+        self.values.extend(chain.from_iterable(coordinates))
+        self.offsets.append(len(self.values) // 2)
+        return len(self.offsets) - 2
+
+    def coordinates(self, index: int, reversed: bool = False) -> np.ndarray:
+        """(n, 2) lon, lat array of a geometry, last point first if reversed."""
+        lo, hi = self.offsets[index], self.offsets[index + 1]
+        points = np.frombuffer(self.values[2 * lo : 2 * hi], dtype=np.float64)
+        points = points.reshape(-1, 2)
+        return points[::-1] if reversed else points
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            len(self.values) * self.values.itemsize
+            + len(self.offsets) * self.offsets.itemsize
+        )
+
 
 class Node:
     def __init__(self, data):
@@ -12,12 +68,12 @@ class Node:
         self.osmid = str(data["properties"]["id"])
         self.lon = data["properties"]["lon"]
         self.lat = data["properties"]["lat"]
-        self.geometry = Point(
-            self.lon,
-            self.lat,
-        )
         self.neighbors: List[Edge] = []
 
+    @property
+    def geometry(self) -> Point:
+        return Point(self.lon, self.lat)
+
     def __repr__(self):
         return f"Node(id={self.id}, lon={self.lon}, lat={self.lat})"
 
@@ -37,18 +93,45 @@ class Node:
 
 
 class Edge:
-    def __init__(self, id, data):
+    def __init__(self, id, data, geometries: Optional[GeometryStore] = None):
+        """
+        Args:
+            geometries (GeometryStore): store to keep the coordinates in, usually
+                the Graph's. A standalone edge gets a store of its own.
+        """
         self.id = str(id)
         self.osmid = str(data["properties"]["id"])
         self.u = str(data["properties"]["u"])
         self.v = str(data["properties"]["v"])
         self.distance = data["properties"]["length"]
-        self.geometry = LineString(data["geometry"]["coordinates"])
         self.oneway = data["properties"]["oneway"]
         self.onewaybicycle = data["properties"]["oneway:bicycle"]
         self.category = data["properties"]["category"]
         self.parentCategory = data["properties"]["parent"]
 
+        self.geometries = geometries if geometries is not None else GeometryStore()
+        self.geometry_index = self.geometries.add(data["geometry"]["coordinates"])
+        # Reverse edges share the forward edge's geometry and read it backwards
+        self.reversed = False
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """(n, 2) lon, lat array from u to v."""
+        return self.geometries.coordinates(self.geometry_index, self.reversed)
+
+    @property
+    def geometry(self) -> LineString:
+        """Shapely line from u to v, built on each access."""
+        return LineString(self.coordinates)
+
+    def reverse(self, id) -> "Edge":
+        """The same edge traversed from v to u, sharing this edge's geometry."""
+        edge = copy.copy(self)
+        edge.id = str(id)
+        edge.u, edge.v = self.v, self.u
+        edge.reversed = not self.reversed
+        return edge
+
     def __repr__(self):
         return f"Edge(id={self.id}, osmid={self.osmid}, u={self.u}, v={self.v}, distance={self.distance})"
 
@@ -87,6 +170,10 @@ class Graph:
     def __init__(self, nodes_data=None, edges_data=None):
         self.nodes = {}
         self.edges = {}
+        # Coordinates of all edges, reverse edges share their forward edge's entry
+        self.geometries = GeometryStore()
+        self.spatial_index = None
+        self._indexed_nodes: List[Node] = []
 
         # Populate on instantiation if data is provided
         if nodes_data and edges_data:
@@ -106,29 +193,17 @@ class Graph:
     def add_node(self, data):
         node = Node(data)
         self.nodes[node.id] = node
+        # Index is rebuilt on the next lookup
+        self.spatial_index = None
 
     def add_edge(self, id, data):
-        edge = Edge(id, data)
+        edge = Edge(id, data, self.geometries)
         self.edges[str(edge.id)] = edge
         self.nodes[edge.u].neighbors.append(edge)
 
-        # Check if we should create a reverse edge. Conditions for creating a reverse edge:
-        # 1. The oneway attribute is not set or is set to "-1"
-        # 2. The onewaybicycle attribute is set to "no"
-        create_reverse = False
-        if edge.oneway == None or edge.oneway == "-1":
-            create_reverse = True
-        elif edge.oneway == "yes" and edge.onewaybicycle == "no":
-            create_reverse = True
-
-        if create_reverse:
-            id = f"{id}_r"
-            reverse_data = data.copy()
-            reverse_data["properties"]["u"], reverse_data["properties"]["v"] = (
-                edge.v,
-                edge.u,
-            )
-            reverse_edge = Edge(id, reverse_data)
+        # Check if we should create a reverse edge
+        if creates_reverse_edge(edge.oneway, edge.onewaybicycle):
+            reverse_edge = edge.reverse(f"{id}_r")
             self.edges[reverse_edge.id] = reverse_edge
             # Add the reverse edge to the start node's neighbors
             self.nodes[reverse_edge.u].neighbors.append(reverse_edge)
@@ -147,6 +222,16 @@ class Graph:
             self.add_edge(id_counter, edge_data)
             id_counter += 1
 
+        self.build_spatial_index()
+
+    def build_spatial_index(self):
+        """Build the spatial index used for nearest-node lookups."""
+        self._indexed_nodes = list(self.nodes.values())
+        self.spatial_index = SpatialIndex(
+            [node.lat for node in self._indexed_nodes],
+            [node.lon for node in self._indexed_nodes],
+        )
+
     def dfs(self, start_node_id, visited=None):
         if visited is None:
             visited = set()
@@ -180,18 +265,24 @@ class Graph:
         return R * c
 
     def find_closest_node(self, lat: float, lon: float) -> Node:
-        return min(
-            self.nodes.values(),
-            key=lambda node: self.haversine_distance((node.lat, node.lon), (lat, lon)),
-        )
+        if self.spatial_index is None:
+            self.build_spatial_index()
+        return self._indexed_nodes[self.spatial_index.nearest(lat, lon)]
+
+    def find_closest_nodes(self, lats: List[float], lons: List[float]) -> List[Node]:
+        """Snap a batch of coordinates to their closest nodes in one call."""
+        if self.spatial_index is None:
+            self.build_spatial_index()
+        _, indices = self.spatial_index.query(lats, lons)
+        return [self._indexed_nodes[i] for i in indices]
 
     def plot_graph(
         self, edge_color="gray", bg_color="black", filepath=None, show=False
     ):
-        edge_linestrings = [edge.geometry for key, edge in self.edges.items()]
-
-        # Extract segments from the LineStrings
-        segments = [list(line.coords) for line in edge_linestrings]
+        # Reverse edges would draw the same line twice
+        segments = [
+            edge.coordinates for edge in self.edges.values() if not edge.reversed
+        ]
         line_collection = LineCollection(
             segments, linewidths=0.2, colors=edge_color, linestyle="solid"
         )
@@ -216,7 +307,10 @@ class Graph:
         return fig, ax  # Return the figure and axes objects
 
     def graph_to_dict(self) -> dict:
-        """Convert the Graph object to a dictionary representation."""
+        """Convert the Graph object to a dictionary representation.
+
+        Reverse edges are left out, loading the dictionary creates them again.
+        """
 
         nodes_data = []
         for node_id, node in self.nodes.items():
@@ -226,6 +320,8 @@ class Graph:
 
         edges_data = []
         for edge_id, edge in self.edges.items():
+            if edge.reversed:
+                continue
             edges_data.append(
                 {
                     "properties": {
@@ -238,7 +334,7 @@ class Graph:
                         "category": edge.category,
                         "parent": edge.parentCategory,
                     },
-                    "geometry": {"coordinates": list(edge.geometry.coords)},
+                    "geometry": {"coordinates": edge.coordinates.tolist()},
                 }
             )
 
@@ -0,0 +1,170 @@
+import argparse
+import logging
+import os
+from typing import List
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.Shared.CSRGraph import CSRGraph
+from app.Shared.Snapshot import read_snapshot, write_snapshot
+
+LANDMARKS_FILENAME = "landmarks.bin"
+
+# scipy drops explicit zeros from sparse matrices, so zero-length edges are given a
+# negligible positive weight instead
+MIN_WEIGHT = 1e-6
+
+
+def to_sparse_matrix(graph: CSRGraph) -> csr_matrix:
+    """Build a scipy adjacency matrix from the CSR arrays.
+
+    Parallel edges would be summed by scipy, so only the shortest edge between each
+    pair of nodes is kept.
+    """
+    order = np.lexsort((graph.weights, graph.targets, graph.sources))
+    sources, targets = graph.sources[order], graph.targets[order]
+    weights = np.maximum(graph.weights[order].astype(np.float64), MIN_WEIGHT)
+
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+
+    return coo_matrix(
+        (weights[keep], (sources[keep], targets[keep])),
+        shape=(graph.n_nodes, graph.n_nodes),
+    ).tocsr()
+
+
+class Landmarks:
+    """Precomputed landmark distance tables for ALT (A*, Landmarks, Triangle
+    inequality) queries.
+
+    For a landmark L, the triangle inequality gives two lower bounds on the distance
+    from v to t: d(L, t) - d(L, v) and d(v, L) - d(t, L). Both are stored per node as
+    one row [d(L, v) for L] + [-d(v, L) for L], so the bound for a node is the
+    largest entry of table[t] - table[v].
+    """
+
+    def __init__(self, landmarks: np.ndarray, table: np.ndarray, fingerprint: str):
+        self.landmarks = landmarks
+        self.table = table
+        self.fingerprint = fingerprint
+        # Largest error of a bound from float32 rounding, in meters: the two entries
+        # and their difference are each off by at most half a ulp of twice the
+        # largest entry
+        finite = np.abs(table[np.isfinite(table)])
+        self.rounding_error = 2 * float(np.spacing(finite.max())) if len(finite) else 0
+
+    def __repr__(self):
+        return f"Landmarks(landmarks={len(self.landmarks)}, nodes={len(self.table)})"
+
+    @classmethod
+    def compute(cls, graph: CSRGraph, n_landmarks: int = 16, seed: int = 0):
+        """Pick landmarks by farthest-point selection and compute their tables.
+
+        Starting from a random node, each new landmark is the reachable node farthest
+        from all landmarks picked so far, which spreads them along the edges of the
+        network where the bounds are tightest.
+        """
+        matrix = to_sparse_matrix(graph)
+        rng = np.random.default_rng(seed)
+
+        # The first landmark is the node farthest from a random start node
+        closest = dijkstra(matrix, indices=int(rng.integers(graph.n_nodes)))
+        landmarks: List[int] = []
+        forward = []
+
+        for _ in range(min(n_landmarks, graph.n_nodes)):
+            score = np.where(np.isfinite(closest), closest, -1)
+            score[landmarks] = -1
+            landmark = int(np.argmax(score))
+            landmarks.append(landmark)
+            logging.info(f"Landmark {len(landmarks)}/{n_landmarks}: node {landmark}")
+
+            distances = dijkstra(matrix, indices=landmark)
+            forward.append(distances)
+            closest = distances if len(landmarks) == 1 else np.fmin(closest, distances)
+
+        forward = np.vstack(forward)
+        backward = dijkstra(matrix.T.tocsr(), indices=landmarks)
+
+        table = np.hstack((forward.T, -backward.T)).astype(np.float32)
+        return cls(np.asarray(landmarks, dtype=np.int32), table, graph.fingerprint)
+
+    def save(self, filename: str):
+        """Write the tables as a binary snapshot, see Snapshot.write_snapshot."""
+        write_snapshot(
+            filename,
+            {"landmarks": self.landmarks, "table": self.table},
+            {"kind": "landmarks", "fingerprint": self.fingerprint},
+        )
+
+    @classmethod
+    def load(cls, filename: str, graph: CSRGraph):
+        """Open landmark tables, checking that they were built for this graph.
+
+        The tables are memory-mapped, so worker processes share one copy.
+        """
+        arrays, meta = read_snapshot(filename)
+        if meta.get("kind") != "landmarks":
+            raise ValueError(f"{filename} does not hold landmark tables")
+        landmarks = cls(arrays["landmarks"], arrays["table"], meta["fingerprint"])
+
+        if landmarks.fingerprint != graph.fingerprint:
+            raise ValueError(
+                f"Landmarks in {filename} were built for graph {landmarks.fingerprint}, "
+                f"not {graph.fingerprint}"
+            )
+        return landmarks
+
+    def heuristic(self, target: int, slack: float = 1.0):
+        """Lower bound on the remaining distance to target, in meters.
+
+        Unreachable landmarks are stored as infinite distances. Terms where both
+        distances are infinite come out as NaN and are ignored by fmax. The table is
+        float32, so bounds are lowered by its rounding error and scaled by slack to
+        stay below the lengths of the paths they bound.
+
+        Args:
+            slack (float): factor below 1 scaling the bounds, see HEURISTIC_SLACK
+        """
+        table = self.table
+        target_row = table[target]
+        margin = self.rounding_error
+        bounds = {}
+
+        def heuristic(node: int) -> float:
+            bound = bounds.get(node)
+            if bound is None:
+                with np.errstate(invalid="ignore"):
+                    differences = target_row - table[node]
+                bound = float(np.fmax.reduce(differences, initial=0.0))
+                bound = max(slack * (bound - margin), 0.0)
+                bounds[node] = bound
+            return bound
+
+        return heuristic
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompute ALT landmark tables next to the graph file."
+    )
+    parser.add_argument(
+        "--graph", type=str, default="app/data/Graph/graph.json", help="Graph JSON file"
+    )
+    parser.add_argument(
+        "--landmarks", type=int, default=16, help="Number of landmarks to pick"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    graph = CSRGraph.from_json_file(args.graph)
+    landmarks = Landmarks.compute(graph, n_landmarks=args.landmarks, seed=args.seed)
+
+    outfp = os.path.join(os.path.dirname(args.graph), LANDMARKS_FILENAME)
+    landmarks.save(outfp)
+    logging.info(f"Saved {landmarks} to {outfp}")
@@ -1,64 +1,666 @@
-from typing import Union, List
+from math import asin, cos, radians, sin, sqrt
+from typing import Dict, Union, List
 from app.Shared.Graph import Graph, Edge, Node
-from typing import Union
+from app.Shared.CSRGraph import CSRGraph
+from app.Shared.ContractionHierarchy import ContractionHierarchy
+from app.Shared.Landmarks import Landmarks, to_sparse_matrix
+from app.Shared.Profiles import DEFAULT_PROFILE, PROFILES, compile_profiles
+from app.Shared.RouteCache import RouteCache
+from app.Shared.SpatialIndex import EARTH_RADIUS_M
 
 from matplotlib.collections import LineCollection
+from scipy.sparse.csgraph import dijkstra
 
 import matplotlib.pyplot as plt
+import numpy as np
 import heapq
 
+SEARCH_MODES = ("dijkstra", "bidirectional", "astar", "alt", "ch")
+
+INFINITY = float("infinity")
+
+# Origins per scipy Dijkstra call in distance_matrix, bounds the n_nodes-wide rows
+# held in memory at once
+MATRIX_CHUNK_SIZE = 64
+
+# Edge lengths are stored as float32, so the haversine bound is shrunk slightly to
+# stay a true lower bound after rounding
+HEURISTIC_SLACK = 0.999
+
+
+class SearchStats:
+    """Work counters of searches, added to by the search methods when passed in."""
+
+    __slots__ = ("settled", "relaxed", "pushes")
+
+    def __init__(self):
+        self.settled = 0
+        self.relaxed = 0
+        self.pushes = 0
+
+    def __repr__(self):
+        return (
+            f"SearchStats(settled={self.settled}, relaxed={self.relaxed}, "
+            f"pushes={self.pushes})"
+        )
+
+    def add(self, settled: int, relaxed: int, pushes: int):
+        self.settled += settled
+        self.relaxed += relaxed
+        self.pushes += pushes
+
 
 class Pathfinder:
-    def __init__(self, graph: Graph, priority: Union[dict, None] = None):
+    def __init__(
+        self,
+        graph: Union[Graph, CSRGraph],
+        profiles: Union[Dict[str, dict], None] = None,
+        landmarks: Union[Landmarks, None] = None,
+        hierarchy: Union[ContractionHierarchy, None] = None,
+        cache: Union[RouteCache, None] = None,
+        version: Union[str, None] = None,
+    ):
         self.graph = graph
-        self.priority = priority
+        # Searches run over the compact CSR arrays, an object Graph is compiled once
+        self.csr = graph if isinstance(graph, CSRGraph) else CSRGraph.from_graph(graph)
+        # Graph version routes are cached under, the GraphStore passes one covering
+        # the preprocessing files as well
+        self.version = version or self.csr.fingerprint
+        # Per-edge cost arrays of each routing profile, compiled on first use
+        self.profiles = compile_profiles(self.csr, profiles or PROFILES)
+        if DEFAULT_PROFILE not in self.profiles:
+            raise ValueError(f"Profiles must include {DEFAULT_PROFILE}")
+        # Precomputed tables for the "alt" search mode, see Landmarks.compute
+        self.landmarks = landmarks
+        # Precomputed shortcuts and node ranks for the "ch" search mode
+        self.hierarchy = hierarchy
+        # Results are shared between search modes, they all return the same routes
+        self.cache = cache
+        # scipy adjacency matrix for one-to-all searches, built on first use
+        self._sparse_matrix = None
         self.__quote = "Who's ready to fly on a zipline? ..I am!"
 
-    def shortest_path_dijkstra(self, start_node: Node, end_node: Node):
-        # Initialize shortest distances dict with infinite distances for all nodes
-        shortest_distances = {
-            node: float("infinity") for node in self.graph.nodes.values()
-        }
-        shortest_distances[start_node] = 0
+    def prepare(self):
+        """Build what queries would otherwise build on first use: the spatial index
+        for snapping and, without a hierarchy, the scipy matrix of distance_matrix."""
+        self.csr.spatial_index
+        if self.hierarchy is None and self._sparse_matrix is None:
+            self._sparse_matrix = to_sparse_matrix(self.csr)
+
+    def shortest_path(
+        self,
+        start: int,
+        end: int,
+        mode: str = "dijkstra",
+        profile: str = DEFAULT_PROFILE,
+    ) -> Union[List[int], None]:
+        """Shortest path between two nodes of self.csr.
+
+        Args:
+            start (int): index of the start node in self.csr
+            end (int): index of the end node in self.csr
+            mode (str): search algorithm, one of SEARCH_MODES
+            profile (str): routing profile whose edge costs are minimized
+
+        Returns:
+            List[int] | None: edge slots of the shortest path, in travel order, [] if
+                start == end, None if end cannot be reached from start
+        """
+        route = self.cached_path(start, end, mode, profile)
+        if route is None:
+            route = self.search(start, end, mode, profile)
+            self.cache_path(start, end, profile, route)
+        return route
+
+    def check_query(self, mode: str, profile: str):
+        """Raise ValueError if a search mode or profile cannot be used."""
+        if mode not in SEARCH_MODES:
+            raise ValueError(
+                f"Unknown search mode {mode}, expected one of {SEARCH_MODES}"
+            )
+
+        if profile not in self.profiles:
+            raise ValueError(
+                f"Unknown profile {profile}, expected one of {tuple(self.profiles)}"
+            )
+        # Landmark tables and shortcuts are computed from plain lengths
+        if mode in ("alt", "ch") and profile != DEFAULT_PROFILE:
+            raise ValueError(
+                f"The {mode} search mode only supports the {DEFAULT_PROFILE} profile"
+            )
+
+        if mode == "ch" and self.hierarchy is None:
+            raise ValueError("The ch search mode requires a contraction hierarchy")
+        if mode == "alt" and self.landmarks is None:
+            raise ValueError("The alt search mode requires precomputed landmarks")
+
+    def cached_path(
+        self, start: int, end: int, mode: str, profile: str = DEFAULT_PROFILE
+    ) -> Union[List[int], None]:
+        """Check the query and return its route if no search is needed.
+
+        Returns:
+            List[int] | None: the cached route, [] if start == end, None if the route
+                has to be searched (and stored with cache_path)
+        """
+        self.check_query(mode, profile)
+
+        if start == end:
+            return []
+        if self.cache is None:
+            return None
+        return self.cache.get(start, end, profile, self.version)
+
+    def cache_path(
+        self, start: int, end: int, profile: str, route: Union[List[int], None]
+    ):
+        # A None route is no path, which a cache miss could not be told apart from
+        if self.cache is not None and route is not None:
+            self.cache.set(start, end, profile, self.version, route)
+
+    def search(
+        self,
+        start: int,
+        end: int,
+        mode: str,
+        profile: str = DEFAULT_PROFILE,
+        stats: Union[SearchStats, None] = None,
+    ) -> Union[List[int], None]:
+        """Run the search algorithm of the given mode, bypassing the cache.
+
+        Args:
+            stats (SearchStats): optional, receives the work done by the search
+
+        Returns:
+            List[int] | None: edge slots of the path, None if there is no path
+        """
+        if start == end:
+            return []
 
-        # Keep track of the previous node (as Node object) for path reconstruction
-        previous_nodes = {node: None for node in self.graph.nodes.values()}
+        if mode == "bidirectional":
+            return self.search_bidirectional(start, end, profile, stats)
 
-        # Using a priority queue to determine the next node to explore
-        priority_queue = [(0, start_node)]
+        if mode == "ch":
+            return self.search_ch(start, end, stats)
+
+        if mode == "alt":
+            heuristic = self.landmarks.heuristic(end, HEURISTIC_SLACK)
+        elif mode == "astar":
+            heuristic = self.haversine_heuristic(end)
+        else:
+            heuristic = None
+
+        previous_edges = self.search_astar(start, end, heuristic, profile, stats)
+        return self.reconstruct_path(previous_edges, start, end)
+
+    def haversine_heuristic(self, target: int):
+        """Lower bound on the remaining distance to target, in meters."""
+        lat2, lon2 = radians(self.csr.lats[target]), radians(self.csr.lons[target])
+        cos_lat2 = cos(lat2)
+        lats, lons = self.csr.lats, self.csr.lons
+        scale = 2 * EARTH_RADIUS_M * HEURISTIC_SLACK
+
+        def heuristic(node: int) -> float:
+            lat1, lon1 = radians(lats[node]), radians(lons[node])
+            a = (
+                sin((lat2 - lat1) / 2) ** 2
+                + cos(lat1) * cos_lat2 * sin((lon2 - lon1) / 2) ** 2
+            )
+            return scale * asin(min(1.0, sqrt(a)))
+
+        return heuristic
+
+    def search_astar(
+        self,
+        start: int,
+        end: int,
+        heuristic=None,
+        profile: str = DEFAULT_PROFILE,
+        stats: Union[SearchStats, None] = None,
+    ) -> dict:
+        """A* from start, stopping once end is settled.
+
+        Without a heuristic this is plain Dijkstra with an early exit. State is kept
+        in dicts so only the nodes actually reached are touched.
+
+        Returns:
+            dict: predecessor edge slot for every reached node
+        """
+        offsets, targets = self.csr.offsets, self.csr.targets
+        weights = self.profiles[profile].weights
+
+        shortest_distances = {start: 0}
+        previous_edges = {}
+        priority_queue = [(heuristic(start) if heuristic else 0, 0, start)]
+        settled = relaxed = pushes = 0
 
         while priority_queue:
-            current_distance, current_node = heapq.heappop(priority_queue)
+            _, current_distance, current_node = heapq.heappop(priority_queue)
+
+            if current_node == end:
+                break
 
             # If the popped node's distance is not updated in the priority queue, skip
             if current_distance > shortest_distances[current_node]:
                 continue
+            settled += 1
+
+            lo, hi = int(offsets[current_node]), int(offsets[current_node + 1])
+            relaxed += hi - lo
+            for slot, neighbor_node, weight in zip(
+                range(lo, hi), targets[lo:hi].tolist(), weights[lo:hi].tolist()
+            ):
+                distance = current_distance + weight
+
+                if distance < shortest_distances.get(neighbor_node, INFINITY):
+                    shortest_distances[neighbor_node] = distance
+                    previous_edges[neighbor_node] = slot
+                    priority = (
+                        distance + heuristic(neighbor_node) if heuristic else distance
+                    )
+                    heapq.heappush(priority_queue, (priority, distance, neighbor_node))
+                    pushes += 1
+
+        if stats is not None:
+            stats.add(settled, relaxed, pushes)
+        return previous_edges
+
+    def search_bidirectional(
+        self,
+        start: int,
+        end: int,
+        profile: str = DEFAULT_PROFILE,
+        stats: Union[SearchStats, None] = None,
+    ) -> Union[List[int], None]:
+        """Bidirectional Dijkstra, alternating a forward search from start and a
+        backward search from end over incoming edges.
+
+        The searches stop once the smallest keys of both queues add up to at least
+        the best path length found where they meet.
+        """
+        csr = self.csr
+        offsets, targets = csr.offsets, csr.targets
+        reverse_offsets, reverse_slots = csr.reverse_offsets, csr.reverse_slots
+        reverse_sources = csr.reverse_sources
+        weights = self.profiles[profile].weights
+        reverse_weights = self.profiles[profile].reverse_weights
+
+        distances = ({start: 0}, {end: 0})
+        # Predecessor edge slots for the forward search, successor slots for the backward
+        chosen_edges = ({}, {})
+        queues = ([(0, start)], [(0, end)])
+
+        best_distance = INFINITY
+        meeting_node = None
+        settled = relaxed = pushes = 0
+
+        while queues[0] and queues[1]:
+            if queues[0][0][0] + queues[1][0][0] >= best_distance:
+                break
+
+            # Expand the side with the smaller frontier key
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            current_distance, current_node = heapq.heappop(queues[side])
+            if current_distance > distances[side][current_node]:
+                continue
+            settled += 1
+
+            if side == 0:
+                lo, hi = int(offsets[current_node]), int(offsets[current_node + 1])
+                slots = range(lo, hi)
+                neighbors = targets[lo:hi].tolist()
+                edge_weights = weights[lo:hi].tolist()
+            else:
+                lo = int(reverse_offsets[current_node])
+                hi = int(reverse_offsets[current_node + 1])
+                slots = reverse_slots[lo:hi].tolist()
+                neighbors = reverse_sources[lo:hi].tolist()
+                edge_weights = reverse_weights[lo:hi].tolist()
+
+            relaxed += hi - lo
+            own, other = distances[side], distances[1 - side]
+            for slot, neighbor_node, weight in zip(slots, neighbors, edge_weights):
+                distance = current_distance + weight
+                if distance < own.get(neighbor_node, INFINITY):
+                    own[neighbor_node] = distance
+                    chosen_edges[side][neighbor_node] = slot
+                    heapq.heappush(queues[side], (distance, neighbor_node))
+                    pushes += 1
+
+                    if neighbor_node in other:
+                        total = distance + other[neighbor_node]
+                        if total < best_distance:
+                            best_distance = total
+                            meeting_node = neighbor_node
+
+        if stats is not None:
+            stats.add(settled, relaxed, pushes)
+        if meeting_node is None:
+            return None
+
+        path = self.reconstruct_path(chosen_edges[0], start, meeting_node)
+        node = meeting_node
+        while node != end:
+            slot = chosen_edges[1][node]
+            path.append(slot)
+            node = int(targets[slot])
+        return path
+
+    def search_ch(
+        self, start: int, end: int, stats: Union[SearchStats, None] = None
+    ) -> Union[List[int], None]:
+        """Bidirectional upward search in the contraction hierarchy.
+
+        The forward search from start and the backward search from end only move to
+        higher ranked nodes. Each side stops once its smallest key reaches the best
+        meeting distance, and the shortcuts on the resulting path are unpacked into
+        CSR edge slots.
+        """
+        hierarchy = self.hierarchy
+        # memoryviews index and slice much faster than NumPy arrays from Python
+        graphs = tuple(
+            tuple(memoryview(array) for array in arrays)
+            for arrays in (
+                (
+                    hierarchy.up_offsets,
+                    hierarchy.up_targets,
+                    hierarchy.up_weights,
+                    hierarchy.up_edges,
+                ),
+                (
+                    hierarchy.down_offsets,
+                    hierarchy.down_targets,
+                    hierarchy.down_weights,
+                    hierarchy.down_edges,
+                ),
+            )
+        )
+
+        distances = ({start: 0}, {end: 0})
+        # (hierarchy edge, previous node) per reached node on each side
+        chosen_edges = ({}, {})
+        queues = ([(0, start)], [(0, end)])
+
+        best_distance = INFINITY
+        meeting_node = None
+        settled = relaxed = pushes = 0
+
+        while queues[0] or queues[1]:
+            # Expand the side with the smaller key, a side is done once its smallest
+            # key reaches the best distance found
+            forward_key = queues[0][0][0] if queues[0] else INFINITY
+            backward_key = queues[1][0][0] if queues[1] else INFINITY
+            if min(forward_key, backward_key) >= best_distance:
+                break
+            side = 0 if forward_key <= backward_key else 1
+
+            current_distance, current_node = heapq.heappop(queues[side])
+            own, other = distances[side], distances[1 - side]
+            if current_distance > own[current_node]:
+                continue
+
+            if current_node in other:
+                total = current_distance + other[current_node]
+                if total < best_distance:
+                    best_distance = total
+                    meeting_node = current_node
+
+            # Stall-on-demand: if a higher ranked node already reached by this search
+            # gives a shorter way here, this node is not on a shortest upward path
+            offsets, targets, weights, _ = graphs[1 - side]
+            lo, hi = offsets[current_node], offsets[current_node + 1]
+            stalled = False
+            for neighbor_node, weight in zip(targets[lo:hi], weights[lo:hi]):
+                if own.get(neighbor_node, INFINITY) + weight < current_distance:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+            settled += 1
+
+            offsets, targets, weights, edges = graphs[side]
+            lo, hi = offsets[current_node], offsets[current_node + 1]
+            relaxed += hi - lo
+            for neighbor_node, weight, edge in zip(
+                targets[lo:hi], weights[lo:hi], edges[lo:hi]
+            ):
+                distance = current_distance + weight
+                if distance < own.get(neighbor_node, INFINITY):
+                    own[neighbor_node] = distance
+                    chosen_edges[side][neighbor_node] = (edge, current_node)
+                    heapq.heappush(queues[side], (distance, neighbor_node))
+                    pushes += 1
+
+        if stats is not None:
+            stats.add(settled, relaxed, pushes)
+        if meeting_node is None:
+            return None
+
+        edges = []
+        node = meeting_node
+        while node != start:
+            edge, node = chosen_edges[0][node]
+            edges.append(edge)
+        edges.reverse()
 
-            for edge in current_node.neighbors:
-                neighbor_node = self.graph.nodes[edge.v]
-                # Calculate the distance via current_node
-                distance = current_distance + edge.distance
+        node = meeting_node
+        while node != end:
+            edge, node = chosen_edges[1][node]
+            edges.append(edge)
 
-                # If this path is shorter than previously known path to the neighbor, update
-                if distance < shortest_distances[neighbor_node]:
+        return hierarchy.unpack(edges)
+
+    def search_bounded(
+        self,
+        start: int,
+        max_distance: float,
+        stats: Union[SearchStats, None] = None,
+    ) -> dict:
+        """Dijkstra from start that never expands past max_distance.
+
+        Returns:
+            dict: distance of every node within max_distance of start
+        """
+        offsets, targets, weights = self.csr.offsets, self.csr.targets, self.csr.weights
+
+        shortest_distances = {start: 0}
+        priority_queue = [(0, start)]
+        settled = relaxed = pushes = 0
+
+        while priority_queue:
+            current_distance, current_node = heapq.heappop(priority_queue)
+            if current_distance > shortest_distances[current_node]:
+                continue
+            settled += 1
+
+            lo, hi = int(offsets[current_node]), int(offsets[current_node + 1])
+            relaxed += hi - lo
+            for neighbor_node, weight in zip(
+                targets[lo:hi].tolist(), weights[lo:hi].tolist()
+            ):
+                distance = current_distance + weight
+                if distance <= max_distance and distance < shortest_distances.get(
+                    neighbor_node, INFINITY
+                ):
                     shortest_distances[neighbor_node] = distance
-                    previous_nodes[neighbor_node] = current_node
                     heapq.heappush(priority_queue, (distance, neighbor_node))
+                    pushes += 1
 
-        # Reconstruct the shortest path
-        path = []
-        while end_node:
-            if previous_nodes[end_node]:
-                # Find edge from previous_node to end_node
-                previous = previous_nodes[end_node]
-                # Use list comprehension to get the edge connecting previous_node and end_node
-                edge = next((e for e in previous.neighbors if e.v == end_node.id), None)
-                if edge:
-                    path.insert(0, edge)
-            end_node = previous_nodes[end_node]
+        if stats is not None:
+            stats.add(settled, relaxed, pushes)
+        return shortest_distances
+
+    def reachable_edges(self, distances: dict, max_distance: float) -> List[int]:
+        """Edge slots that can be travelled in full within max_distance.
+
+        Args:
+            distances (dict): node distances from search_bounded
+            max_distance (float): the same distance budget
+        """
+        offsets, targets, weights = self.csr.offsets, self.csr.targets, self.csr.weights
+        slots = []
+        for node, distance in distances.items():
+            lo, hi = int(offsets[node]), int(offsets[node + 1])
+            for slot, weight in zip(range(lo, hi), weights[lo:hi].tolist()):
+                if distance + weight <= max_distance:
+                    slots.append(slot)
+        return slots
+
+    def distance_matrix(
+        self,
+        origins: List[int],
+        destinations: List[int],
+        stats: Union[SearchStats, None] = None,
+    ) -> np.ndarray:
+        """Shortest path lengths from every origin to every destination.
+
+        With a contraction hierarchy this runs one upward search per origin and per
+        destination (bucket-based many-to-many). Otherwise it runs one full Dijkstra
+        per origin in scipy.
+
+        Args:
+            origins (List[int]): node indices in self.csr
+            destinations (List[int]): node indices in self.csr
+
+            stats (SearchStats): optional, receives the work done by the hierarchy
+                searches. scipy does not report its work.
 
+        Returns:
+            np.ndarray: (len(origins), len(destinations)) lengths in meters, inf where
+                a destination cannot be reached
+        """
+        if self.hierarchy is not None:
+            return self.distance_matrix_ch(origins, destinations, stats)
+
+        if self._sparse_matrix is None:
+            self._sparse_matrix = to_sparse_matrix(self.csr)
+
+        destinations = np.asarray(destinations, dtype=np.int64)
+        matrix = np.empty((len(origins), len(destinations)))
+        for lo in range(0, len(origins), MATRIX_CHUNK_SIZE):
+            chunk = origins[lo : lo + MATRIX_CHUNK_SIZE]
+            distances = dijkstra(self._sparse_matrix, indices=chunk)
+            matrix[lo : lo + len(chunk)] = distances.reshape(len(chunk), -1)[
+                :, destinations
+            ]
+        return matrix
+
+    def distance_matrix_ch(
+        self,
+        origins: List[int],
+        destinations: List[int],
+        stats: Union[SearchStats, None] = None,
+    ) -> np.ndarray:
+        """Many-to-many shortest path lengths using the contraction hierarchy.
+
+        A backward upward search from each destination leaves (destination, distance)
+        entries in a bucket at every node it settles. A forward upward search from
+        each origin then combines its distances with the buckets of the nodes it
+        settles, the smallest sum is the shortest path length.
+        """
+        buckets = {}
+        for column, destination in enumerate(destinations):
+            for node, distance in self.upward_search(destination, 1, stats).items():
+                buckets.setdefault(node, []).append((column, distance))
+
+        matrix = np.full((len(origins), len(destinations)), INFINITY)
+        for row, origin in enumerate(origins):
+            lengths = matrix[row].tolist()
+            for node, distance in self.upward_search(origin, 0, stats).items():
+                for column, remaining in buckets.get(node, ()):
+                    if distance + remaining < lengths[column]:
+                        lengths[column] = distance + remaining
+            matrix[row] = lengths
+        return matrix
+
+    def upward_search(
+        self, start: int, side: int, stats: Union[SearchStats, None] = None
+    ) -> dict:
+        """Exhaustive upward search in the contraction hierarchy.
+
+        Args:
+            start (int): node index
+            side (int): 0 for a forward search over up edges, 1 for a backward search
+                over down edges
+
+        Returns:
+            dict: distance of every node settled without being stalled
+        """
+        hierarchy = self.hierarchy
+        arrays = (
+            (hierarchy.up_offsets, hierarchy.up_targets, hierarchy.up_weights),
+            (hierarchy.down_offsets, hierarchy.down_targets, hierarchy.down_weights),
+        )
+        offsets, targets, weights = (memoryview(a) for a in arrays[side])
+        stall_offsets, stall_targets, stall_weights = (
+            memoryview(a) for a in arrays[1 - side]
+        )
+
+        distances = {start: 0}
+        settled = {}
+        priority_queue = [(0, start)]
+        relaxed = pushes = 0
+
+        while priority_queue:
+            current_distance, current_node = heapq.heappop(priority_queue)
+            if current_distance > distances[current_node]:
+                continue
+
+            # Stall-on-demand, see search_ch
+            lo, hi = stall_offsets[current_node], stall_offsets[current_node + 1]
+            stalled = False
+            for neighbor_node, weight in zip(
+                stall_targets[lo:hi], stall_weights[lo:hi]
+            ):
+                if distances.get(neighbor_node, INFINITY) + weight < current_distance:
+                    stalled = True
+                    break
+            if stalled:
+                continue
+            settled[current_node] = current_distance
+
+            lo, hi = offsets[current_node], offsets[current_node + 1]
+            relaxed += hi - lo
+            for neighbor_node, weight in zip(targets[lo:hi], weights[lo:hi]):
+                distance = current_distance + weight
+                if distance < distances.get(neighbor_node, INFINITY):
+                    distances[neighbor_node] = distance
+                    heapq.heappush(priority_queue, (distance, neighbor_node))
+                    pushes += 1
+
+        if stats is not None:
+            stats.add(len(settled), relaxed, pushes)
+        return settled
+
+    def reconstruct_path(
+        self, previous_edges, start: int, end: int
+    ) -> Union[List[int], None]:
+        """Walk predecessor edge slots back from end to start, None if end was not
+        reached."""
+        sources = self.csr.sources
+        path = []
+        node = end
+        while node != start:
+            slot = previous_edges.get(node)
+            if slot is None:
+                return None
+            path.append(slot)
+            node = int(sources[slot])
+        path.reverse()
         return path
 
+    def shortest_path_dijkstra(
+        self, start_node: Node, end_node: Node, mode: str = "dijkstra"
+    ) -> Union[List[Edge], None]:
+        """Shortest path between two Node objects of the object Graph, None if there
+        is no path."""
+        route = self.shortest_path(
+            self.csr.node_index[start_node.id], self.csr.node_index[end_node.id], mode
+        )
+        if route is None:
+            return None
+        return [self.graph.edges[edge_id] for edge_id in self.csr.edge_ids(route)]
+
     def plot_route(
         self,
         route,
@@ -70,7 +672,7 @@ class Pathfinder:
     ):
         fig, ax = self.graph.plot_graph(edge_color=edge_color, bg_color=bg_color)
 
-        overlay_segments = [list(line.geometry.coords) for line in route]
+        overlay_segments = [edge.coordinates for edge in route]
         overlay_collection = LineCollection(
             overlay_segments, linewidths=0.4, colors=overlay_color, linestyle="solid"
         )
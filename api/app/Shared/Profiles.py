@@ -0,0 +1,154 @@
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from app.Shared.CSRGraph import CSRGraph, StringTable
+
+# Plain edge lengths, the only profile the alt and ch search modes support
+DEFAULT_PROFILE = "shortest"
+
+# Cost multipliers on edge length per parent category and per category, an edge costs
+# length * parent multiplier * category multiplier. Missing values count as 1.
+# Multipliers are at least 1 so lengths stay lower bounds for the A* heuristic.
+PROFILES = {
+    "shortest": {},
+    # Footways and sidewalks mean slowing down for pedestrians
+    "fastest": {
+        "category": {
+            "Footpath": 1.3,
+            "Sidewalk": 1.5,
+            "Pedestrian way": 1.5,
+            "Road without bike lane": 1.1,
+        },
+    },
+    # Avoid mixing with motor traffic
+    "safest": {
+        "category": {
+            "Road with bike lane": 1.3,
+            "Road with one-directional cycleway": 1.2,
+            "Sidewalk": 1.4,
+            "Road without bike lane": 3.0,
+        },
+    },
+    "prefer_cycleways": {
+        "parent": {
+            "Footway": 1.5,
+            "Road without bike lane": 2.0,
+        },
+    },
+}
+
+
+def multipliers(table: StringTable, values: Dict[str, float]) -> np.ndarray:
+    """Lookup array from string table code to cost multiplier."""
+    lookup = np.ones(len(table), dtype=np.float32)
+    for code, value in enumerate(table.values):
+        lookup[code] = values.get(value, 1.0)
+    return lookup
+
+
+def check_definition(name: str, definition: dict):
+    """Raise ValueError if a profile definition could make paths cheaper than their
+    length."""
+    values = (
+        *definition.get("parent", {}).values(),
+        *definition.get("category", {}).values(),
+    )
+    if any(value < 1 for value in values):
+        raise ValueError(f"Profile {name} has cost multipliers below 1")
+
+
+class RoutingProfile:
+    """Per-edge cost arrays of a routing profile, aligned with the CSR edge slots.
+
+    A query with any profile relaxes edges exactly like a plain distance query. The
+    costs in reverse order are only derived when a backward search first needs them.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        weights: np.ndarray,
+        reverse_slots: np.ndarray,
+        reverse_weights: Optional[np.ndarray] = None,
+    ):
+        self.name = name
+        self.weights = weights
+        self.reverse_slots = reverse_slots
+        self._reverse_weights = reverse_weights
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RoutingProfile({self.name})"
+
+    @property
+    def reverse_weights(self) -> np.ndarray:
+        """Costs in the order of graph.reverse_slots, for backward searches."""
+        if self._reverse_weights is None:
+            with self.lock:
+                if self._reverse_weights is None:
+                    self._reverse_weights = self.weights[self.reverse_slots]
+        return self._reverse_weights
+
+    @classmethod
+    def compile(cls, graph: CSRGraph, name: str, definition: dict):
+        """Compile a profile definition (see PROFILES) into cost arrays."""
+        check_definition(name, definition)
+        parent_values = definition.get("parent", {})
+        category_values = definition.get("category", {})
+
+        if not parent_values and not category_values:
+            # Share the distance arrays instead of copying them
+            return cls(name, graph.weights, graph.reverse_slots, graph.reverse_weights)
+
+        factors = (
+            multipliers(graph.parents, parent_values)[graph.parent_codes]
+            * multipliers(graph.categories, category_values)[graph.category_codes]
+        )
+        return cls(name, graph.weights * factors, graph.reverse_slots)
+
+
+class CompiledProfiles(Mapping):
+    """Routing profiles of a graph by name, each compiled on first use.
+
+    Plain lengths share the graph's (memory-mapped) arrays, the other profiles
+    allocate their cost arrays in every process that loads the graph. Profiles no
+    request asks for in a process are never allocated there.
+    """
+
+    def __init__(self, graph: CSRGraph, definitions: Dict[str, dict]):
+        for name, definition in definitions.items():
+            check_definition(name, definition)
+        self.graph = graph
+        self.definitions = definitions
+        self.compiled: Dict[str, RoutingProfile] = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> RoutingProfile:
+        profile = self.compiled.get(name)
+        if profile is None:
+            definition = self.definitions[name]
+            with self.lock:
+                profile = self.compiled.get(name)
+                if profile is None:
+                    profile = RoutingProfile.compile(self.graph, name, definition)
+                    self.compiled[name] = profile
+        return profile
+
+    def __contains__(self, name) -> bool:
+        # Checking a name does not compile the profile
+        return name in self.definitions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.definitions)
+
+    def __len__(self) -> int:
+        return len(self.definitions)
+
+
+def compile_profiles(
+    graph: CSRGraph, definitions: Dict[str, dict] = PROFILES
+) -> CompiledProfiles:
+    return CompiledProfiles(graph, definitions)
@@ -0,0 +1,150 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# (start node, end node, routing profile, graph version)
+RouteKey = Tuple[int, int, str, str]
+
+
+class CacheBackend(ABC):
+    """Storage interface for RouteCache.
+
+    Backends only store and evict entries. Keys are RouteKey tuples and values are
+    read-only int32 arrays of edge slots.
+    """
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """The stored value, or None if it is missing or expired."""
+
+    @abstractmethod
+    def set(self, key: Hashable, value: np.ndarray) -> int:
+        """Store a value, returning the number of entries evicted to make room."""
+
+    @abstractmethod
+    def clear(self):
+        """Remove all entries."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of entries stored."""
+
+
+class MemoryBackend(CacheBackend):
+    """Bounded in-process LRU store with an optional time to live per entry."""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None, clock=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock or time.monotonic
+        # key -> (expiry time or None, value), least recently used first
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= self.clock():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: np.ndarray) -> int:
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        evicted = 0
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RouteCache:
+    """Cache of shortest path results in front of Pathfinder.
+
+    Routes are stored as compact edge slot arrays. The cache serves one graph version
+    at a time: invalidate() switches to a new version and clears the backend, after
+    which lookups and results for other versions (requests still running on the old
+    graph) are passed over.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RouteCache(size={len(self.backend)}, hits={self.hits}, misses={self.misses})"
+
+    def invalidate(self, version: str):
+        """Clear the backend and serve the given graph version from now on."""
+        with self.lock:
+            if self.version is not None:
+                self.invalidations += 1
+            self.version = version
+            self.backend.clear()
+
+    def serves(self, version: str) -> bool:
+        if self.version is None:
+            # The first version seen is adopted
+            with self.lock:
+                if self.version is None:
+                    self.version = version
+        return version == self.version
+
+    def get(
+        self, start: int, end: int, profile: str, version: str
+    ) -> Optional[List[int]]:
+        """Cached edge slots of the route, or None on a miss."""
+        route = None
+        if self.serves(version):
+            route = self.backend.get((start, end, profile, version))
+        with self.lock:
+            if route is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return route.tolist()
+
+    def set(self, start: int, end: int, profile: str, version: str, route: List[int]):
+        if not self.serves(version):
+            return
+        value = np.asarray(route, dtype=np.int32)
+        value.setflags(write=False)
+        evicted = self.backend.set((start, end, profile, version), value)
+        if evicted:
+            with self.lock:
+                self.evictions += evicted
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
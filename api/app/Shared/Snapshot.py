@@ -0,0 +1,118 @@
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+MAGIC = b"BIKEGRPH"
+VERSION = 1
+
+# magic, format version, length of the JSON table of contents that follows
+HEADER = struct.Struct("<8sII")
+
+# Arrays start on cache line boundaries so they can be viewed without copying
+ALIGNMENT = 64
+
+
+class PackedStrings:
+    """Read-only sequence of strings stored as one UTF-8 buffer plus offsets.
+
+    Used for OSM node IDs in snapshots, where a Python list would have to be built
+    (and held) separately by every worker process.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, values: List[str]):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.data[lo:hi].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def align(position: int) -> int:
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(filename: str, arrays: Dict[str, np.ndarray], meta: dict):
+    """Write named arrays and JSON metadata to a binary snapshot file.
+
+    Layout: fixed header, JSON table of contents (metadata plus dtype, shape and
+    offset of each array), then the raw array buffers. The data section and every
+    array in it start on an ALIGNMENT boundary, offsets are relative to the start of
+    the data section.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    layout, position = {}, 0
+    for name, array in arrays.items():
+        position = align(position)
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": position,
+        }
+        position += array.nbytes
+
+    toc = json.dumps({"meta": meta, "arrays": layout}).encode("utf-8")
+    data_start = align(HEADER.size + len(toc))
+
+    # Written next to the target and renamed over it, so a running API that maps the
+    # old file keeps a consistent view and never reads a partial snapshot
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(toc)))
+        f.write(toc)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        # Make sure the file covers the last (possibly empty) array
+        f.truncate(data_start + position)
+    os.replace(tmp_filename, filename)
+
+
+def read_snapshot(filename: str) -> Tuple[Dict[str, np.ndarray], dict]:
+    """Memory-map a snapshot file and return zero-copy, read-only array views.
+
+    The pages are shared through the OS page cache, so every process that opens the
+    same snapshot uses one physical copy of the data.
+    """
+    with open(filename, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, toc_length = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{filename} is not a graph snapshot")
+    if version != VERSION:
+        raise ValueError(
+            f"{filename} has snapshot version {version}, expected {VERSION}"
+        )
+
+    toc = json.loads(bytes(buffer[HEADER.size : HEADER.size + toc_length]))
+    data_start = align(HEADER.size + toc_length)
+    arrays = {}
+    for name, entry in toc["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            buffer, dtype=dtype, count=count, offset=data_start + entry["offset"]
+        ).reshape(entry["shape"])
+
+    return arrays, toc["meta"]
@@ -0,0 +1,45 @@
+from typing import Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_M = 6371000
+
+
+def to_unit_vectors(lats, lons) -> np.ndarray:
+    """Project lat/lon (degrees) onto the unit sphere as (x, y, z) rows."""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lats = np.cos(lats)
+    return np.column_stack(
+        (cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats))
+    )
+
+
+class SpatialIndex:
+    """KD-tree over node coordinates for nearest-node snapping.
+
+    Coordinates are indexed as 3D unit vectors. The straight-line (chord) distance
+    between two unit vectors grows monotonically with the great-circle distance, so
+    the nearest neighbour in the tree is also the nearest node by haversine, for any
+    size of region.
+    """
+
+    def __init__(self, lats, lons):
+        self.size = len(lats)
+        self.tree = cKDTree(to_unit_vectors(lats, lons))
+
+    def query(self, lats, lons) -> Tuple[np.ndarray, np.ndarray]:
+        """Snap a batch of coordinates to their nearest indexed points.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: great-circle distances in meters and the
+                indices of the nearest points
+        """
+        chords, indices = self.tree.query(to_unit_vectors(lats, lons))
+        distances = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(chords / 2, 1.0))
+        return distances, indices
+
+    def nearest(self, lat: float, lon: float) -> int:
+        _, indices = self.query([lat], [lon])
+        return int(indices[0])
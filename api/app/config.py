@@ -0,0 +1,34 @@
+import os
+
+# Directory of graph.bin or graph.json and the optional preprocessing files
+GRAPH_DIR = os.environ.get("GRAPH_DIR", os.path.join("app", "data", "Graph"))
+
+# Route cache, see app.Shared.RouteCache
+ROUTE_CACHE_SIZE = int(os.environ.get("ROUTE_CACHE_SIZE", 10000))
+# Seconds, 0 keeps routes until they are evicted or the graph changes
+ROUTE_CACHE_TTL = float(os.environ.get("ROUTE_CACHE_TTL", 0))
+
+# Maximum number of origins and of destinations in one /pathfinding/matrix request
+MATRIX_MAX_LOCATIONS = int(os.environ.get("MATRIX_MAX_LOCATIONS", 500))
+
+# Largest distance budget accepted by /pathfinding/isochrone, in meters
+ISOCHRONE_MAX_METERS = float(os.environ.get("ISOCHRONE_MAX_METERS", 50000))
+
+# Where route computations run, see app.executor: "thread", "process" or "inline"
+ROUTING_BACKEND = os.environ.get("ROUTING_BACKEND", "thread")
+ROUTING_WORKERS = int(os.environ.get("ROUTING_WORKERS", os.cpu_count() or 1))
+# Requests queued or running at once before new ones are rejected with 503
+ROUTING_MAX_PENDING = int(os.environ.get("ROUTING_MAX_PENDING", 64))
+# Seconds before a request fails with 504
+ROUTING_TIMEOUT = float(os.environ.get("ROUTING_TIMEOUT", 30))
+
+# Seconds between checks of the graph files for changes, 0 disables watching
+GRAPH_WATCH_INTERVAL = float(os.environ.get("GRAPH_WATCH_INTERVAL", 0))
+# Required in the X-Admin-Token header of admin endpoints when set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Fraction of route computations run under cProfile, 0 disables profiling
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+# Profiled computations taking at least this many seconds are written to PROFILE_DIR
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 1))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join("app", "data", "profiles"))
@@ -0,0 +1,45 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.endpoints.pathfinding import executor, route_cache, store
+from app.metrics import REGISTRY, render_value
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    """Routing metrics in Prometheus text format
+
+    Request phase timings and search counters are histograms, see app.metrics.
+    Route cache, executor and graph reload figures are read at scrape time.
+    """
+    cache = route_cache.stats()
+    return "".join(
+        [
+            REGISTRY.render(),
+            render_value("routing_cache_entries", "Routes cached", cache["size"]),
+            render_value(
+                "routing_cache_hits", "Route cache hits", cache["hits"], "counter"
+            ),
+            render_value(
+                "routing_cache_misses", "Route cache misses", cache["misses"], "counter"
+            ),
+            render_value(
+                "routing_cache_evictions",
+                "Routes evicted from the cache",
+                cache["evictions"],
+                "counter",
+            ),
+            render_value(
+                "routing_executor_pending",
+                "Route computations queued or running",
+                executor.pending,
+            ),
+            render_value(
+                "routing_graph_reloads",
+                "Graph versions swapped in since startup",
+                store.reloads,
+                "counter",
+            ),
+        ]
+    )
@@ -1,18 +1,144 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, HTTPException, Query, Response
 from typing import Optional
+from app import config
+from app.executor import RoutingExecutor
+from app.graph_store import GraphState, GraphStore
+from app.metrics import Spans, observe_search, sample, sampled_profile
 from app.models import schemas
-from app.Shared.Pathfinder import Pathfinder
-from app.Shared.Graph import Graph
+from app.Shared.Geometry import encode_geometry, route_coordinates, simplify
+from app.Shared.Pathfinder import SearchStats
+from app.Shared.RouteCache import MemoryBackend, RouteCache
+import asyncio
 import logging
+import time
 
-# Instantiate Graph and Pathfinder
-logging.info("Instantiating graph...")
-graph = Graph.from_json_file("app/data/Graph/graph.json")
-logging.info("Graph instantiated.")
+import numpy as np
+import shapely
+from shapely.geometry import Polygon, mapping
+
+route_cache = RouteCache(
+    MemoryBackend(maxsize=config.ROUTE_CACHE_SIZE, ttl=config.ROUTE_CACHE_TTL or None)
+)
 
-pathfinder = Pathfinder(graph)
+# Instantiate Graph and Pathfinder. Requests read store.current once and use that
+# state throughout, reloads swap in a new state without affecting them.
+logging.info("Instantiating graph...")
+store = GraphStore(config.GRAPH_DIR, cache=route_cache)
+store.reload()
 logging.info("Pathfinder instantiated.")
 
+
+# Route computations, run through the executor. With the process backend these are
+# pickled by reference and run against the graph loaded by each worker process, the
+# version argument makes sure workers search the same graph the server snapped on.
+# Each returns (result, SearchStats, spans timed in the worker).
+def preload_worker():
+    """Process pool initializer, importing this module has loaded the graph."""
+    logging.info(f"Routing worker ready with {store.current}.")
+
+
+def search_route(
+    version: str, start: int, end: int, mode: str, profile: str, sampled: bool
+) -> tuple:
+    pathfinder = store.state_for(version).pathfinder
+    stats, spans = SearchStats(), Spans()
+    with sampled_profile("route", sampled), spans.span("search"):
+        route = pathfinder.search(start, end, mode, profile, stats)
+    return route, stats, spans.durations
+
+
+def compute_matrix(
+    version: str, origins: list, destinations: list, sampled: bool
+) -> tuple:
+    pathfinder = store.state_for(version).pathfinder
+    stats, spans = SearchStats(), Spans()
+    with sampled_profile("matrix", sampled), spans.span("search"):
+        matrix = pathfinder.distance_matrix(origins, destinations, stats)
+    return matrix, stats, spans.durations
+
+
+def compute_isochrone(
+    version: str,
+    start_node: int,
+    max_meters: float,
+    hull: bool,
+    hull_ratio: float,
+    sampled: bool,
+) -> tuple:
+    state = store.state_for(version)
+    graph, pathfinder = state.graph, state.pathfinder
+    stats, spans = SearchStats(), Spans()
+
+    with sampled_profile("isochrone", sampled):
+        with spans.span("search"):
+            distances = pathfinder.search_bounded(start_node, max_meters, stats)
+
+        with spans.span("reconstruct"):
+            route = pathfinder.reachable_edges(distances, max_meters)
+            data = {
+                "start": {"nodeId": graph.node_ids[start_node]},
+                "nodes": [
+                    {"nodeId": graph.node_ids[node], "meters": round(distance)}
+                    for node, distance in distances.items()
+                ],
+                "edges": [{"edgeId": edge_id} for edge_id in graph.edge_ids(route)],
+            }
+
+            if hull:
+                points = [graph.edge_coordinates(slot) for slot in route]
+                points.append([[graph.lons[start_node], graph.lats[start_node]]])
+                polygon = shapely.concave_hull(
+                    shapely.multipoints(np.concatenate(points)), ratio=hull_ratio
+                )
+                # Fewer than three distinct points give a point or a line
+                data["hull"] = (
+                    mapping(polygon) if isinstance(polygon, Polygon) else None
+                )
+
+    return data, stats, spans.durations
+
+
+executor = RoutingExecutor(
+    backend=config.ROUTING_BACKEND,
+    workers=config.ROUTING_WORKERS,
+    max_pending=config.ROUTING_MAX_PENDING,
+    timeout=config.ROUTING_TIMEOUT,
+    initializer=preload_worker,
+)
+
+
+async def snap(graph, lats: list, lons: list) -> list:
+    """Indices of the nodes closest to each coordinate. KD-tree queries of large
+    batches take a while, so they run in a thread instead of on the event loop."""
+    nodes = await asyncio.to_thread(graph.find_closest_nodes, lats, lons)
+    return nodes.tolist()
+
+
+async def run(task, state: GraphState, spans: Spans, *args) -> tuple:
+    """Run a route computation for a state on the executor, adding its spans.
+
+    Returns:
+        tuple: the result of the task and its SearchStats
+    """
+    started = time.perf_counter()
+    try:
+        result, stats, durations = await executor.run(
+            task, state.version, *args, sample()
+        )
+    except LookupError as e:
+        # The graph was replaced on disk again before a worker could load it
+        raise HTTPException(status_code=503, detail=str(e))
+    spans.add_remote(durations, time.perf_counter() - started)
+    return result, stats
+
+
+def json_response(model, data: dict, spans: Spans) -> Response:
+    """Validate and serialize a response body, timing it as the "serialize" span."""
+    with spans.span("serialize"):
+        body = model.model_validate(data).model_dump_json()
+    return Response(content=body, media_type="application/json")
+
+
 router = APIRouter(
     prefix="/pathfinding",
     tags=["route", "routing", "pathfinder"],
@@ -20,6 +146,23 @@ router = APIRouter(
 )
 
 
+watch_task = None
+
+
+@router.on_event("startup")
+async def start_watching():
+    global watch_task
+    if config.GRAPH_WATCH_INTERVAL > 0:
+        watch_task = asyncio.create_task(store.watch(config.GRAPH_WATCH_INTERVAL))
+
+
+@router.on_event("shutdown")
+def shutdown_executor():
+    if watch_task is not None:
+        watch_task.cancel()
+    executor.shutdown()
+
+
 @router.get("/")
 async def read_root() -> dict:
     """Test endpoint for checking connection
@@ -30,31 +173,223 @@ async def read_root() -> dict:
     return {"connection": "successfull"}
 
 
+@router.get("/cache")
+async def cache_stats() -> dict:
+    """Route cache counters
+
+    Returns:
+        dict: size, hits, misses, evictions and invalidations
+    """
+    return route_cache.stats()
+
+
+@router.get("/graph")
+async def graph_info() -> dict:
+    """Version and size of the graph currently served
+
+    Returns:
+        dict: graphVersion, nodes, edges, loadedAt (unix time) and reloads
+    """
+    state = store.current
+    return {
+        "graphVersion": state.version,
+        "nodes": state.graph.n_nodes,
+        "edges": state.graph.n_edges,
+        "loadedAt": state.loaded_at,
+        "reloads": store.reloads,
+    }
+
+
+@router.post("/admin/reload")
+async def reload_graph(x_admin_token: Optional[str] = Header(default=None)) -> dict:
+    """Reload the graph files and swap them in without downtime
+
+    Requires the X-Admin-Token header when ADMIN_TOKEN is configured. Requests in
+    flight finish on the previous graph.
+
+    Returns:
+        dict: whether a new version was loaded, and the old and new versions
+    """
+    if config.ADMIN_TOKEN and x_admin_token != config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    previous_version = store.current.version
+    try:
+        reloaded = await asyncio.to_thread(store.reload)
+    except Exception as e:
+        logging.error(f"Graph reload failed, keeping {store.current}: {e}")
+        raise HTTPException(status_code=500, detail=f"Graph reload failed: {e}")
+
+    return {
+        "reloaded": reloaded,
+        "previousVersion": previous_version,
+        "graphVersion": store.current.version,
+    }
+
+
 @router.get("/route/dijkstra", response_model=schemas.DijkstraResponse)
 async def shortest_path_dijkstra(
-    start_lat: float, start_lon: float, end_lat: float, end_lon: float
+    start_lat: float,
+    start_lon: float,
+    end_lat: float,
+    end_lon: float,
+    mode: schemas.SearchMode = "dijkstra",
+    profile: schemas.Profile = "shortest",
+    geometry: Optional[schemas.GeometryFormat] = None,
+    simplify_meters: float = Query(default=0, ge=0),
 ):
-    """_placeholder_
+    """Shortest route between the nodes closest to the start and end coordinates
 
     Args:
-        response_payload (schemas.DijkstraResponse): _description_
+        mode (schemas.SearchMode): search algorithm. "bidirectional", "astar" and
+            "alt" settle far fewer nodes than "dijkstra" on short trips. "alt"
+            needs landmarks.bin and "ch" needs hierarchy.bin next to graph.json.
+        profile (schemas.Profile): routing profile, see app.Shared.Profiles. "alt"
+            and "ch" only support "shortest".
+        geometry (schemas.GeometryFormat): include the route line, encoded as a
+            Google polyline or as packed float32 coordinates
+        simplify_meters (float): Douglas-Peucker tolerance for the route line
     """
 
-    start_node = graph.find_closest_node(start_lat, start_lon)
-    end_node = graph.find_closest_node(end_lat, end_lon)
+    spans = Spans()
+    state = store.current
+    graph, pathfinder = state.graph, state.pathfinder
 
-    route = pathfinder.shortest_path_dijkstra(start_node, end_node)
+    with spans.span("snap"):
+        start_node, end_node = await snap(
+            graph, [start_lat, end_lat], [start_lon, end_lon]
+        )
 
-    # Structure data
-    nodes = [edge.u for edge in route] + [route[-1].v]
-    edges = [edge.id for edge in route]
-    meters = sum([edge.distance for edge in route])
-    road_type = None
+    # Validation and cache lookups are cheap, only searches go to the executor
+    try:
+        route = pathfinder.cached_path(start_node, end_node, mode, profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    data = {
-        "nodes": nodes,
-        "edges": edges,
-        "routeData": {"meters": meters, "roadType": road_type},
-    }
+    if route is None:
+        route, stats = await run(
+            search_route, state, spans, start_node, end_node, mode, profile
+        )
+        observe_search(stats, "route", mode)
+        pathfinder.cache_path(start_node, end_node, profile, route)
+
+    if route is None:
+        raise HTTPException(
+            status_code=404, detail="No route between the start and end points"
+        )
+
+    with spans.span("reconstruct"):
+        # Structure data, translating node indices and edge slots back to IDs
+        node_indices = [start_node] + [int(graph.targets[slot]) for slot in route]
+        nodes = [{"nodeId": graph.node_ids[i]} for i in node_indices]
+        edges = [{"edgeId": edge_id} for edge_id in graph.edge_ids(route)]
+        meters = round(float(graph.weights[route].sum())) if route else 0
+        road_type = None
+
+        data = {
+            "nodes": nodes,
+            "edges": edges,
+            "routeData": {"meters": meters, "roadType": road_type},
+            "graphVersion": state.version,
+        }
+
+        if geometry:
+            coordinates = simplify(route_coordinates(graph, route), simplify_meters)
+            data["geometry"] = {
+                "format": geometry,
+                "points": len(coordinates),
+                "value": encode_geometry(coordinates, geometry),
+            }
+
+    response = json_response(schemas.DijkstraResponse, data, spans)
+    spans.observe("route")
+    return response
+
+
+@router.post("/matrix", response_model=schemas.MatrixResponse)
+async def distance_matrix(request: schemas.MatrixRequest):
+    """Shortest route lengths between every origin and every destination
+
+    All coordinates are snapped to their closest nodes in one batch and the lengths
+    are computed together, instead of one route request per pair.
+    """
+    destinations = request.destinations
+    if destinations is None:
+        destinations = request.origins
+    for name, locations in (
+        ("origins", request.origins),
+        ("destinations", destinations),
+    ):
+        if not 0 < len(locations) <= config.MATRIX_MAX_LOCATIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Expected 1 to {config.MATRIX_MAX_LOCATIONS} {name}",
+            )
+
+    spans = Spans()
+    state = store.current
+    graph = state.graph
+
+    with spans.span("snap"):
+        locations = request.origins + destinations
+        nodes = await snap(
+            graph,
+            [location.lat for location in locations],
+            [location.lon for location in locations],
+        )
+        origin_nodes = nodes[: len(request.origins)]
+        destination_nodes = nodes[len(request.origins) :]
+
+    matrix, stats = await run(
+        compute_matrix, state, spans, origin_nodes, destination_nodes
+    )
+    # distance_matrix only uses the hierarchy when one is loaded
+    mode = "ch" if state.pathfinder.hierarchy is not None else "dijkstra"
+    observe_search(stats, "matrix", mode)
+
+    with spans.span("reconstruct"):
+        meters = np.where(np.isfinite(matrix), np.round(matrix), -1).astype(np.int64)
+        data = {
+            "origins": [{"nodeId": graph.node_ids[i]} for i in origin_nodes],
+            "destinations": [{"nodeId": graph.node_ids[i]} for i in destination_nodes],
+            "meters": [
+                [length if length >= 0 else None for length in row]
+                for row in meters.tolist()
+            ],
+            "graphVersion": state.version,
+        }
+
+    response = json_response(schemas.MatrixResponse, data, spans)
+    spans.observe("matrix")
+    return response
+
+
+@router.get("/isochrone", response_model=schemas.IsochroneResponse)
+async def isochrone(
+    lat: float,
+    lon: float,
+    max_meters: float = Query(gt=0, le=config.ISOCHRONE_MAX_METERS),
+    hull: bool = False,
+    hull_ratio: float = Query(default=0.3, ge=0, le=1),
+):
+    """Nodes and edges reachable within max_meters of the node closest to a coordinate
+
+    Args:
+        hull (bool): also return a concave hull polygon around the reachable edges,
+            null if they do not span an area
+        hull_ratio (float): shapely concave_hull ratio, 1 gives the convex hull
+    """
+    spans = Spans()
+    state = store.current
+    with spans.span("snap"):
+        (start_node,) = await snap(state.graph, [lat], [lon])
+
+    data, stats = await run(
+        compute_isochrone, state, spans, start_node, max_meters, hull, hull_ratio
+    )
+    observe_search(stats, "isochrone", "dijkstra")
+    data["graphVersion"] = state.version
 
-    return data
+    response = json_response(schemas.IsochroneResponse, data, spans)
+    spans.observe("isochrone")
+    return response
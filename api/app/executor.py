@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from fastapi import HTTPException
+
+BACKENDS = ("inline", "thread", "process")
+
+
+class RoutingExecutor:
+    """Runs CPU-bound route computations off the asyncio event loop.
+
+    Backends:
+        inline: run on the event loop, for debugging
+        thread: thread pool in this process, sharing the loaded graph
+        process: process pool. Workers are spawned rather than forked, so they do
+            not inherit the server's sockets and signal handlers. Each worker
+            imports the module of its task and so loads (or memory-maps) its own
+            graph, tasks must be module-level functions pickled by reference.
+
+    At most max_pending tasks are queued or running at once, further requests are
+    rejected with 503 instead of piling up. A task that does not finish within
+    timeout seconds fails the request with 504. A task that already started keeps its
+    worker until it finishes, which still counts towards max_pending.
+    """
+
+    def __init__(
+        self,
+        backend: str = "thread",
+        workers: int = 1,
+        max_pending: int = 64,
+        timeout: float = 30,
+        initializer=None,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+
+        self.backend = backend
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.lock = threading.Lock()
+
+        if backend == "thread":
+            self.pool = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="routing"
+            )
+        elif backend == "process":
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+            )
+        else:
+            self.pool = None
+        logging.info(f"Routing executor: {backend} backend, {workers} workers")
+
+    def release(self, future: Future):
+        with self.lock:
+            self.pending -= 1
+
+    async def run(self, task, *args):
+        """Run task(*args) on the pool and wait for its result."""
+        if self.pool is None:
+            return task(*args)
+
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=503, detail="Too many routing requests in progress"
+                )
+            self.pending += 1
+
+        future = self.pool.submit(partial(task, *args))
+        future.add_done_callback(self.release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # Only takes effect if the task is still waiting for a worker
+            future.cancel()
+            raise HTTPException(status_code=504, detail="Routing request timed out")
+
+    def shutdown(self):
+        if self.pool is not None:
+            # Queued tasks are dropped, running ones finish so workers exit cleanly
+            self.pool.shutdown(wait=True, cancel_futures=True)
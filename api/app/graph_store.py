@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Optional
+
+import numpy as np
+
+from app.Shared.ContractionHierarchy import (
+    HIERARCHY_ARRAYS,
+    HIERARCHY_FILENAME,
+    ContractionHierarchy,
+)
+from app.Shared.CSRGraph import SNAPSHOT_ARRAYS, SNAPSHOT_FILENAME, CSRGraph
+from app.Shared.Landmarks import LANDMARKS_FILENAME, Landmarks
+from app.Shared.Pathfinder import Pathfinder
+from app.Shared.RouteCache import RouteCache
+from app.Shared.Snapshot import PackedStrings
+
+GRAPH_FILENAME = "graph.json"
+
+# Files whose changes trigger a reload when watching
+WATCHED_FILENAMES = (
+    SNAPSHOT_FILENAME,
+    GRAPH_FILENAME,
+    LANDMARKS_FILENAME,
+    HIERARCHY_FILENAME,
+)
+
+
+class GraphState:
+    """One loaded version of the graph with everything derived from it.
+
+    States are never modified after loading. A request reads the current state once
+    and uses it throughout, so it finishes on the version it started with even if
+    a reload swaps in a new state meanwhile.
+    """
+
+    def __init__(self, graph: CSRGraph, pathfinder: Pathfinder):
+        self.graph = graph
+        self.pathfinder = pathfinder
+        self.version = pathfinder.version
+        self.loaded_at = time.time()
+
+    def __repr__(self):
+        return f"GraphState(version={self.version[:12]}, graph={self.graph})"
+
+
+def state_version(
+    graph: CSRGraph,
+    landmarks: Optional[Landmarks],
+    hierarchy: Optional[ContractionHierarchy],
+) -> str:
+    """Digest of everything a state is loaded from.
+
+    Besides the topology and weights in graph.fingerprint this covers coordinates,
+    IDs, categories and the landmark and hierarchy arrays, so a change to any of
+    them is a new version. The files are hashed by content rather than metadata, so
+    every process computes the same version for the same files.
+    """
+    node_ids = graph.node_ids
+    if not isinstance(node_ids, PackedStrings):
+        node_ids = PackedStrings.from_list(node_ids)
+
+    tables = [graph.categories.values, graph.parents.values, graph.oneways.values]
+    arrays = [getattr(graph, name) for name in SNAPSHOT_ARRAYS]
+    arrays += [node_ids.data, node_ids.offsets]
+    if landmarks is not None:
+        tables.append("landmarks")
+        arrays += [landmarks.landmarks, landmarks.table]
+    if hierarchy is not None:
+        tables.append("hierarchy")
+        arrays += [getattr(hierarchy, name) for name in HIERARCHY_ARRAYS]
+
+    digest = hashlib.sha1(json.dumps(tables).encode("utf-8"))
+    for array in arrays:
+        digest.update(array.dtype.str.encode())
+        digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()[:16]
+
+
+def file_signature(graph_dir: str) -> tuple:
+    """(filename, mtime, size) of the watched files that exist."""
+    signature = []
+    for filename in WATCHED_FILENAMES:
+        try:
+            stat = os.stat(os.path.join(graph_dir, filename))
+        except FileNotFoundError:
+            continue
+        signature.append((filename, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class GraphStore:
+    """Holds the current GraphState and replaces it on reload.
+
+    A reload builds and validates a complete new state before swapping a single
+    reference, so readers never see a half loaded graph. Routes cached for the
+    previous version are invalidated on swap.
+    """
+
+    def __init__(self, graph_dir: str, cache: Optional[RouteCache] = None):
+        self.graph_dir = graph_dir
+        self.cache = cache
+        self.current: Optional[GraphState] = None
+        # file_signature of the files the current state was loaded from
+        self.signature = ()
+        # States still referenced by in-flight requests, by version
+        self.states = weakref.WeakValueDictionary()
+        self.reloads = 0
+        self.lock = threading.Lock()
+
+    def load_preprocessed(self, graph: CSRGraph, filename: str, cls):
+        """Load optional preprocessing output (landmarks, hierarchy) stored next to the
+        graph. Missing or stale files only disable the search mode that needs them."""
+        filepath = os.path.join(self.graph_dir, filename)
+        if not os.path.exists(filepath):
+            return None
+        try:
+            data = cls.load(filepath, graph)
+            logging.info(f"Loaded {data}.")
+            return data
+        except ValueError as e:
+            logging.warning(f"Ignoring {filepath}: {e}")
+            return None
+
+    def load_state(self) -> GraphState:
+        """Load and validate the graph files into a new state, without swapping it in.
+
+        The API only needs the compact CSR arrays, so the object Graph (Node/Edge/
+        shapely objects) is never built here. A binary snapshot is memory-mapped when
+        present, which is much faster than parsing graph.json. Indexes built lazily
+        by the graph and pathfinder are built here as well, see Pathfinder.prepare.
+        """
+        snapshot_path = os.path.join(self.graph_dir, SNAPSHOT_FILENAME)
+        if os.path.exists(snapshot_path):
+            graph = CSRGraph.from_snapshot(snapshot_path)
+        else:
+            graph = CSRGraph.from_json_file(
+                os.path.join(self.graph_dir, GRAPH_FILENAME)
+            )
+        graph.validate()
+
+        landmarks = self.load_preprocessed(graph, LANDMARKS_FILENAME, Landmarks)
+        hierarchy = self.load_preprocessed(
+            graph, HIERARCHY_FILENAME, ContractionHierarchy
+        )
+        pathfinder = Pathfinder(
+            graph,
+            landmarks=landmarks,
+            hierarchy=hierarchy,
+            cache=self.cache,
+            version=state_version(graph, landmarks, hierarchy),
+        )
+        # Here rather than in the first requests, which would block the event loop
+        pathfinder.prepare()
+        return GraphState(graph, pathfinder)
+
+    def reload(self) -> bool:
+        """Load the graph files and swap them in if they changed, see state_version.
+
+        Raises on invalid files, leaving the current state in place.
+
+        Returns:
+            bool: whether a new version was swapped in
+        """
+        with self.lock:
+            # Taken before loading, so changes made while loading trigger another reload
+            signature = file_signature(self.graph_dir)
+            state = self.load_state()
+            self.signature = signature
+            if self.current is not None and state.version == self.current.version:
+                # Only file metadata changed, keep the warm state
+                return False
+
+            previous = self.current
+            self.states[state.version] = state
+            self.current = state
+            if self.cache is not None:
+                self.cache.invalidate(state.version)
+            if previous is not None:
+                self.reloads += 1
+            logging.info(f"Loaded {state}, replacing {previous}.")
+            return True
+
+    def state_for(self, version: str) -> GraphState:
+        """The state of a given version, loading it from disk if this process has not
+        seen it yet (process pool workers after a reload in the server).
+
+        Raises:
+            LookupError: the version is neither in use here nor on disk anymore
+        """
+        state = self.states.get(version)
+        if state is None:
+            self.reload()
+            state = self.states.get(version)
+        if state is None:
+            raise LookupError(f"Graph version {version} is no longer available")
+        return state
+
+    async def watch(self, interval: float):
+        """Poll the graph files and reload when they change.
+
+        Files should be replaced atomically (written elsewhere and renamed), a
+        partially written file fails validation and is retried on the next change.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            signature = file_signature(self.graph_dir)
+            if signature == self.signature:
+                continue
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                logging.error(f"Graph reload failed, keeping {self.current}: {e}")
+                # Do not retry until the files change again
+                self.signature = signature
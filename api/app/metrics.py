@@ -0,0 +1,272 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+from app import config
+
+# Histogram upper bounds. Spans go from a cached lookup to a long search.
+SECONDS_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+# Search counters, from a few nodes to a whole city graph
+COUNT_BUCKETS = tuple(4**exponent for exponent in range(1, 12))
+
+
+def format_labels(names: Sequence[str], values: Tuple, **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in pairs
+        )
+        + "}"
+    )
+
+
+class Counter:
+    """Monotonic counter per label combination."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels: dict) -> Tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in values
+        ]
+
+
+class Histogram(Counter):
+    """Cumulative histogram per label combination."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float],
+        labels: Sequence[str] = (),
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            # [count per bucket..., total count, sum]
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += value
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = [(key, list(entry)) for key, entry in self.values.items()]
+
+        lines = []
+        for key, entry in values:
+            bounds = self.buckets + ("+Inf",)
+            for bound, count in zip(bounds, entry[:-1]):
+                labels = format_labels(self.labels, key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {entry[-1]}")
+            lines.append(f"{self.name}_count{labels} {entry[-2]}")
+        return lines
+
+
+class Registry:
+    """The metrics of this process, rendered together for /metrics."""
+
+    def __init__(self):
+        self.metrics: List[Counter] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float],
+        labels: Sequence[str] = (),
+    ) -> Histogram:
+        metric = Histogram(name, help, buckets, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+def render_value(name: str, help: str, value: float, type: str = "gauge") -> str:
+    """A single unlabeled sample read from elsewhere at scrape time."""
+    return f"# HELP {name} {help}\n# TYPE {name} {type}\n{name} {value}\n"
+
+
+REGISTRY = Registry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "routing_span_seconds",
+    "Time spent per request phase: snap, queue, search, reconstruct, serialize "
+    "and total",
+    SECONDS_BUCKETS,
+    labels=("endpoint", "span"),
+)
+SETTLED_NODES = REGISTRY.histogram(
+    "routing_settled_nodes",
+    "Nodes settled per search",
+    COUNT_BUCKETS,
+    labels=("endpoint", "mode"),
+)
+RELAXED_EDGES = REGISTRY.histogram(
+    "routing_relaxed_edges",
+    "Edges relaxed per search",
+    COUNT_BUCKETS,
+    labels=("endpoint", "mode"),
+)
+HEAP_PUSHES = REGISTRY.histogram(
+    "routing_heap_pushes",
+    "Priority queue pushes per search",
+    COUNT_BUCKETS,
+    labels=("endpoint", "mode"),
+)
+
+
+def observe_search(stats, endpoint: str, mode: str):
+    """Record the counters of a Pathfinder.SearchStats. Searches that report no work
+    (cache hits, scipy matrices) are skipped so they do not skew the histograms."""
+    if stats is None or not stats.settled:
+        return
+    SETTLED_NODES.observe(stats.settled, endpoint=endpoint, mode=mode)
+    RELAXED_EDGES.observe(stats.relaxed, endpoint=endpoint, mode=mode)
+    HEAP_PUSHES.observe(stats.pushes, endpoint=endpoint, mode=mode)
+
+
+class Spans:
+    """Durations of the phases of one request, in seconds.
+
+    Phases run in a worker process are timed there and merged in with add_remote(),
+    the remaining executor round trip time is recorded as "queue".
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add_remote(self, durations: Dict[str, float], round_trip: float):
+        for name, seconds in durations.items():
+            self.add(name, seconds)
+        self.add("queue", max(round_trip - sum(durations.values()), 0))
+
+    def observe(self, endpoint: str):
+        """Record all spans and the total time since the request started."""
+        self.durations["total"] = time.perf_counter() - self.started
+        for name, seconds in self.durations.items():
+            SPAN_SECONDS.observe(seconds, endpoint=endpoint, span=name)
+
+
+def sample() -> bool:
+    """Whether to profile a request, at config.PROFILE_SAMPLE_RATE."""
+    rate = config.PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+@contextmanager
+def sampled_profile(endpoint: str, enabled: bool):
+    """Profile the block with cProfile when enabled, and write the profile to
+    config.PROFILE_DIR if it took at least config.SLOW_REQUEST_SECONDS.
+
+    cProfile only sees the calling thread, so this wraps the route computation where
+    it runs (executor thread or worker process). Dumps can be read with pstats or
+    snakeviz.
+    """
+    if not enabled:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    started = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        elapsed = time.perf_counter() - started
+        if elapsed >= config.SLOW_REQUEST_SECONDS:
+            filepath = os.path.join(
+                config.PROFILE_DIR,
+                f"{endpoint}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-"
+                f"{threading.get_ident()}.prof",
+            )
+            try:
+                os.makedirs(config.PROFILE_DIR, exist_ok=True)
+                profile.dump_stats(filepath)
+            except OSError as e:
+                # Profiling must never fail the request
+                logging.warning(f"Could not write profile {filepath}: {e}")
+            else:
+                logging.info(
+                    f"Slow {endpoint} request ({elapsed:.3f} s), wrote {filepath}"
+                )
@@ -1,5 +1,11 @@
 from pydantic import BaseModel
-from typing import List, Literal
+from typing import List, Literal, Optional
+
+SearchMode = Literal["dijkstra", "bidirectional", "astar", "alt", "ch"]
+
+Profile = Literal["shortest", "fastest", "safest", "prefer_cycleways"]
+
+GeometryFormat = Literal["polyline", "packed"]
 
 
 class Node(BaseModel):
@@ -12,10 +18,53 @@ class Edge(BaseModel):
 
 class RouteData(BaseModel):
     meters: int
-    roadType: str
+    roadType: Optional[str] = None
+
+
+class RouteGeometry(BaseModel):
+    # "polyline": Google encoded polyline, precision 5
+    # "packed": base64 little-endian float32 lon, lat pairs
+    format: GeometryFormat
+    points: int
+    value: str
 
 
 class DijkstraResponse(BaseModel):
     nodes: List[Node]
     edges: List[Edge]
     routeData: RouteData
+    geometry: Optional[RouteGeometry] = None
+    graphVersion: Optional[str] = None
+
+
+class Coordinate(BaseModel):
+    lat: float
+    lon: float
+
+
+class MatrixRequest(BaseModel):
+    origins: List[Coordinate]
+    # Defaults to the origins
+    destinations: Optional[List[Coordinate]] = None
+
+
+class MatrixResponse(BaseModel):
+    origins: List[Node]
+    destinations: List[Node]
+    # Rounded meters per origin (rows) and destination (columns), None if unreachable
+    meters: List[List[Optional[int]]]
+    graphVersion: Optional[str] = None
+
+
+class ReachableNode(BaseModel):
+    nodeId: str
+    meters: int
+
+
+class IsochroneResponse(BaseModel):
+    start: Node
+    nodes: List[ReachableNode]
+    edges: List[Edge]
+    # GeoJSON polygon around the reachable edges, if requested and they span an area
+    hull: Optional[dict] = None
+    graphVersion: Optional[str] = None
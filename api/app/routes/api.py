@@ -1,5 +1,6 @@
 from fastapi import APIRouter
-from app.endpoints import pathfinding
+from app.endpoints import metrics, pathfinding
 
 router = APIRouter()
 router.include_router(pathfinding.router)
+router.include_router(metrics.router)
@@ -0,0 +1,64 @@
+import argparse
+import json
+
+# (section, key) of the figures compared, lower is better for all of them
+LOAD_FIGURES = ("min_seconds", "peak_rss_mb")
+LATENCY_FIGURES = ("p50_ms", "p90_ms", "p99_ms")
+
+
+def figures(results: dict) -> dict:
+    """Flatten the comparable figures of a results file to name -> value."""
+    flat = {f"load.{key}": results["load"][key] for key in LOAD_FIGURES}
+    flat.update(
+        {f"snapping.{key}": results["snapping"][key] for key in LATENCY_FIGURES}
+    )
+    for mode in results["parameters"]["modes"]:
+        flat.update(
+            {
+                f"routing.{mode}.{key}": results["routing"][mode][key]
+                for key in LATENCY_FIGURES
+            }
+        )
+    return flat
+
+
+def compare(baseline: dict, candidate: dict) -> list:
+    """Rows of (figure, baseline value, candidate value, candidate / baseline)."""
+    before, after = figures(baseline), figures(candidate)
+    return [
+        (
+            name,
+            before[name],
+            after[name],
+            after[name] / before[name] if before[name] else float("nan"),
+        )
+        for name in before
+        if name in after
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare two results files written by benchmarks.run."
+    )
+    parser.add_argument("baseline", type=str)
+    parser.add_argument("candidate", type=str)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    for key in ("dataset", "parameters"):
+        if baseline[key] != candidate[key]:
+            print(f"Warning: {key} differ, figures may not be comparable")
+    for mode in baseline["parameters"]["modes"]:
+        if baseline["routing"][mode]["meters"] != candidate["routing"].get(
+            mode, {}
+        ).get("meters"):
+            print(f"Warning: {mode} routes differ between the runs")
+
+    print(f"{'':32} {baseline['commit']:>12} {candidate['commit']:>12}")
+    for name, before, after, ratio in compare(baseline, candidate):
+        print(f"{name:32} {before:12.3f} {after:12.3f} {ratio:8.2f}x")
@@ -0,0 +1,277 @@
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.Shared.SpatialIndex import EARTH_RADIUS_M
+
+GRAPHML_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "data", "Oslo, Norway_bike_lanes.graphml"
+)
+
+GRAPHML_NAMESPACE = "{http://graphml.graphdrawing.org/xmlns}"
+
+# (category, parent) of synthetic edges and how often they occur, see categories.json
+GRID_CATEGORIES = (
+    (("Designated cycleway, segregated", "Designated cyclepath"), 0.2),
+    (("Road with bike lane", "Designated cyclepath"), 0.15),
+    (("Footpath", "Footway"), 0.15),
+    (("Sidewalk", "Footway"), 0.1),
+    (("Road without bike lane", "Road without bike lane"), 0.4),
+)
+
+
+def edge_data(
+    osmid: str,
+    u: str,
+    v: str,
+    length: float,
+    coordinates: List[Tuple[float, float]],
+    category: Tuple[str, str],
+    oneway=None,
+) -> dict:
+    """An edge in the graph.json format read by Graph.from_json_file."""
+    return {
+        "properties": {
+            "id": osmid,
+            "u": u,
+            "v": v,
+            "length": length,
+            "oneway": oneway,
+            "oneway:bicycle": None,
+            "category": category[0],
+            "parent": category[1],
+        },
+        "geometry": {"coordinates": coordinates},
+    }
+
+
+def graphml_category(attributes: Dict[str, str]) -> Tuple[str, str]:
+    """Approximate (category, parent) of an OSMnx edge, which lacks the tags the
+    category rules in categories.json need."""
+    highway = attributes.get("highway")
+    if highway == "cycleway":
+        return ("Designated cycleway, segregated", "Designated cyclepath")
+    if highway == "footway":
+        return ("Footpath", "Footway")
+    if attributes.get("lane_type") == '["cycleway"]':
+        return ("Road with bike lane", "Designated cyclepath")
+    return ("Road without bike lane", "Road without bike lane")
+
+
+def parse_linestring(wkt: str) -> List[Tuple[float, float]]:
+    points = wkt[wkt.index("(") + 1 : wkt.rindex(")")].split(",")
+    return [tuple(float(value) for value in point.split()) for point in points]
+
+
+def graphml_to_graph_data(filepath: str = GRAPHML_PATH) -> dict:
+    """Convert an OSMnx GraphML export to the graph.json format.
+
+    OSMnx stores two-way streets as a pair of directed edges, only the first of each
+    pair is kept (the Graph adds reverse edges itself). GraphML nodes have no
+    coordinates, they are taken from the ends of the edge geometries. Edges without a
+    geometry are straight lines.
+    """
+    root = ET.parse(filepath).getroot()
+    keys = {
+        key.get("id"): key.get("attr.name")
+        for key in root.iter(f"{GRAPHML_NAMESPACE}key")
+    }
+
+    edges = []
+    for element in root.iter(f"{GRAPHML_NAMESPACE}edge"):
+        attributes = {keys[data.get("key")]: data.text for data in element}
+        edges.append((element.get("source"), element.get("target"), attributes))
+
+    coordinates = {}
+    for u, v, attributes in edges:
+        if "geometry" in attributes:
+            line = parse_linestring(attributes["geometry"])
+            coordinates.setdefault(u, line[0])
+            coordinates.setdefault(v, line[-1])
+
+    nodes_data = [
+        {"properties": {"id": node_id, "lon": lon, "lat": lat}}
+        for node_id, (lon, lat) in coordinates.items()
+    ]
+
+    edges_data = []
+    two_way = set()
+    for u, v, attributes in edges:
+        if u not in coordinates or v not in coordinates:
+            continue
+        length = float(attributes["length"])
+        oneway = attributes.get("oneway") == "True"
+        if not oneway:
+            pair = (frozenset((u, v)), attributes.get("osmid"), round(length, 1))
+            if pair in two_way:
+                continue
+            two_way.add(pair)
+
+        if "geometry" in attributes:
+            line = parse_linestring(attributes["geometry"])
+        else:
+            line = [coordinates[u], coordinates[v]]
+        edges_data.append(
+            edge_data(
+                attributes.get("osmid"),
+                u,
+                v,
+                length,
+                line,
+                graphml_category(attributes),
+                oneway="yes" if oneway else None,
+            )
+        )
+
+    return {"nodes": nodes_data, "edges": edges_data}
+
+
+def write_graphml_dataset(filepath: str, graphml_path: str = GRAPHML_PATH):
+    with open(filepath, "w") as f:
+        json.dump(graphml_to_graph_data(graphml_path), f)
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def write_grid_dataset(
+    filepath: str,
+    rows: int,
+    cols: int,
+    seed: int = 0,
+    spacing: float = 150,
+    drop_ratio: float = 0.1,
+    oneway_ratio: float = 0.05,
+):
+    """Write a synthetic street grid in the graph.json format.
+
+    Nodes are placed on a rows x cols grid with spacing meters between them, jittered
+    so the spatial index sees irregular data. Each node links to its right and lower
+    neighbors, drop_ratio of those edges are left out to break up the grid and
+    oneway_ratio are one-way. Edge lengths are the straight distance plus up to 30 %
+    detour. The output is written one grid row at a time, so graphs of millions of
+    nodes can be generated in little memory.
+
+    Args:
+        filepath (str): output graph.json
+        seed (int): the same seed and sizes always give the same file
+    """
+    rng = np.random.default_rng(seed)
+    lat0, lon0 = 59.9, 10.7
+    dlat = math.degrees(spacing / EARTH_RADIUS_M)
+    dlon = dlat / math.cos(math.radians(lat0 + dlat * rows / 2))
+
+    names, weights = zip(*GRID_CATEGORIES)
+
+    def node_id(row, col):
+        return str(row * cols + col + 1)
+
+    def grid_row(row):
+        lats = lat0 + (row + rng.uniform(-0.3, 0.3, cols)) * dlat
+        lons = lon0 + (np.arange(cols) + rng.uniform(-0.3, 0.3, cols)) * dlon
+        return lats, lons
+
+    with open(filepath, "w") as f:
+        f.write('{"nodes": [')
+        row_state = rng.bit_generator.state
+        for row in range(rows):
+            lats, lons = grid_row(row)
+            if row:
+                f.write(", ")
+            f.write(
+                ", ".join(
+                    json.dumps(
+                        {
+                            "properties": {
+                                "id": node_id(row, col),
+                                "lon": lon,
+                                "lat": lat,
+                            }
+                        }
+                    )
+                    for col, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist()))
+                )
+            )
+
+        # Replay the same coordinates while writing the edges
+        rng.bit_generator.state = row_state
+        edge_rng = np.random.default_rng(seed + 1)
+        f.write('], "edges": [')
+        first = True
+        current = grid_row(0)
+        for row in range(rows):
+            following = grid_row(row + 1) if row + 1 < rows else None
+            # Edges to the right neighbor, then to the neighbor below
+            candidates = [(row, col, row, col + 1, current) for col in range(cols - 1)]
+            if following is not None:
+                candidates += [
+                    (row, col, row + 1, col, following) for col in range(cols)
+                ]
+
+            n = len(candidates)
+            kept = edge_rng.random(n) >= drop_ratio
+            categories = edge_rng.choice(len(names), size=n, p=weights)
+            oneway = edge_rng.random(n) < oneway_ratio
+            detours = 1 + 0.3 * edge_rng.random(n)
+
+            for i in np.flatnonzero(kept).tolist():
+                u_row, u_col, v_row, v_col, other = candidates[i]
+                lat, lon = float(current[0][u_col]), float(current[1][u_col])
+                other_lat, other_lon = float(other[0][v_col]), float(other[1][v_col])
+                edge = edge_data(
+                    f"{u_row}_{u_col}_{v_row}_{v_col}",
+                    node_id(u_row, u_col),
+                    node_id(v_row, v_col),
+                    round(haversine(lat, lon, other_lat, other_lon) * detours[i], 3),
+                    [[lon, lat], [other_lon, other_lat]],
+                    names[categories[i]],
+                    oneway="yes" if oneway[i] else None,
+                )
+                f.write(("" if first else ", ") + json.dumps(edge))
+                first = False
+            current = following
+        f.write("]}")
+
+
+def prepare_dataset(name: str, data_dir: str, seed: int = 0) -> str:
+    """Path of a dataset's graph.json, generating it on first use.
+
+    Args:
+        name (str): "oslo" for the bundled GraphML export, or "grid:ROWSxCOLS" (or
+            "grid:N" for a square grid) for a synthetic graph
+        data_dir (str): where generated files are kept between runs
+
+    Returns:
+        str: path of the graph.json file
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    # Files are written under a temporary name so an interrupted run is not reused
+    if name == "oslo":
+        filepath = os.path.join(data_dir, "oslo.json")
+        if not os.path.exists(filepath):
+            write_graphml_dataset(filepath + ".tmp")
+            os.replace(filepath + ".tmp", filepath)
+        return filepath
+
+    if name.startswith("grid:"):
+        size = name[len("grid:") :]
+        rows, _, cols = size.partition("x")
+        rows, cols = int(rows), int(cols or rows)
+        filepath = os.path.join(data_dir, f"grid-{rows}x{cols}-seed{seed}.json")
+        if not os.path.exists(filepath):
+            write_grid_dataset(filepath + ".tmp", rows, cols, seed=seed)
+            os.replace(filepath + ".tmp", filepath)
+        return filepath
+
+    raise ValueError(f"Unknown dataset {name}, expected oslo or grid:ROWSxCOLS")
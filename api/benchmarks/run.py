@@ -0,0 +1,322 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+
+from app.Shared.Graph import Graph
+from app.Shared.Landmarks import to_sparse_matrix
+from app.Shared.Pathfinder import Pathfinder
+from benchmarks.datasets import prepare_dataset
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCHMARKS_DIR, "data")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Search modes timed by default, alt and ch need preprocessing files
+DEFAULT_MODES = ("dijkstra", "bidirectional", "astar")
+
+PERCENTILES = (50, 90, 99)
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process since start or reset_peak_rss()."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak RSS to the current RSS, only possible on Linux."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def summarize(seconds: list) -> dict:
+    """Latency percentiles, mean and max in milliseconds."""
+    values = np.asarray(seconds) * 1000
+    summary = {
+        f"p{percentile}_ms": float(np.percentile(values, percentile))
+        for percentile in PERCENTILES
+    }
+    summary["mean_ms"] = float(values.mean())
+    summary["max_ms"] = float(values.max())
+    summary["count"] = len(values)
+    return summary
+
+
+def measure_load(filepath: str) -> dict:
+    """Time Graph.from_json_file in a fresh process.
+
+    Run through a spawned process so the peak RSS only covers the imports and the
+    load, not graphs loaded earlier in the benchmark. load_rss_mb is the peak during
+    the load above the RSS before it. It needs a resettable peak (Linux), elsewhere
+    the import peak can hide it and it is None.
+    """
+    resettable = reset_peak_rss()
+    baseline = peak_rss_bytes()
+    started = time.perf_counter()
+    graph = Graph.from_json_file(filepath)
+    seconds = time.perf_counter() - started
+    peak = peak_rss_bytes()
+    return {
+        "seconds": seconds,
+        "peak_rss_mb": peak / 2**20,
+        "load_rss_mb": (peak - baseline) / 2**20 if resettable else None,
+        "nodes": len(graph.nodes),
+        "edges": len(graph.edges),
+    }
+
+
+def benchmark_load(filepath: str, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            runs.append(pool.submit(measure_load, filepath).result())
+
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "min_seconds": min(seconds),
+        "median_seconds": float(np.median(seconds)),
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "load_rss_mb": max(run["load_rss_mb"] or 0 for run in runs) or None,
+        "runs": runs,
+    }
+
+
+def benchmark_snapping(graph: Graph, queries: int, rng: np.random.Generator) -> dict:
+    """Latency of find_closest_node for random points in the graph's bounding box."""
+    lats = [node.lat for node in graph.nodes.values()]
+    lons = [node.lon for node in graph.nodes.values()]
+    points = np.column_stack(
+        (
+            rng.uniform(min(lats), max(lats), queries),
+            rng.uniform(min(lons), max(lons), queries),
+        )
+    ).tolist()
+
+    # The spatial index is built on the first lookup
+    started = time.perf_counter()
+    graph.find_closest_node(*points[0])
+    index_seconds = time.perf_counter() - started
+
+    seconds = []
+    for lat, lon in points:
+        started = time.perf_counter()
+        graph.find_closest_node(lat, lon)
+        seconds.append(time.perf_counter() - started)
+
+    return {"index_build_seconds": index_seconds, **summarize(seconds)}
+
+
+def od_pairs(pathfinder: Pathfinder, pairs: int, rng: np.random.Generator) -> list:
+    """Random origin-destination node ID pairs that have a route.
+
+    Origins are drawn from all nodes in a strongly connected component of at least
+    two nodes and destinations from the origin's component. The bundled Oslo network
+    only contains bike lanes and falls apart in hundreds of pieces, uniform pairs
+    would mostly time unreachable searches. Node IDs are sorted first, so the pairs
+    only depend on the seed and the graph, not on the order nodes were loaded in.
+    """
+    csr = pathfinder.csr
+    _, labels = connected_components(to_sparse_matrix(csr), connection="strong")
+    node_ids = sorted(csr.node_ids)
+    components = labels[[csr.node_index[node_id] for node_id in node_ids]]
+
+    members = {}
+    for position, component in enumerate(components.tolist()):
+        members.setdefault(component, []).append(position)
+    candidates = [
+        position
+        for position, component in enumerate(components.tolist())
+        if len(members[component]) > 1
+    ]
+
+    result = []
+    for origin in rng.choice(candidates, size=pairs).tolist():
+        component = members[components[origin]]
+        destination = component[rng.integers(len(component))]
+        result.append((node_ids[origin], node_ids[destination]))
+    return result
+
+
+def benchmark_routing(
+    graph: Graph, pathfinder: Pathfinder, pairs: list, modes: list
+) -> dict:
+    """Latency of shortest_path_dijkstra over the OD pairs, per search mode.
+
+    meters is the summed length of all routes found, it should not change between
+    commits unless routing results do.
+    """
+    results = {}
+    for mode in modes:
+        seconds = []
+        meters = 0.0
+        unreachable = 0
+        for start_id, end_id in pairs:
+            start_node, end_node = graph.nodes[start_id], graph.nodes[end_id]
+            started = time.perf_counter()
+            route = pathfinder.shortest_path_dijkstra(start_node, end_node, mode)
+            seconds.append(time.perf_counter() - started)
+            if route is not None:
+                meters += sum(edge.distance for edge in route)
+            else:
+                unreachable += 1
+
+        results[mode] = {
+            **summarize(seconds),
+            "unreachable": unreachable,
+            "meters": round(meters, 1),
+        }
+        logging.info(f"{mode}: p50 {results[mode]['p50_ms']:.2f} ms")
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(
+    dataset: str,
+    seed: int = 0,
+    pairs: int = 200,
+    snaps: int = 2000,
+    repeat: int = 3,
+    modes=DEFAULT_MODES,
+    data_dir: str = DATA_DIR,
+) -> dict:
+    """Run all benchmarks on a dataset.
+
+    Args:
+        dataset (str): see datasets.prepare_dataset
+        seed (int): seeds the synthetic graph, snapping points and OD pairs
+        pairs (int): number of OD pairs routed per search mode
+        snaps (int): number of find_closest_node queries
+        repeat (int): number of graph loads, each in a fresh process
+
+    Returns:
+        dict: environment, parameters and results, ready to be written as JSON
+    """
+    filepath = prepare_dataset(dataset, data_dir, seed=seed)
+    logging.info(f"Benchmarking {dataset} ({filepath})")
+
+    load = benchmark_load(filepath, repeat)
+    logging.info(f"Load: {load['min_seconds']:.2f} s, {load['peak_rss_mb']:.0f} MB")
+
+    graph = Graph.from_json_file(filepath)
+    rng = np.random.default_rng(seed)
+    snapping = benchmark_snapping(graph, snaps, rng)
+    logging.info(f"Snapping: p50 {snapping['p50_ms'] * 1000:.1f} us")
+
+    started = time.perf_counter()
+    pathfinder = Pathfinder(graph)
+    init_seconds = time.perf_counter() - started
+    routing = benchmark_routing(
+        graph, pathfinder, od_pairs(pathfinder, pairs, rng), modes
+    )
+    routing["pathfinder_init_seconds"] = init_seconds
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": {
+            "name": dataset,
+            "nodes": len(graph.nodes),
+            "edges": len(graph.edges),
+            "file_mb": os.path.getsize(filepath) / 2**20,
+        },
+        "parameters": {
+            "seed": seed,
+            "pairs": pairs,
+            "snaps": snaps,
+            "repeat": repeat,
+            "modes": list(modes),
+        },
+        "load": load,
+        "snapping": snapping,
+        "routing": routing,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark graph loading, snapping and routing."
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default="oslo",
+        help='"oslo" (bundled GraphML) or "grid:ROWSxCOLS" (synthetic)',
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pairs", type=int, default=200, help="OD pairs per mode")
+    parser.add_argument("--snaps", type=int, default=2000, help="Snapping queries")
+    parser.add_argument("--repeat", type=int, default=3, help="Graph loads")
+    parser.add_argument(
+        "--modes", type=str, nargs="+", default=list(DEFAULT_MODES), help="Search modes"
+    )
+    parser.add_argument(
+        "--data-dir", type=str, default=DATA_DIR, help="Generated datasets"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Results JSON file, defaults to results/<dataset>-<commit>.json",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    results = run(
+        args.dataset,
+        seed=args.seed,
+        pairs=args.pairs,
+        snaps=args.snaps,
+        repeat=args.repeat,
+        modes=args.modes,
+        data_dir=args.data_dir,
+    )
+
+    outfp = args.output or os.path.join(
+        RESULTS_DIR, f"{args.dataset.replace(':', '-')}-{results['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(outfp)), exist_ok=True)
+    with open(outfp, "w") as f:
+        json.dump(results, f, indent=4)
+    logging.info(f"Saved results to {outfp}")
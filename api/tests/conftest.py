@@ -0,0 +1,123 @@
+from math import asin, cos, radians, sin, sqrt
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from app.Shared.CSRGraph import SNAPSHOT_FILENAME, CSRGraph
+
+GRID_SIZE = 12
+# Degrees between neighbouring grid nodes, about 55 m east-west and 111 m
+# north-south at this latitude
+SPACING = 0.001
+ORIGIN = (10.75, 59.91)
+
+CATEGORIES = (
+    ("Designated cycleway, segregated", "Designated cyclepath"),
+    ("Footpath", "Footway"),
+    ("Sidewalk", "Footway"),
+    ("Road without bike lane", "Road without bike lane"),
+)
+
+
+def haversine(point1, point2) -> float:
+    """Great-circle distance in meters between two (lon, lat) points."""
+    lon1, lat1, lon2, lat2 = map(radians, (*point1, *point2))
+    a = (
+        sin((lat2 - lat1) / 2) ** 2
+        + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371008.8 * asin(sqrt(a))
+
+
+def grid_records(size: int = GRID_SIZE, seed: int = 0):
+    """Nodes and edges of a size x size street grid, in CSRGraph.from_records format.
+
+    Edge lengths are at least the straight-line distance, about a fifth of the edges
+    are oneway. Two more nodes far away are only connected to each other, so they
+    cannot be reached from the grid.
+    """
+    rng = np.random.default_rng(seed)
+    points = [
+        (ORIGIN[0] + col * SPACING, ORIGIN[1] + row * SPACING)
+        for row in range(size)
+        for col in range(size)
+    ]
+    points += [(ORIGIN[0] + 0.1, ORIGIN[1] + 0.1), (ORIGIN[0] + 0.101, ORIGIN[1] + 0.1)]
+    nodes = [(str(100 + i), lon, lat) for i, (lon, lat) in enumerate(points)]
+
+    pairs = [
+        (i, j)
+        for i in range(size * size)
+        for j in (i + 1, i + size)
+        if j < size * size and (j == i + size or j % size)
+    ]
+    pairs.append((size * size, size * size + 1))
+
+    edges = []
+    for u, v in pairs:
+        category, parent = CATEGORIES[rng.integers(len(CATEGORIES))]
+        oneway = "yes" if rng.random() < 0.2 else None
+        edges.append(
+            (
+                str(100 + u),
+                str(100 + v),
+                haversine(points[u], points[v]) * rng.uniform(1, 1.5),
+                oneway,
+                None,
+                category,
+                parent,
+                [list(points[u]), list(points[v])],
+            )
+        )
+    return nodes, edges
+
+
+@pytest.fixture(scope="session")
+def graph() -> CSRGraph:
+    return CSRGraph.from_records(*grid_records())
+
+
+@pytest.fixture(scope="session")
+def distances(graph):
+    """Reference lengths between all pairs of nodes from scipy, inf if unreachable."""
+    return reference_distances(graph, graph.weights)
+
+
+@pytest.fixture(scope="session")
+def reference():
+    """Function computing scipy's lengths between all pairs for other edge costs."""
+    return reference_distances
+
+
+def reference_distances(graph: CSRGraph, weights: np.ndarray) -> np.ndarray:
+    # The grid has no parallel edges, which scipy would sum
+    matrix = coo_matrix(
+        (weights.astype(np.float64), (graph.sources, graph.targets)),
+        shape=(graph.n_nodes, graph.n_nodes),
+    ).tocsr()
+    return dijkstra(matrix)
+
+
+@pytest.fixture(scope="session")
+def graph_dir(tmp_path_factory, graph):
+    directory = tmp_path_factory.mktemp("Graph")
+    graph.save_snapshot(str(directory / SNAPSHOT_FILENAME))
+    return directory
+
+
+@pytest.fixture(scope="session")
+def client(graph_dir) -> TestClient:
+    """API client serving the grid graph.
+
+    The pathfinding module loads its graph when imported, so the app is only
+    imported here, once GRAPH_DIR points at the fixture files.
+    """
+    from app import config
+
+    config.GRAPH_DIR = str(graph_dir)
+    from app.main import app
+
+    return TestClient(app)
@@ -0,0 +1,119 @@
+import pytest
+
+ROUTE_URL = "/pathfinding/route/dijkstra"
+
+
+def location(graph, node: int) -> dict:
+    return {"lat": float(graph.lats[node]), "lon": float(graph.lons[node])}
+
+
+def route_params(graph, start: int, end: int, **params) -> dict:
+    start, end = location(graph, start), location(graph, end)
+    return {
+        "start_lat": start["lat"],
+        "start_lon": start["lon"],
+        "end_lat": end["lat"],
+        "end_lon": end["lon"],
+        **params,
+    }
+
+
+def test_route(client, graph, distances):
+    response = client.get(ROUTE_URL, params=route_params(graph, 0, 143))
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["nodes"][0]["nodeId"] == graph.node_ids[0]
+    assert data["nodes"][-1]["nodeId"] == graph.node_ids[143]
+    assert len(data["edges"]) == len(data["nodes"]) - 1
+    assert data["routeData"]["meters"] == pytest.approx(distances[0, 143], abs=1)
+
+
+def test_route_to_start(client, graph):
+    data = client.get(ROUTE_URL, params=route_params(graph, 7, 7)).json()
+    assert data["nodes"] == [{"nodeId": graph.node_ids[7]}]
+    assert data["edges"] == []
+    assert data["routeData"]["meters"] == 0
+
+
+def test_no_route_is_not_found(client, graph):
+    unreachable = graph.n_nodes - 1
+    response = client.get(ROUTE_URL, params=route_params(graph, 0, unreachable))
+    assert response.status_code == 404
+
+
+def test_unavailable_mode_is_rejected(client, graph):
+    response = client.get(ROUTE_URL, params=route_params(graph, 0, 1, mode="fly"))
+    assert response.status_code == 422
+
+
+def test_matrix(client, graph, distances):
+    origins, destinations = [0, 20, graph.n_nodes - 1], [5, 143]
+    response = client.post(
+        "/pathfinding/matrix",
+        json={
+            "origins": [location(graph, node) for node in origins],
+            "destinations": [location(graph, node) for node in destinations],
+        },
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    assert [node["nodeId"] for node in data["origins"]] == [
+        graph.node_ids[node] for node in origins
+    ]
+    for row, origin in zip(data["meters"], origins):
+        for meters, destination in zip(row, destinations):
+            if meters is None:
+                assert distances[origin, destination] == float("inf")
+            else:
+                assert meters == pytest.approx(distances[origin, destination], abs=1)
+    assert data["meters"][2] == [None, None]
+
+
+def test_matrix_defaults_to_origins(client, graph):
+    origins = [location(graph, node) for node in (3, 30)]
+    data = client.post("/pathfinding/matrix", json={"origins": origins}).json()
+    assert data["destinations"] == data["origins"]
+    assert data["meters"][0][0] == data["meters"][1][1] == 0
+
+
+@pytest.mark.parametrize(
+    "body",
+    [{"origins": []}, {"origins": [{"lat": 59.91, "lon": 10.75}], "destinations": []}],
+    ids=["no origins", "no destinations"],
+)
+def test_matrix_needs_locations(client, body):
+    assert client.post("/pathfinding/matrix", json=body).status_code == 400
+
+
+def test_isochrone(client, graph, distances):
+    max_meters = 300
+    response = client.get(
+        "/pathfinding/isochrone",
+        params={**location(graph, 50), "max_meters": max_meters, "hull": True},
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    reachable = {
+        graph.node_ids[node]: distance
+        for node, distance in enumerate(distances[50])
+        if distance <= max_meters
+    }
+    assert {node["nodeId"] for node in data["nodes"]} == set(reachable)
+    for node in data["nodes"]:
+        assert node["meters"] == pytest.approx(reachable[node["nodeId"]], abs=1)
+    assert data["hull"]["type"] == "Polygon"
+
+
+@pytest.mark.parametrize("max_meters", [1, 500], ids=["start only", "dead end"])
+def test_isochrone_without_area_has_no_hull(client, graph, max_meters):
+    # The two nodes outside the grid only reach each other
+    start = graph.n_nodes - 2
+    response = client.get(
+        "/pathfinding/isochrone",
+        params={**location(graph, start), "max_meters": max_meters, "hull": True},
+    )
+    assert response.status_code == 200
+    assert response.json()["hull"] is None
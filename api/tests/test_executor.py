@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.executor import RoutingExecutor
+
+
+def add(a, b):
+    return a + b
+
+
+@pytest.mark.parametrize("backend", ["inline", "thread"])
+def test_runs_tasks(backend):
+    executor = RoutingExecutor(backend=backend)
+    try:
+        assert asyncio.run(executor.run(add, 2, 3)) == 5
+    finally:
+        executor.shutdown()
+
+
+def test_rejects_when_full():
+    executor = RoutingExecutor(backend="thread", workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def main():
+        running = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as error:
+            await executor.run(add, 1, 1)
+        assert error.value.status_code == 503
+
+        release.set()
+        await running
+        # The slot is free again once the task finished
+        assert await executor.run(add, 1, 1) == 2
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_times_out():
+    executor = RoutingExecutor(backend="thread", workers=1, timeout=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(executor.run(release.wait, 5))
+        assert error.value.status_code == 504
+    finally:
+        release.set()
+        executor.shutdown()
+    assert executor.pending == 0
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        RoutingExecutor(backend="cluster")
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from app.graph_store import GraphStore
+from app.Shared.ContractionHierarchy import HIERARCHY_FILENAME, ContractionHierarchy
+from app.Shared.CSRGraph import SNAPSHOT_FILENAME, CSRGraph
+from app.Shared.RouteCache import RouteCache
+
+
+@pytest.fixture
+def store_dir(tmp_path, graph_dir):
+    shutil.copy(graph_dir / SNAPSHOT_FILENAME, tmp_path / SNAPSHOT_FILENAME)
+    return tmp_path
+
+
+def replace_snapshot(directory, graph: CSRGraph):
+    # Written elsewhere and renamed, as the watcher expects
+    graph.save_snapshot(str(directory / "next.bin"))
+    os.replace(directory / "next.bin", directory / SNAPSHOT_FILENAME)
+
+
+def test_reload_swaps_changed_files_only(store_dir, graph):
+    cache = RouteCache()
+    store = GraphStore(str(store_dir), cache=cache)
+    assert store.reload()
+    first = store.current
+    assert first.pathfinder.hierarchy is None
+    # Lazy indexes are built before the state is served
+    assert first.graph._spatial_index is not None
+
+    os.utime(store_dir / SNAPSHOT_FILENAME)
+    assert not store.reload()
+    assert store.current is first
+
+    first.pathfinder.shortest_path(0, 30)
+    ContractionHierarchy.build(graph).save(str(store_dir / HIERARCHY_FILENAME))
+    assert store.reload()
+    assert store.current.pathfinder.hierarchy is not None
+    assert store.current.version != first.version
+    assert len(cache.backend) == 0
+    assert store.reloads == 1
+
+
+def test_coordinates_change_the_version(store_dir, graph):
+    store = GraphStore(str(store_dir))
+    store.reload()
+    version = store.current.version
+
+    moved = CSRGraph.from_snapshot(str(store_dir / SNAPSHOT_FILENAME))
+    moved.lats = np.asarray(moved.lats) + 1e-5
+    replace_snapshot(store_dir, moved)
+    assert store.reload()
+    assert store.current.version != version
+    # Topology is unchanged
+    assert store.current.graph.fingerprint == graph.fingerprint
+
+
+def test_states_in_use_stay_available(store_dir, graph):
+    store = GraphStore(str(store_dir))
+    store.reload()
+    previous = store.current
+
+    moved = CSRGraph.from_snapshot(str(store_dir / SNAPSHOT_FILENAME))
+    moved.lons = np.asarray(moved.lons) + 1e-5
+    replace_snapshot(store_dir, moved)
+    store.reload()
+
+    assert store.state_for(previous.version) is previous
+    assert store.state_for(store.current.version) is store.current
+    with pytest.raises(LookupError):
+        store.state_for("0" * 16)
+
+
+def test_invalid_files_keep_the_current_state(store_dir):
+    store = GraphStore(str(store_dir))
+    store.reload()
+    current = store.current
+
+    (store_dir / SNAPSHOT_FILENAME).write_bytes(b"not a snapshot" * 8)
+    with pytest.raises(ValueError):
+        store.reload()
+    assert store.current is current
+
+
+def test_watch_reloads_changed_files(store_dir, graph):
+    store = GraphStore(str(store_dir))
+    store.reload()
+    version = store.current.version
+
+    async def main():
+        watch = asyncio.create_task(store.watch(0.01))
+        ContractionHierarchy.build(graph).save(str(store_dir / HIERARCHY_FILENAME))
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if store.current.version != version:
+                break
+        watch.cancel()
+
+    asyncio.run(main())
+    assert store.current.pathfinder.hierarchy is not None
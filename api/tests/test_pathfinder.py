@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from app.Shared.ContractionHierarchy import ContractionHierarchy
+from app.Shared.Landmarks import Landmarks
+from app.Shared.Pathfinder import HEURISTIC_SLACK, Pathfinder
+from app.Shared.RouteCache import RouteCache
+
+MODES = ["dijkstra", "bidirectional", "astar", "alt", "ch"]
+
+# Start nodes of the compared searches, to every node of the graph
+ORIGINS = (0, 17, 70, 143, 144)
+
+
+@pytest.fixture(scope="module")
+def landmarks(graph):
+    return Landmarks.compute(graph, n_landmarks=4)
+
+
+@pytest.fixture(scope="module")
+def hierarchy(graph):
+    return ContractionHierarchy.build(graph)
+
+
+@pytest.fixture(scope="module")
+def pathfinder(graph, landmarks, hierarchy):
+    return Pathfinder(graph, landmarks=landmarks, hierarchy=hierarchy)
+
+
+def route_length(graph, route: list) -> float:
+    return float(np.sum(graph.weights[route], dtype=np.float64))
+
+
+def assert_connected(graph, route: list, start: int, end: int):
+    """The edge slots lead from start to end."""
+    nodes = [start] + [int(graph.targets[slot]) for slot in route]
+    assert [int(graph.sources[slot]) for slot in route] == nodes[:-1]
+    assert nodes[-1] == end
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_search_matches_scipy(graph, distances, pathfinder, mode):
+    for start in ORIGINS:
+        for end in range(graph.n_nodes):
+            route = pathfinder.search(start, end, mode)
+            if np.isinf(distances[start, end]):
+                assert route is None, (start, end)
+                continue
+            assert_connected(graph, route, start, end)
+            assert route_length(graph, route) == pytest.approx(distances[start, end])
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_same_start_and_end_is_empty_route(pathfinder, mode):
+    assert pathfinder.shortest_path(5, 5, mode) == []
+
+
+def test_unreachable_is_not_cached(graph):
+    cache = RouteCache()
+    pathfinder = Pathfinder(graph, cache=cache)
+    isolated = graph.n_nodes - 1
+
+    assert pathfinder.shortest_path(0, isolated) is None
+    assert len(cache.backend) == 0
+    assert pathfinder.shortest_path(0, 1) == pathfinder.shortest_path(0, 1)
+    assert cache.stats()["hits"] == 1
+
+
+def test_unknown_mode_or_profile(pathfinder):
+    with pytest.raises(ValueError):
+        pathfinder.shortest_path(0, 1, "teleport")
+    with pytest.raises(ValueError):
+        pathfinder.shortest_path(0, 1, profile="scenic")
+
+
+def test_landmark_bounds_are_admissible(graph, distances, landmarks):
+    for end in ORIGINS:
+        heuristic = landmarks.heuristic(end, HEURISTIC_SLACK)
+        for node in range(graph.n_nodes):
+            assert heuristic(node) <= distances[node, end]
+
+
+def test_modes_need_preprocessing(graph):
+    pathfinder = Pathfinder(graph)
+    for mode in ("alt", "ch"):
+        with pytest.raises(ValueError):
+            pathfinder.shortest_path(0, 1, mode)
+
+
+@pytest.mark.parametrize("preprocessed", [False, True], ids=["scipy", "ch"])
+def test_distance_matrix_matches_scipy(graph, distances, hierarchy, preprocessed):
+    pathfinder = Pathfinder(graph, hierarchy=hierarchy if preprocessed else None)
+    origins, destinations = list(ORIGINS), list(range(0, graph.n_nodes, 7))
+
+    matrix = pathfinder.distance_matrix(origins, destinations)
+    np.testing.assert_allclose(matrix, distances[np.ix_(origins, destinations)])
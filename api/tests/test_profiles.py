@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.Shared.Pathfinder import Pathfinder
+from app.Shared.Profiles import DEFAULT_PROFILE, PROFILES, RoutingProfile
+
+ORIGINS = (0, 77)
+
+
+@pytest.fixture(scope="module")
+def pathfinder(graph):
+    return Pathfinder(graph)
+
+
+@pytest.mark.parametrize("profile", list(PROFILES))
+def test_profile_routes_match_scipy(graph, reference, pathfinder, profile):
+    weights = pathfinder.profiles[profile].weights
+    distances = reference(graph, weights)
+
+    for mode in ("dijkstra", "bidirectional", "astar"):
+        for start in ORIGINS:
+            for end in range(graph.n_nodes):
+                route = pathfinder.search(start, end, mode, profile)
+                if np.isinf(distances[start, end]):
+                    assert route is None
+                    continue
+                cost = float(np.sum(weights[route], dtype=np.float64))
+                assert cost == pytest.approx(distances[start, end]), (mode, start, end)
+
+
+@pytest.mark.parametrize("profile", list(PROFILES))
+def test_costs_are_at_least_lengths(graph, pathfinder, profile):
+    compiled = pathfinder.profiles[profile]
+    assert np.all(compiled.weights >= graph.weights)
+    np.testing.assert_array_equal(
+        compiled.reverse_weights, compiled.weights[graph.reverse_slots]
+    )
+
+
+def test_profiles_are_compiled_on_first_use(graph):
+    pathfinder = Pathfinder(graph)
+    assert "safest" in pathfinder.profiles
+    assert pathfinder.profiles.compiled == {}
+
+    pathfinder.shortest_path(0, 30, profile="safest")
+    assert list(pathfinder.profiles.compiled) == ["safest"]
+    # Plain lengths share the graph's arrays
+    assert pathfinder.profiles[DEFAULT_PROFILE].weights is graph.weights
+
+
+def test_multipliers_below_one_are_rejected(graph):
+    with pytest.raises(ValueError):
+        RoutingProfile.compile(graph, "downhill", {"category": {"Footpath": 0.5}})
+    with pytest.raises(ValueError):
+        Pathfinder(graph, profiles={"shortest": {}, "downhill": {"parent": {"x": 0}}})
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+
+import pytest
+
+from app.Shared.RouteCache import CacheBackend, MemoryBackend, RouteCache
+
+
+class LocalBackend(CacheBackend):
+    """Stand-in for a store shared between processes: reads do not refresh entries,
+    the oldest one is evicted once more than maxsize are stored."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value) -> int:
+        self.entries[key] = value
+        evicted = 0
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_backend_must_implement_interface():
+    class Incomplete(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.parametrize("backend", [MemoryBackend, LocalBackend])
+def test_counts_hits_misses_and_evictions(backend):
+    cache = RouteCache(backend(maxsize=2))
+
+    assert cache.get(0, 1, "shortest", "v1") is None
+    cache.set(0, 1, "shortest", "v1", [3, 4])
+    assert cache.get(0, 1, "shortest", "v1") == [3, 4]
+    # Profiles are part of the key
+    assert cache.get(0, 1, "safest", "v1") is None
+
+    cache.set(1, 2, "shortest", "v1", [5])
+    cache.set(2, 3, "shortest", "v1", [6])
+    assert cache.get(0, 1, "shortest", "v1") is None
+    assert cache.get(2, 3, "shortest", "v1") == [6]
+
+    assert cache.stats() == {
+        "size": 2,
+        "hits": 2,
+        "misses": 3,
+        "evictions": 1,
+        "invalidations": 0,
+    }
+
+
+def test_invalidate_on_version_change():
+    cache = RouteCache(LocalBackend(maxsize=10))
+    cache.set(0, 1, "shortest", "v1", [3])
+
+    cache.invalidate("v2")
+    assert len(cache.backend) == 0
+    assert cache.get(0, 1, "shortest", "v1") is None
+
+    # Requests still running on the old version neither read nor write
+    cache.set(0, 1, "shortest", "v1", [3])
+    assert len(cache.backend) == 0
+
+    cache.set(0, 1, "shortest", "v2", [4])
+    assert cache.get(0, 1, "shortest", "v2") == [4]
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_memory_backend_expires_entries():
+    clock = Clock()
+    cache = RouteCache(MemoryBackend(maxsize=10, ttl=60, clock=clock))
+    cache.set(0, 1, "shortest", "v1", [3])
+
+    clock.now = 59
+    assert cache.get(0, 1, "shortest", "v1") == [3]
+    clock.now = 60
+    assert cache.get(0, 1, "shortest", "v1") is None
+    assert len(cache.backend) == 0
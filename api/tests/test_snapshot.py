@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app.Shared.ContractionHierarchy import HIERARCHY_ARRAYS, ContractionHierarchy
+from app.Shared.CSRGraph import SNAPSHOT_ARRAYS, CSRGraph
+from app.Shared.Landmarks import Landmarks
+from app.Shared.Snapshot import PackedStrings, read_snapshot, write_snapshot
+
+
+def test_packed_strings():
+    values = ["1", "", "Grünerløkka", "42"]
+    packed = PackedStrings.from_list(values)
+    assert len(packed) == 4
+    assert list(packed) == values
+    assert packed[2] == "Grünerløkka"
+
+
+def test_arrays_round_trip(tmp_path):
+    arrays = {
+        "empty": np.zeros(0, dtype=np.int32),
+        "odd": np.arange(7, dtype=np.uint8),
+        "table": np.arange(12, dtype=np.float32).reshape(3, 4),
+    }
+    filename = str(tmp_path / "arrays.bin")
+    write_snapshot(filename, arrays, {"kind": "test"})
+
+    loaded, meta = read_snapshot(filename)
+    assert meta == {"kind": "test"}
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        np.testing.assert_array_equal(loaded[name], array)
+        assert not loaded[name].flags.writeable
+    assert loaded["table"].ctypes.data % 64 == 0
+
+
+def test_not_a_snapshot(tmp_path):
+    filename = tmp_path / "graph.bin"
+    filename.write_bytes(b"{}" * 32)
+    with pytest.raises(ValueError):
+        read_snapshot(str(filename))
+
+
+def test_graph_round_trip(tmp_path, graph):
+    filename = str(tmp_path / "graph.bin")
+    graph.save_snapshot(filename)
+    loaded = CSRGraph.from_snapshot(filename)
+
+    for name in SNAPSHOT_ARRAYS:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(graph, name))
+    assert list(loaded.node_ids) == list(graph.node_ids)
+    assert loaded.categories.values == graph.categories.values
+    assert loaded.fingerprint == graph.fingerprint
+    assert loaded.edge_ids(range(4)) == graph.edge_ids(range(4))
+    loaded.validate()
+
+
+def test_preprocessing_round_trip(tmp_path, graph):
+    landmarks = Landmarks.compute(graph, n_landmarks=2)
+    hierarchy = ContractionHierarchy.build(graph)
+    landmarks.save(str(tmp_path / "landmarks.bin"))
+    hierarchy.save(str(tmp_path / "hierarchy.bin"))
+
+    loaded = Landmarks.load(str(tmp_path / "landmarks.bin"), graph)
+    np.testing.assert_array_equal(loaded.table, landmarks.table)
+    loaded = ContractionHierarchy.load(str(tmp_path / "hierarchy.bin"), graph)
+    for name in HIERARCHY_ARRAYS:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(hierarchy, name))
+    assert loaded.n_original_edges == hierarchy.n_original_edges
+
+    # Files of another kind or built for another graph are rejected
+    with pytest.raises(ValueError):
+        Landmarks.load(str(tmp_path / "hierarchy.bin"), graph)
+    other = CSRGraph.from_records(
+        [("1", 10.0, 60.0), ("2", 10.001, 60.0)],
+        [("1", "2", 60.0, None, None, "Footpath", "Footway", [[10, 60], [10.001, 60]])],
+    )
+    with pytest.raises(ValueError):
+        ContractionHierarchy.load(str(tmp_path / "hierarchy.bin"), other)
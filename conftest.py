@@ -0,0 +1 @@
+# Lets pytest import the utils package when run from outside the repository root
@@ -0,0 +1,79 @@
+import struct
+
+import numpy as np
+import pytest
+
+from utils.Shared.BinaryCopy import SIGNATURE, TRAILER, copy_to_arrays
+
+FIELDS = [("u", ">i8"), ("length", ">f8")]
+
+
+def copy_stream(rows: list, null_at: int = -1) -> bytes:
+    """Binary COPY output of (bigint, double precision) rows."""
+    # Header with a 4 byte extension area, which readers skip
+    data = SIGNATURE + struct.pack(">iI", 0, 4) + b"ext!"
+    for i, (u, length) in enumerate(rows):
+        data += struct.pack(">hiq", 2, 8, u)
+        data += struct.pack(">i", -1) if i == null_at else struct.pack(">id", 8, length)
+    return data + TRAILER
+
+
+class Cursor:
+    def __init__(self, data: bytes, piece: int):
+        self.data = data
+        self.piece = piece
+        self.query = None
+
+    def copy_expert(self, query, sink):
+        # psycopg2 writes the stream in pieces, not aligned to rows
+        self.query = query
+        for i in range(0, len(self.data), self.piece):
+            sink.write(self.data[i : i + self.piece])
+
+    def close(self):
+        pass
+
+
+class Connection:
+    def __init__(self, data: bytes, piece: int = 7):
+        self.copy_cursor = Cursor(data, piece)
+
+    def cursor(self):
+        return self.copy_cursor
+
+
+@pytest.mark.parametrize("piece", [1, 7, 4096])
+def test_decodes_rows_in_chunks(piece):
+    rows = [(i, i * 0.5) for i in range(-5, 45)]
+    connection = Connection(copy_stream(rows), piece)
+    chunks = []
+
+    n = copy_to_arrays(connection, "SELECT 1", FIELDS, chunks.append, chunk_rows=16)
+    assert n == len(rows)
+    assert connection.copy_cursor.query == "COPY (SELECT 1) TO STDOUT (FORMAT binary)"
+    assert all(len(chunk["u"]) >= 16 for chunk in chunks[:-1])
+
+    u = np.concatenate([chunk["u"] for chunk in chunks])
+    length = np.concatenate([chunk["length"] for chunk in chunks])
+    assert u.dtype == np.int64 and u.dtype.isnative
+    np.testing.assert_array_equal(u, [row[0] for row in rows])
+    np.testing.assert_array_equal(length, [row[1] for row in rows])
+
+
+def test_empty_result():
+    assert copy_to_arrays(Connection(copy_stream([])), "SELECT 1", FIELDS, print) == 0
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        copy_stream([(1, 1.0), (2, 2.0)], null_at=1),
+        copy_stream([(1, 1.0)])[:-2],
+        b"COPY" + copy_stream([(1, 1.0)])[4:],
+        SIGNATURE,
+    ],
+    ids=["null", "no trailer", "signature", "no header"],
+)
+def test_rejects_invalid_streams(data):
+    with pytest.raises(ValueError):
+        copy_to_arrays(Connection(data), "SELECT 1", FIELDS, lambda chunk: None)
@@ -0,0 +1,73 @@
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.functions import DEFAULT_CATEGORY, CategoryRules, categorize_edges
+
+CATEGORIES_FILE = os.path.join(os.path.dirname(__file__), "..", "categories.json")
+
+RULES = [
+    {
+        "category": "Designated cycleway, segregated",
+        "parent": "Designated cyclepath",
+        "criteria": {"highway": "cycleway", "segregated": "yes"},
+        "categoryScore": 0,
+        "parentScore": 1,
+    },
+    {
+        "category": "Cycleway",
+        "parent": "Designated cyclepath",
+        "criteria": {"highway": "cycleway"},
+        "parentScore": 1,
+    },
+    {"category": "Unused", "parent": "Unused", "criteria": None},
+]
+
+
+def test_first_matching_rule_wins():
+    edges = pd.DataFrame(
+        {
+            "highway": ["cycleway", "cycleway", "footway", None],
+            "segregated": ["yes", "no", "yes", None],
+        }
+    )
+    edges = categorize_edges(edges, CategoryRules(RULES))
+
+    assert list(edges["category"]) == [
+        "Designated cycleway, segregated",
+        "Cycleway",
+        DEFAULT_CATEGORY,
+        DEFAULT_CATEGORY,
+    ]
+    assert list(edges["parentScore"][:2]) == [1, 1]
+    # Categories without a score get NaN
+    assert np.isnan(edges["categoryScore"][1:].astype(float)).all()
+    assert np.isnan(edges["parentScore"][2:].astype(float)).all()
+
+
+def test_columns_missing_from_edges_match_nothing():
+    edges = categorize_edges(
+        pd.DataFrame({"highway": ["cycleway"]}), CategoryRules(RULES)
+    )
+    assert edges["category"][0] == "Cycleway"
+
+
+def test_rows_match_like_single_edges():
+    with open(CATEGORIES_FILE) as f:
+        rules = CategoryRules(json.load(f))
+
+    # Every combination of the values the criteria test, plus one they do not
+    values = {column: {None, "other"} for column, _ in rules.conditions}
+    for column, value in rules.conditions:
+        values[column].add(value)
+    columns = sorted(values)
+    edges = pd.DataFrame(
+        itertools.product(*(sorted(values[c], key=str) for c in columns)),
+        columns=columns,
+    )
+
+    expected = [rules.match(row) for row in edges.to_dict("records")]
+    np.testing.assert_array_equal(rules.match_rows(edges), expected)
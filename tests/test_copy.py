@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from utils.functions import COPY_NULL, copy_chunk
+
+
+class Cursor:
+    def __init__(self, copies: list):
+        self.copies = copies
+
+    def copy_expert(self, query, buffer):
+        self.copies.append((query, buffer.read()))
+
+
+class Connection:
+    def __init__(self, copies: list):
+        self.copies = copies
+        self.committed = self.closed = False
+
+    def cursor(self):
+        return Cursor(self.copies)
+
+    def commit(self):
+        self.committed = True
+
+    def close(self):
+        self.closed = True
+
+
+class Engine:
+    def __init__(self):
+        self.copies = []
+        self.connections = []
+
+    def raw_connection(self):
+        self.connections.append(Connection(self.copies))
+        return self.connections[-1]
+
+
+def test_copy_keeps_empty_strings_apart_from_nulls():
+    engine = Engine()
+    chunk = pd.DataFrame(
+        {"name": ["", None, "Ring 2, east"], "maxspeed": [30.0, np.nan, 50.0]}
+    )
+
+    assert copy_chunk(engine, "edges_staging", chunk) == 3
+    ((query, csv),) = engine.copies
+    assert query == (
+        'COPY "edges_staging" ("name", "maxspeed") FROM STDIN '
+        f"WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    )
+    # COPY reads unquoted empty fields as empty strings once NULL has its own marker
+    assert csv.splitlines() == [",30.0", r"\N,\N", '"Ring 2, east",50.0']
+    assert engine.connections[0].committed and engine.connections[0].closed
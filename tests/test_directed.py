@@ -0,0 +1,39 @@
+import geopandas as gpd
+from shapely.geometry import LineString
+
+from utils.functions import make_gdf_directed
+
+
+def test_one_row_per_direction_of_travel():
+    edges = gpd.GeoDataFrame(
+        {
+            "id": [10, 20, 30, 40],
+            "u": [1, 2, 3, 4],
+            "v": [2, 3, 4, 5],
+            "oneway": ["yes", "-1", None, "no"],
+        },
+        geometry=[LineString([(i, 0), (i + 1, 0)]) for i in range(4)],
+        crs=4326,
+    )
+    directed = make_gdf_directed(edges)
+
+    assert list(directed["id"]) == ["1", "2_r", "3", "3_r", "4", "4_r"]
+    assert list(directed["osmid"]) == [10, 20, 30, 30, 40, 40]
+    assert list(zip(directed["u"], directed["v"])) == [
+        (1, 2),
+        (3, 2),
+        (3, 4),
+        (4, 3),
+        (4, 5),
+        (5, 4),
+    ]
+    # Geometries are kept in OSM direction
+    assert list(directed.geometry) == [edges.geometry[i] for i in (0, 1, 2, 2, 3, 3)]
+    assert list(edges["id"]) == [10, 20, 30, 40]
+
+
+def test_no_edges():
+    edges = gpd.GeoDataFrame(
+        {"id": [], "u": [], "v": [], "oneway": []}, geometry=[], crs=4326
+    )
+    assert len(make_gdf_directed(edges)) == 0
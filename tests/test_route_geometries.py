@@ -0,0 +1,82 @@
+import pytest
+from shapely.geometry import LineString
+from sqlalchemy import BigInteger, Column, MetaData, Table, Text
+
+from utils.Shared.Pathfinder import Pathfinder
+
+# Geometries as stored by make_gdf_directed: reversed edges keep the OSM direction
+GEOMETRIES = {
+    "1": LineString([(0, 0), (1, 0)]),
+    "2_r": LineString([(2, 0), (1, 0)]),
+    "3": LineString([(2, 0), (2, 1), (3, 1)]),
+}
+
+
+class Connection:
+    def __init__(self, queries: list):
+        self.queries = queries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, parameters):
+        self.queries.append((str(query), parameters["ids"]))
+        ids = [str(edge_id) for edge_id in parameters["ids"]]
+        return [
+            (edge_id, GEOMETRIES[edge_id].wkb)
+            for edge_id in ids
+            if edge_id in GEOMETRIES
+        ]
+
+
+class Engine:
+    def __init__(self):
+        self.queries = []
+
+    def connect(self):
+        return Connection(self.queries)
+
+
+class Graph:
+    def __init__(self, id_type=Text):
+        self.edges = Table("edges", MetaData(), Column("id", id_type))
+        self.engine = Engine()
+
+
+def test_pieces_follow_the_route():
+    pathfinder = Pathfinder(Graph())
+
+    route = pathfinder.get_route_geometries(["1", "2_r", "3"])
+    assert [list(line.coords) for line in route] == [
+        [(0, 0), (1, 0)],
+        [(1, 0), (2, 0)],
+        [(2, 0), (2, 1), (3, 1)],
+    ]
+
+    merged = pathfinder.get_route_geometries(["1", "2_r", "3"], merge=True)
+    assert list(merged.coords) == [(0, 0), (1, 0), (2, 0), (2, 1), (3, 1)]
+    assert pathfinder.get_route_geometries([], merge=True).is_empty
+
+
+def test_queries_id_column_without_cast():
+    graph = Graph()
+    pathfinder = Pathfinder(graph)
+
+    pathfinder.get_route_geometries(["1", "2_r"])
+    pathfinder.get_route_geometries(["2_r", "3"])
+    (first, ids1), (second, ids2) = graph.engine.queries
+    assert "WHERE id = ANY(:ids)" in first
+    assert (ids1, ids2) == (["1", "2_r"], ["3"])
+
+
+def test_numeric_id_column():
+    graph = Graph(BigInteger)
+    pathfinder = Pathfinder(graph, geometry_cache_size=0)
+
+    assert len(pathfinder.get_route_geometries(["1", "3"])) == 2
+    assert graph.engine.queries[0][1] == [1, 3]
+    with pytest.raises(KeyError):
+        pathfinder.get_route_geometries(["2_r"])
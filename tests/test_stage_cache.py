@@ -0,0 +1,77 @@
+import os
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from utils.Shared.StageCache import StageCache, file_fingerprint
+
+CALLS = []
+
+
+def points(n: int) -> dict:
+    CALLS.append(n)
+    frame = gpd.GeoDataFrame(
+        {"id": list(range(n))}, geometry=[Point(i, i) for i in range(n)], crs=4326
+    )
+    return {"points": frame}
+
+
+def count_points(n: int) -> dict:
+    # Run in worker processes, which leave a file instead of appending to CALLS
+    open(os.path.join(os.environ["STAGE_CALLS"], str(n)), "w").close()
+    return points(n)
+
+
+def test_fingerprint_follows_content(tmp_path):
+    path = tmp_path / "area.osm.pbf"
+    path.write_bytes(b"a" * 3000000)
+    fingerprint = file_fingerprint(str(path))
+
+    os.utime(path, (0, 0))
+    assert file_fingerprint(str(path)) == fingerprint
+    path.write_bytes(b"a" * 2999999 + b"b")
+    assert file_fingerprint(str(path)) != fingerprint
+
+
+def test_runs_stage_when_inputs_change(tmp_path):
+    cache = StageCache(str(tmp_path))
+    CALLS.clear()
+
+    assert len(cache.run("points", {"n": 3}, points, 3)["points"]) == 3
+    assert len(cache.run("points", {"n": 3}, points, 3)["points"]) == 3
+    assert CALLS == [3]
+
+    cache.run("points", {"n": 4}, points, 4)
+    cache.run("points", {"n": 4}, points, 4, force=True)
+    assert CALLS == [3, 4, 4]
+    # Only the checkpoint of the latest inputs is kept
+    assert cache.load("points", cache.key("points", {"n": 3})) is None
+
+
+def test_runs_stage_when_outputs_are_missing(tmp_path):
+    cache = StageCache(str(tmp_path))
+    CALLS.clear()
+
+    cache.run("points", 2, points, 2, outputs_exist=lambda: True)
+    cache.run("points", 2, points, 2, outputs_exist=lambda: True)
+    cache.run("points", 2, points, 2, outputs_exist=lambda: False)
+    assert CALLS == [2, 2]
+
+
+def test_run_parallel_skips_unchanged_stages(tmp_path, monkeypatch):
+    calls = tmp_path / "calls"
+    calls.mkdir()
+    monkeypatch.setenv("STAGE_CALLS", str(calls))
+    cache = StageCache(str(tmp_path / "cache"))
+
+    stages = [(f"extract_{n}", {"n": n}, count_points, (n,)) for n in (1, 2)]
+    results = cache.run_parallel(stages, workers=2)
+    assert [len(result["points"]) for result in results] == [1, 2]
+    assert sorted(os.listdir(calls)) == ["1", "2"]
+
+    for path in calls.iterdir():
+        path.unlink()
+    stages.append(("extract_3", {"n": 3}, count_points, (3,)))
+    results = cache.run_parallel(stages, workers=2)
+    assert [len(result["points"]) for result in results] == [1, 2, 3]
+    assert os.listdir(calls) == ["3"]
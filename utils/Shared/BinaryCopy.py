@@ -0,0 +1,134 @@
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+# Header of PostgreSQL's binary COPY format: signature, flags, extension length
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+HEADER_SIZE = len(SIGNATURE) + 8
+TRAILER = b"\xff\xff"
+
+# Default rows decoded at once, bounds the raw bytes buffered while streaming
+CHUNK_ROWS = 1 << 16
+
+
+def row_dtype(fields: List[Tuple[str, str]]) -> np.dtype:
+    """Numpy dtype of one binary COPY row of non-null fixed width fields.
+
+    Each row is a big-endian int16 field count followed by an int32 byte length and
+    the value of every field.
+
+    Args:
+        fields: (name, big-endian numpy type) per column, e.g. ("u", ">i8") for a
+            bigint or ("length", ">f8") for a double precision column
+    """
+    layout = [("_count", ">i2")]
+    for name, type_ in fields:
+        layout += [(f"_{name}_size", ">i4"), (name, type_)]
+    return np.dtype(layout)
+
+
+class BinaryCopyReader:
+    """File-like sink for psycopg2's cursor.copy_expert that decodes a
+    COPY ... TO STDOUT (FORMAT binary) stream into numpy arrays chunk by chunk.
+
+    Only whole rows of fixed width, non-null columns can be decoded, cast and filter
+    in the query accordingly. Every chunk_rows rows, on_chunk is called with a dict of
+    native-endian arrays by column name, so no Python object is created per row.
+    """
+
+    def __init__(
+        self,
+        fields: List[Tuple[str, str]],
+        on_chunk: Callable[[Dict[str, np.ndarray]], None],
+        chunk_rows: int = CHUNK_ROWS,
+    ):
+        self.fields = fields
+        self.dtype = row_dtype(fields)
+        self.on_chunk = on_chunk
+        self.chunk_bytes = chunk_rows * self.dtype.itemsize
+        self.buffer = bytearray()
+        self.header_read = False
+        self.rows = 0
+
+    def write(self, data: bytes):
+        self.buffer += data
+        if not self.header_read:
+            self.read_header()
+        if self.header_read and len(self.buffer) >= self.chunk_bytes:
+            self.decode()
+
+    def read_header(self):
+        if len(self.buffer) < HEADER_SIZE:
+            return
+        if bytes(self.buffer[: len(SIGNATURE)]) != SIGNATURE:
+            raise ValueError("Not a binary COPY stream")
+        extension = int.from_bytes(self.buffer[HEADER_SIZE - 4 : HEADER_SIZE], "big")
+        if len(self.buffer) < HEADER_SIZE + extension:
+            return
+        del self.buffer[: HEADER_SIZE + extension]
+        self.header_read = True
+
+    def decode(self):
+        """Decode all complete rows in the buffer and pass them to on_chunk."""
+        n = len(self.buffer) // self.dtype.itemsize
+        if n == 0:
+            return
+        size = n * self.dtype.itemsize
+        rows = np.frombuffer(bytes(self.buffer[:size]), dtype=self.dtype)
+        del self.buffer[:size]
+
+        # A NULL or variable width value would shift every following row
+        if (rows["_count"] != len(self.fields)).any() or any(
+            (rows[f"_{name}_size"] != np.dtype(type_).itemsize).any()
+            for name, type_ in self.fields
+        ):
+            raise ValueError(
+                f"Unexpected row layout after {self.rows} rows, COPY columns must be "
+                f"non-null {', '.join(type_ for _, type_ in self.fields)}"
+            )
+
+        self.rows += n
+        self.on_chunk(
+            {
+                name: rows[name].astype(np.dtype(type_).newbyteorder("="))
+                for name, type_ in self.fields
+            }
+        )
+
+    def close(self):
+        """Decode the remaining rows and check the stream ended with its trailer."""
+        if not self.header_read:
+            raise ValueError("Binary COPY stream ended before its header")
+        if bytes(self.buffer[-len(TRAILER) :]) != TRAILER:
+            raise ValueError("Binary COPY stream ended before its trailer")
+        del self.buffer[-len(TRAILER) :]
+        self.decode()
+        if self.buffer:
+            raise ValueError(f"{len(self.buffer)} trailing bytes in binary COPY stream")
+
+
+def copy_to_arrays(
+    connection,
+    query: str,
+    fields: List[Tuple[str, str]],
+    on_chunk: Callable[[Dict[str, np.ndarray]], None],
+    chunk_rows: int = CHUNK_ROWS,
+) -> int:
+    """Stream the result of a SELECT query through binary COPY into on_chunk.
+
+    Args:
+        connection: DBAPI (psycopg2) connection, e.g. engine.raw_connection()
+        query (str): SELECT returning exactly the given fields, non-null
+        fields: see row_dtype
+
+    Returns:
+        int: number of rows read
+    """
+    reader = BinaryCopyReader(fields, on_chunk, chunk_rows)
+    cursor = connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT (FORMAT binary)", reader)
+    finally:
+        cursor.close()
+    reader.close()
+    return reader.rows
@@ -1,10 +1,19 @@
-from typing import List
+from typing import List, Union
+import numpy as np
 from shapely.geometry import LineString, Point
-from sqlalchemy import create_engine, func, select, Table, MetaData
+from sqlalchemy import create_engine, text, Table, MetaData
 from sqlalchemy.orm import sessionmaker
-from geoalchemy2 import functions as geofunc
 import logging
 
+from utils.Shared.BinaryCopy import copy_to_arrays
+
+# Edge IDs are numbers for edges in OSM direction and "<number>_r" for reversed ones
+# (see make_gdf_directed). They are streamed as one bigint, negative when reversed.
+EDGE_KEY_SQL = r"""CASE WHEN id::text LIKE '%\_r'
+        THEN -left(id::text, -2)::bigint
+        ELSE id::text::bigint
+    END"""
+
 logger = logging.getLogger()
 logging.basicConfig(
     format="%(asctime)s %(levelname)-8s %(message)s",
@@ -53,41 +62,154 @@ class Edge:
 
 
 class Graph:
-    def __init__(self, db_url: str, tablename_nodes: str, tablename_edges: str):
+    def __init__(
+        self,
+        db_url: str,
+        tablename_nodes: str,
+        tablename_edges: str,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+    ):
+        """
+        Args:
+            pool_size (int): database connections kept open for lookups, size it to
+                the number of threads querying at once
+            max_overflow (int): extra connections opened under peak load
+        """
         logging.info("Graph instantiated")
-        self.engine = create_engine(db_url, echo=False)
+        self.engine = create_engine(
+            db_url,
+            echo=False,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            # Replace connections dropped by the server instead of failing a lookup
+            pool_pre_ping=True,
+        )
         self.Session = sessionmaker(bind=self.engine)
         self.session = self.Session()
         self.metadata = MetaData()
         self.nodes = Table(tablename_nodes, self.metadata, autoload_with=self.engine)
         self.edges = Table(tablename_edges, self.metadata, autoload_with=self.engine)
-        self.adjacency_list = self.load_graph()
+        self.create_spatial_index()
+
+        # Integer-indexed adjacency arrays, see load_graph
+        self.node_ids = np.empty(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.targets = np.empty(0, dtype=np.int32)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.edge_keys = np.empty(0, dtype=np.int64)
+        self.load_graph()
 
     def load_graph(self) -> None:
-        """Loads edges into a adjacency list for faster pathfinding into the class
+        """Stream the nodes and edges from PostGIS into adjacency arrays.
+
+        Rows are read with binary COPY and decoded chunk by chunk with numpy, so no
+        Python object is built per row and peak memory stays close to the final
+        arrays. The edges table holds both directions of two-way edges (see
+        make_gdf_directed). The result is a CSR layout: the edges leaving node
+        index i are targets[offsets[i]:offsets[i + 1]], with their lengths in
+        weights and their IDs in edge_keys (see edge_id). node_ids is sorted,
+        node_index() maps an ID to its index.
 
         Returns:
             None: None
         """
-        all_nodes = set(
-            row[0] for row in self.session.query(self.nodes.columns.id).all()
+        connection = self.engine.raw_connection()
+        try:
+            node_chunks = []
+            copy_to_arrays(
+                connection,
+                f'SELECT id::bigint FROM "{self.nodes.name}" WHERE id IS NOT NULL',
+                [("id", ">i8")],
+                lambda chunk: node_chunks.append(chunk["id"]),
+            )
+            self.node_ids = np.unique(np.concatenate(node_chunks or [self.node_ids]))
+            del node_chunks
+
+            # Node IDs are translated to indices per chunk, only compact index arrays
+            # are kept
+            source_chunks, target_chunks, weight_chunks, key_chunks = [], [], [], []
+            dropped = 0
+
+            def add_edges(chunk):
+                nonlocal dropped
+                sources = self.node_indices(chunk["u"])
+                targets = self.node_indices(chunk["v"])
+                known = (sources >= 0) & (targets >= 0)
+                dropped += int((~known).sum())
+                source_chunks.append(sources[known])
+                target_chunks.append(targets[known])
+                weight_chunks.append(chunk["length"][known])
+                key_chunks.append(chunk["key"][known])
+
+            n_rows = copy_to_arrays(
+                connection,
+                f"""SELECT u::bigint, v::bigint, length::double precision,
+                    {EDGE_KEY_SQL}
+                FROM "{self.edges.name}"
+                WHERE u IS NOT NULL AND v IS NOT NULL AND length IS NOT NULL
+                    AND id IS NOT NULL""",
+                [("u", ">i8"), ("v", ">i8"), ("length", ">f8"), ("key", ">i8")],
+                add_edges,
+            )
+        finally:
+            connection.close()
+
+        if dropped:
+            logging.warning(f"Skipped {dropped} edges with an unknown u or v node")
+
+        sources = np.concatenate(source_chunks or [self.targets])
+        del source_chunks
+
+        # Sort edges by source node so each node's edges are contiguous
+        order = np.argsort(sources, kind="stable")
+        self.offsets = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(sources, minlength=len(self.node_ids)), out=self.offsets[1:]
+        )
+        del sources
+        self.targets = np.concatenate(target_chunks or [self.targets])[order]
+        self.weights = np.concatenate(weight_chunks or [self.weights])[order]
+        self.edge_keys = np.concatenate(key_chunks or [self.edge_keys])[order]
+
+        logging.info(
+            f"Loaded {len(self.node_ids)} nodes and {len(self.targets)} of {n_rows} "
+            f"edges ({self.nbytes / 2**20:.1f} MB)"
         )
 
-        # Query edges
-        results = self.session.query(
-            self.edges.columns.u,
-            self.edges.columns.v,
-            self.edges.columns.length,
-        ).all()
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.node_ids,
+                self.offsets,
+                self.targets,
+                self.weights,
+                self.edge_keys,
+            )
+        )
 
-        # Construct the adjacency list
-        adjacency_list = {
-            node: [] for node in all_nodes
-        }  # Initialize all nodes, even if they don't act as a start node
-        for start_node, end_node, weight in results:
-            adjacency_list[start_node].append((end_node, weight))
+    def edge_id(self, slot: int) -> str:
+        """ID of the edge at an adjacency slot, as stored in the edges table."""
+        key = int(self.edge_keys[slot])
+        return f"{-key}_r" if key < 0 else str(key)
+
+    def node_indices(self, node_ids: np.ndarray) -> np.ndarray:
+        """Indices of node IDs in the adjacency arrays, -1 for unknown IDs."""
+        indices = np.searchsorted(self.node_ids, node_ids)
+        indices = np.minimum(indices, max(len(self.node_ids) - 1, 0))
+        known = (
+            self.node_ids[indices] == node_ids
+            if len(self.node_ids)
+            else np.zeros(len(node_ids), dtype=bool)
+        )
+        return np.where(known, indices, -1).astype(np.int32)
 
-        return adjacency_list
+    def node_index(self, node_id) -> Union[int, None]:
+        """Index of a node ID in the adjacency arrays, or None if unknown."""
+        index = int(self.node_indices(np.asarray([int(node_id)], dtype=np.int64))[0])
+        return index if index >= 0 else None
 
     # This one is redundant. Bit leep
     def get_bounding_box_query(
@@ -99,34 +221,88 @@ class Graph:
 
         return bbox_query
 
-    def closest_node(self, lat: float, lon: float) -> int:
-        session = self.Session()
+    def create_spatial_index(self) -> None:
+        """Create the GiST index on the node geometries that the nearest node
+        lookups need, unless the table already has one."""
+        table = self.nodes.name
+        with self.engine.begin() as connection:
+            exists = connection.execute(
+                text(
+                    """SELECT 1 FROM pg_indexes
+                    WHERE tablename = :table AND indexdef ILIKE '%USING gist (geom)%'"""
+                ),
+                {"table": table},
+            ).first()
+            if exists:
+                return
 
-        # Construct a point representation of the input lat and lon
-        point = f"POINT({lon} {lat})"
-
-        query = (
-            select(self.nodes.c.id)
-            .order_by(
-                func.ST_Distance(
-                    geofunc.ST_GeomFromText(point, 4326),
-                    self.nodes.c.geom,
-                )
+            logging.info(f"Creating spatial index on {table}")
+            connection.execute(
+                text(f'CREATE INDEX "idx_{table}_geom" ON "{table}" USING GIST (geom)')
             )
-            .limit(1)
-        )
+            # Fresh statistics so the planner picks the index
+            connection.execute(text(f'ANALYZE "{table}"'))
+
+    def closest_node(self, lat: float, lon: float) -> Union[int, None]:
+        """ID of the node closest to a point, or None if the table is empty.
 
-        result = session.execute(query).mappings().all()
+        Ordering by the <-> distance operator lets PostGIS walk the GiST index and
+        stop at the first node instead of measuring the distance to every node.
+        """
+        query = text(
+            f"""SELECT id FROM "{self.nodes.name}"
+            ORDER BY geom <-> ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)
+            LIMIT 1"""
+        )
 
-        # session.close()
+        # Connections are borrowed from the engine's pool and returned on exit
+        with self.engine.connect() as connection:
+            node_id = connection.execute(query, {"lat": lat, "lon": lon}).scalar()
 
-        if result:
-            node_id = result[0]["id"]
-            logging.info(f"Closest node to point {(lat, lon)} is {node_id}")
-            return node_id
-        else:
+        if node_id is None:
             logging.info("Result is None")
-            return None
+        return node_id
+
+    def closest_nodes(
+        self, lats: List[float], lons: List[float]
+    ) -> List[Union[int, None]]:
+        """IDs of the nodes closest to many points, in one round trip.
+
+        The points are sent as two arrays and unnested, a LATERAL subquery does one
+        index-backed KNN lookup per point.
+
+        Returns:
+            List[Union[int, None]]: one node ID per point, in input order
+        """
+        if len(lats) != len(lons):
+            raise ValueError("Expected as many latitudes as longitudes")
+        if not len(lats):
+            return []
+
+        query = text(
+            f"""SELECT point.i, nearest.id
+            FROM unnest(
+                CAST(:lons AS double precision[]), CAST(:lats AS double precision[])
+            ) WITH ORDINALITY AS point(lon, lat, i)
+            CROSS JOIN LATERAL (
+                SELECT id FROM "{self.nodes.name}"
+                ORDER BY geom <-> ST_SetSRID(ST_MakePoint(point.lon, point.lat), 4326)
+                LIMIT 1
+            ) AS nearest"""
+        )
+        parameters = {
+            "lats": [float(lat) for lat in lats],
+            "lons": [float(lon) for lon in lons],
+        }
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(query, parameters).all()
+
+        node_ids = [None] * len(lats)
+        for i, node_id in rows:
+            # WITH ORDINALITY counts from 1
+            node_ids[i - 1] = node_id
+        return node_ids
 
     def close_session(self):
         self.session.close()
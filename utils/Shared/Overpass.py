@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Union
+
+import overpy
+
+# Public instance, OVERPASS_URL points the client elsewhere (a mirror or a test stub)
+DEFAULT_ENDPOINT = "https://overpass-api.de/api/interpreter"
+
+DEFAULT_CACHE_PATH = os.path.join("data", "cache", "overpass.sqlite")
+
+# Cached tags older than this are fetched again
+MAX_AGE_SECONDS = 30 * 24 * 3600
+
+# Rate limiting, timeouts, other server errors and dropped connections
+RETRY_EXCEPTIONS = (
+    overpy.exception.OverpassTooManyRequests,
+    overpy.exception.OverpassGatewayTimeout,
+    overpy.exception.OverpassUnknownHTTPStatusCode,
+    OSError,
+)
+
+
+class RateLimiter:
+    """Spaces out calls from any number of threads to at most rate per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = max(self.next_call - now, 0)
+            self.next_call = max(self.next_call, now) + self.interval
+        time.sleep(delay)
+
+
+class TagCache:
+    """Tags per way ID in an SQLite file, with the time they were fetched.
+
+    Ways Overpass did not return (deleted since the extract) are stored without
+    tags, so they are not asked for again until they go stale.
+    """
+
+    def __init__(self, path: str, max_age: float = MAX_AGE_SECONDS):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS ways (
+                    id INTEGER PRIMARY KEY, tags TEXT, fetched REAL NOT NULL
+                )"""
+            )
+
+    def get(self, way_ids: List[int]) -> Dict[int, Union[dict, None]]:
+        """Tags of the given ways that are cached and fresh."""
+        cached = {}
+        oldest = time.time() - self.max_age
+        with self.lock:
+            # Stays below SQLite's limit on query parameters
+            for i in range(0, len(way_ids), 500):
+                batch = way_ids[i : i + 500]
+                rows = self.connection.execute(
+                    f"""SELECT id, tags FROM ways WHERE fetched >= ?
+                    AND id IN ({", ".join("?" * len(batch))})""",
+                    [oldest, *batch],
+                )
+                for way_id, tags in rows:
+                    cached[way_id] = json.loads(tags) if tags is not None else None
+        return cached
+
+    def put(self, tags: Dict[int, Union[dict, None]]):
+        fetched = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO ways (id, tags, fetched) VALUES (?, ?, ?)",
+                [
+                    (
+                        way_id,
+                        json.dumps(way_tags) if way_tags is not None else None,
+                        fetched,
+                    )
+                    for way_id, way_tags in tags.items()
+                ],
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+class OverpassClient:
+    def __init__(
+        self,
+        endpoint: Union[str, None] = None,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        max_age: float = MAX_AGE_SECONDS,
+        batch_size: int = 1000,
+        workers: int = 2,
+        rate: float = 1.0,
+        max_retries: int = 5,
+        backoff: float = 2.0,
+    ):
+        """Fetches the OSM tags of ways from an Overpass API, through a cache.
+
+        Args:
+            endpoint (str): Overpass interpreter URL, defaults to $OVERPASS_URL or
+                the public instance
+            cache_path (str): SQLite file caching tags between runs
+            max_age (float): seconds before cached tags are fetched again
+            batch_size (int): way IDs per query
+            workers (int): queries running at once, public instances allow few
+            rate (float): queries started per second at most, over all workers
+            max_retries (int): retries of a query the server rejected or dropped
+            backoff (float): seconds before the first retry, doubled on each retry
+        """
+        self.endpoint = endpoint or os.environ.get("OVERPASS_URL", DEFAULT_ENDPOINT)
+        self.api = overpy.Overpass(url=self.endpoint, max_retry_count=0)
+        self.cache = TagCache(cache_path, max_age)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def way_tags(self, way_ids: Iterable[int]) -> Dict[int, Union[dict, None]]:
+        """Tags per way ID, None for ways Overpass does not know.
+
+        Cached ways are not fetched again, the others are fetched in batches of
+        batch_size, workers at a time.
+        """
+        way_ids = list(dict.fromkeys(int(way_id) for way_id in way_ids))
+        tags = self.cache.get(way_ids)
+        missing = [way_id for way_id in way_ids if way_id not in tags]
+        logging.info(
+            f"{len(tags)} of {len(way_ids)} ways cached, fetching {len(missing)} "
+            f"from {self.endpoint}"
+        )
+
+        batches = [
+            missing[i : i + self.batch_size]
+            for i in range(0, len(missing), self.batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for done, fetched in enumerate(pool.map(self.fetch, batches), 1):
+                self.cache.put(fetched)
+                tags.update(fetched)
+                logging.info(f"Fetched {done} of {len(batches)} batches")
+        return tags
+
+    def fetch(self, way_ids: List[int]) -> Dict[int, Union[dict, None]]:
+        """Tags of a batch of ways from Overpass, retried with exponential backoff."""
+        query = f"[out:json];way(id:{','.join(map(str, way_ids))});out tags;"
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            try:
+                result = self.api.query(query)
+                break
+            except RETRY_EXCEPTIONS as e:
+                if attempt == self.max_retries:
+                    raise
+                # Jitter keeps the workers from retrying in lockstep
+                delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+                logging.warning(
+                    f"Overpass query failed ({e!r}), retry in {delay:.1f} s"
+                )
+                time.sleep(delay)
+
+        tags = {way_id: None for way_id in way_ids}
+        for way in result.ways:
+            tags[way.id] = dict(way.tags)
+        return tags
+
+    def close(self):
+        self.cache.close()
@@ -1,15 +1,31 @@
+from collections import OrderedDict
 from typing import Union, List
 from utils.Shared.Graph import Graph
 
 from matplotlib.collections import LineCollection
 import heapq
+import math
 import matplotlib.pyplot as plt
-from sqlalchemy import text, or_
-from sqlalchemy.sql.functions import func
+import threading
+from sqlalchemy import text
 
 from utils.Shared import Graph
 import logging
+import numpy as np
+import shapely
 from shapely import wkb
+from shapely.geometry import LineString
+
+# Nodes whose edges are fetched per query in shortest_path_dijkstra_sql
+SQL_BATCH_SIZE = 256
+
+# Scales the straight-line heuristic so rounded edge lengths never make it overestimate
+HEURISTIC_SLACK = 0.999
+
+EARTH_RADIUS_M = 6371008.8
+
+# Edge geometries kept in memory by get_route_geometries
+GEOMETRY_CACHE_SIZE = 10000
 
 logger = logging.getLogger()
 logging.basicConfig(
@@ -19,22 +35,62 @@ logging.basicConfig(
 )
 
 
+def haversine(point1: tuple, point2: tuple) -> float:
+    """Great-circle distance in meters between two (lon, lat) points."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (*point1, *point2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
 class Pathfinder:
-    def __init__(self, graph: Graph, priority: Union[dict, None] = None):
+    def __init__(
+        self,
+        graph: Graph,
+        priority: Union[dict, None] = None,
+        geometry_cache_size: int = GEOMETRY_CACHE_SIZE,
+    ):
+        """
+        Args:
+            geometry_cache_size (int): most recently used edge geometries kept by
+                get_route_geometries, 0 disables the cache
+        """
         self.graph = graph
         self.priority = priority
+        self.geometry_cache = OrderedDict()
+        self.geometry_cache_size = geometry_cache_size
+        self.geometry_cache_lock = threading.Lock()
         self.__quote = "Who's ready to fly on a zipline? ..I am!"
 
-    def shortest_path_dijkstra(self, start_node_id, end_node_id):
-        # Initialize shortest paths to a high value (infinity) and set start_node's distance to 0
-        shortest_paths = {node: float("infinity") for node in self.graph.adjacency_list}
-        shortest_paths[start_node_id] = 0
+    def shortest_path_dijkstra(self, start_node_id, end_node_id, with_edges=False):
+        """Shortest path over the graph's adjacency arrays.
+
+        Args:
+            with_edges (bool): also return the IDs of the edges along the path, for
+                get_route_geometries
 
-        # This dictionary will store the previous node for each node, useful for retracing our path
-        previous_nodes = {node: None for node in self.graph.adjacency_list}
+        Returns:
+            tuple: (node IDs along the path, total length), plus the edge IDs if
+                with_edges, or None if there is no path
+        """
+        offsets, targets, weights = (
+            self.graph.offsets,
+            self.graph.targets,
+            self.graph.weights,
+        )
+        start_node = self.graph.node_index(start_node_id)
+        end_node = self.graph.node_index(end_node_id)
+        if start_node is None or end_node is None:
+            return None
+
+        # Distances and (previous node, edge slot) of the node indices reached so far
+        shortest_paths = {start_node: 0}
+        previous_nodes = {start_node: (None, None)}
 
         # Priority queue to keep track of nodes to be evaluated
-        priority_queue = [(0, start_node_id)]
+        priority_queue = [(0, start_node)]
 
         # Set to keep track of visited nodes
         visited = set()
@@ -43,13 +99,19 @@ class Pathfinder:
             # Get node with lowest distance from priority_queue
             current_distance, current_node = heapq.heappop(priority_queue)
 
-            # If the current_node is the end_node_id, we've found our path
-            if current_node == end_node_id:
-                path = []
-                while current_node:
-                    path.append(current_node)
-                    current_node = previous_nodes[current_node]
-                return path[::-1], shortest_paths[end_node_id]  # Return reversed path
+            # If the current_node is the end_node, we've found our path
+            if current_node == end_node:
+                path, slots = [], []
+                while current_node is not None:
+                    path.append(int(self.graph.node_ids[current_node]))
+                    current_node, slot = previous_nodes[current_node]
+                    if slot is not None:
+                        slots.append(slot)
+                # Return reversed path
+                if with_edges:
+                    edge_ids = [self.graph.edge_id(slot) for slot in reversed(slots)]
+                    return path[::-1], shortest_paths[end_node], edge_ids
+                return path[::-1], shortest_paths[end_node]
 
             # If we've already visited this node, skip
             if current_node in visited:
@@ -57,77 +119,238 @@ class Pathfinder:
 
             visited.add(current_node)
 
-            for neighbor, edge_weight in self.graph.adjacency_list[current_node]:
+            lo, hi = offsets[current_node], offsets[current_node + 1]
+            for slot, neighbor, edge_weight in zip(
+                range(lo, hi), targets[lo:hi].tolist(), weights[lo:hi].tolist()
+            ):
                 distance = current_distance + edge_weight
 
                 # If new path to neighbor is shorter, update the shortest distance and previous node for the neighbor
-                if distance < shortest_paths[neighbor]:
+                if distance < shortest_paths.get(neighbor, float("infinity")):
                     shortest_paths[neighbor] = distance
-                    previous_nodes[neighbor] = current_node
+                    previous_nodes[neighbor] = (current_node, slot)
                     heapq.heappush(priority_queue, (distance, neighbor))
 
         return None  # If no path found, return None
 
     def shortest_path_dijkstra_sql(
-        self, start_node_id: str, end_node_id: str
-    ) -> List[int]:
-        query = f"""
-            WITH RECURSIVE dijkstra AS (
-                SELECT 
-                    u AS start_node, 
-                    v AS end_node, 
-                    ARRAY[u] as path, 
-                    length AS weight 
-                FROM 
-                    "{self.graph.edges.name}"
-                WHERE 
-                    u = {start_node_id}
-
-                UNION ALL
-
-                SELECT 
-                    e.u AS start_node,
-                    e.v AS end_node,
-                    d.path || e.v,
-                    d.weight + e.length
-                FROM 
-                    "{self.graph.edges.name}" e
-                INNER JOIN dijkstra d ON e.u = d.end_node 
-                WHERE 
-                    NOT e.v = ANY(d.path)
-            )
-            SELECT 
-                start_node, 
-                end_node, 
-                path, 
-                weight 
-            FROM 
-                dijkstra
-            WHERE 
-                end_node = {end_node_id}
-            ORDER BY 
-                weight LIMIT 1;
+        self,
+        start_node_id: int,
+        end_node_id: int,
+        max_cost: Union[float, None] = None,
+        astar: bool = True,
+        batch_size: int = SQL_BATCH_SIZE,
+        with_edges: bool = False,
+    ) -> Union[tuple, None]:
+        """Shortest path computed against the database, without loading the graph.
+
+        A Dijkstra (or A*) search that fetches edges on demand: when it reaches a
+        node whose edges are not known yet, it fetches the edges of that node and of
+        the next batch_size - 1 frontier nodes in one indexed query on the u column.
+        Only the part of the graph the search explores is transferred.
 
+        Args:
+            max_cost (float): give up on paths longer than this many meters, bounding
+                the search when the end node is far away or unreachable
+            astar (bool): guide the search with the straight-line distance to the end
+                node, which needs node coordinates and explores far fewer nodes
+            batch_size (int): nodes whose edges are fetched per query
+            with_edges (bool): also return the IDs of the edges along the path
+
+        Returns:
+            tuple: (node IDs along the path, total length), plus the edge IDs if
+                with_edges, or None if there is no path within max_cost
         """
+        with self.graph.engine.connect() as connection:
+            end_point = None
+            if astar:
+                end_point = self.fetch_coordinates(connection, [end_node_id]).get(
+                    end_node_id
+                )
+                if end_point is None:
+                    return None
+
+            def heuristic(point):
+                if end_point is None:
+                    return 0
+                return HEURISTIC_SLACK * haversine(point, end_point)
+
+            # Edges (v, length, v coordinates, edge ID) of the nodes fetched so far
+            adjacency = {}
+            shortest_paths = {start_node_id: 0}
+            previous_nodes = {start_node_id: (None, None)}
+            priority_queue = [(0, 0, start_node_id)]
+            visited = set()
+            queries = 0
+
+            while priority_queue:
+                _, current_distance, current_node = heapq.heappop(priority_queue)
 
-        result = self.graph.session.execute(text(query)).mappings().all()
+                if current_node == end_node_id:
+                    path, edge_ids = [], []
+                    while current_node is not None:
+                        path.append(current_node)
+                        current_node, edge_id = previous_nodes[current_node]
+                        if edge_id is not None:
+                            edge_ids.append(edge_id)
+                    logging.info(
+                        f"Found path in {queries} queries, {len(visited)} nodes visited"
+                    )
+                    if with_edges:
+                        return path[::-1], shortest_paths[end_node_id], edge_ids[::-1]
+                    return path[::-1], shortest_paths[end_node_id]
 
-        return result
+                if current_node in visited:
+                    continue
+                if max_cost is not None and current_distance > max_cost:
+                    break
+                visited.add(current_node)
 
-    def get_route_geometries(self, route):
-        route_set = set(route)
+                if current_node not in adjacency:
+                    # Prefetch the edges of the nodes most likely to be expanded next
+                    batch = [current_node] + [
+                        node
+                        for _, _, node in heapq.nsmallest(
+                            batch_size - 1, priority_queue
+                        )
+                        if node not in adjacency and node not in visited
+                    ]
+                    fetched = self.fetch_edges(connection, batch, with_points=astar)
+                    for node in batch:
+                        adjacency[node] = fetched.get(node, [])
+                    queries += 1
 
-        # Query for edge geometries where either 'u' or 'v' is in the route
-        geoms_query = self.graph.session.query(
-            func.ST_AsGeoJSON(self.graph.edges.c.geom)
-        ).filter(
-            or_(
-                self.graph.edges.c.u.in_(route_set), self.graph.edges.c.v.in_(route_set)
+                for neighbor, edge_weight, point, edge_id in adjacency[current_node]:
+                    distance = current_distance + edge_weight
+                    if distance < shortest_paths.get(neighbor, float("infinity")):
+                        shortest_paths[neighbor] = distance
+                        previous_nodes[neighbor] = (current_node, edge_id)
+                        heapq.heappush(
+                            priority_queue,
+                            (distance + heuristic(point), distance, neighbor),
+                        )
+
+        logging.info(f"No path found in {queries} queries")
+        return None
+
+    def fetch_edges(self, connection, node_ids: List[int], with_points: bool) -> dict:
+        """Outgoing edges of the given nodes, as node ID -> [(v, length, (lon, lat)
+        of v or None, edge ID)]."""
+        if with_points:
+            query = text(
+                f"""SELECT e.u, e.v, e.length, ST_X(n.geom), ST_Y(n.geom), e.id
+                FROM "{self.graph.edges.name}" e
+                JOIN "{self.graph.nodes.name}" n ON n.id = e.v
+                WHERE e.u = ANY(:nodes) AND e.length IS NOT NULL"""
+            )
+        else:
+            query = text(
+                f"""SELECT u, v, length, NULL, NULL, id
+                FROM "{self.graph.edges.name}"
+                WHERE u = ANY(:nodes) AND length IS NOT NULL"""
             )
+
+        edges = {}
+        for u, v, length, lon, lat, edge_id in connection.execute(
+            query, {"nodes": list(node_ids)}
+        ):
+            point = (lon, lat) if lon is not None else None
+            edges.setdefault(u, []).append((v, length, point, str(edge_id)))
+        return edges
+
+    def fetch_coordinates(self, connection, node_ids: List[int]) -> dict:
+        """Node ID -> (lon, lat) of the given nodes."""
+        query = text(
+            f"""SELECT id, ST_X(geom), ST_Y(geom) FROM "{self.graph.nodes.name}"
+            WHERE id = ANY(:nodes)"""
         )
+        return {
+            node_id: (lon, lat)
+            for node_id, lon, lat in connection.execute(
+                query, {"nodes": list(node_ids)}
+            )
+        }
+
+    def get_route_geometries(self, edge_ids: List[str], merge: bool = False):
+        """Geometries of the edges along a route, in route order.
+
+        Geometries are cached by edge ID, the missing ones are fetched as WKB, which
+        is cheaper to parse than GeoJSON, in one query on the indexed id column.
+        Reversed edges ("<number>_r") share the geometry of their OSM direction, so
+        they are flipped to point the way the route travels.
+
+        Args:
+            edge_ids (List[str]): edge IDs along the route, as returned by
+                shortest_path_dijkstra(..., with_edges=True)
+            merge (bool): join the pieces into a single line
 
-        geoms = [row[0] for row in geoms_query.all()]
-        return geoms
+        Returns:
+            list: a shapely LineString per edge, or one LineString if merge
+        """
+        geometries = {}
+        with self.geometry_cache_lock:
+            for edge_id in edge_ids:
+                if edge_id in self.geometry_cache:
+                    self.geometry_cache.move_to_end(edge_id)
+                    geometries[edge_id] = self.geometry_cache[edge_id]
+
+        missing = [
+            edge_id for edge_id in dict.fromkeys(edge_ids) if edge_id not in geometries
+        ]
+        if missing:
+            # Compared on the column's own type, a cast would keep its index unused
+            query = text(
+                f"""SELECT id::text, ST_AsBinary(geom) FROM "{self.graph.edges.name}"
+                WHERE id = ANY(:ids)"""
+            )
+            with self.graph.engine.connect() as connection:
+                rows = connection.execute(query, {"ids": self.edge_id_values(missing)})
+                for edge_id, geometry in rows:
+                    geometries[edge_id] = wkb.loads(bytes(geometry))
+
+            with self.geometry_cache_lock:
+                for edge_id in missing:
+                    if edge_id in geometries and self.geometry_cache_size > 0:
+                        self.geometry_cache[edge_id] = geometries[edge_id]
+                while len(self.geometry_cache) > self.geometry_cache_size:
+                    self.geometry_cache.popitem(last=False)
+
+        unknown = [edge_id for edge_id in edge_ids if edge_id not in geometries]
+        if unknown:
+            raise KeyError(f"Unknown edge IDs: {', '.join(unknown[:10])}")
+
+        route = [
+            shapely.reverse(geometries[edge_id])
+            if edge_id.endswith("_r")
+            else geometries[edge_id]
+            for edge_id in edge_ids
+        ]
+        if not merge:
+            return route
+        if not route:
+            return LineString()
+        # Consecutive edges share their joint, which is kept once
+        points = [shapely.get_coordinates(route[0])]
+        for line in route[1:]:
+            coordinates = shapely.get_coordinates(line)
+            if np.array_equal(coordinates[0], points[-1][-1]):
+                coordinates = coordinates[1:]
+            points.append(coordinates)
+        return LineString(np.concatenate(points))
+
+    def edge_id_values(self, edge_ids: List[str]) -> list:
+        """Edge IDs as values of the edges table's id column type.
+
+        Tables written by make_gdf_directed store IDs as text, a numeric id column
+        only holds edges in OSM direction, so reversed IDs cannot match there.
+        """
+        try:
+            python_type = self.graph.edges.c.id.type.python_type
+        except NotImplementedError:
+            python_type = str
+        if python_type is int:
+            return [int(edge_id) for edge_id in edge_ids if edge_id.isdigit()]
+        return list(edge_ids)
 
     # def plot_route(
     #     self,
@@ -0,0 +1,167 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Tuple, Union
+
+import geopandas as gpd
+
+# What a stage returns: GeoDataFrames by name, e.g. {"nodes": ..., "edges": ...}
+Frames = Dict[str, gpd.GeoDataFrame]
+
+
+# Bytes read at a time by file_fingerprint
+FINGERPRINT_BLOCK_SIZE = 1 << 20
+
+
+def file_fingerprint(path: str) -> dict:
+    """Identifies a version of a file by a hash of its content.
+
+    The whole file is hashed, which takes seconds for a country extract, a small
+    part of parsing it. Touching or copying a file does not change its fingerprint,
+    replacing it by a download of the same size does.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FINGERPRINT_BLOCK_SIZE), b""):
+            digest.update(block)
+    return {"path": path, "size": os.path.getsize(path), "sha256": digest.hexdigest()}
+
+
+def run_in_worker(cache, name: str, key: str, function: Callable, args: tuple):
+    # Returns nothing so the frames are not pickled back to the parent process
+    cache.run_stage(name, key, function, args)
+
+
+class StageCache:
+    """Checkpoints of pipeline stages, as GeoParquet files keyed by a hash of the
+    stage's inputs.
+
+    A stage is only run when no checkpoint exists for its current inputs. Inputs are
+    anything JSON serializable that determines the result: file fingerprints,
+    settings and the keys of the stages it reads from (see keys), so a change
+    reruns the stage and everything after it.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # Key of each stage run or loaded so far, by stage name
+        self.keys: Dict[str, str] = {}
+
+    def key(self, name: str, inputs) -> str:
+        payload = json.dumps([name, inputs], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def path(self, name: str, key: str, part: Union[str, None] = None) -> str:
+        # Stage names are used in file names, "-" separates the key
+        stem = re.sub(r"\W+", "_", name) + f"-{key}"
+        return os.path.join(
+            self.directory, f"{stem}-{part}.parquet" if part else f"{stem}.json"
+        )
+
+    def load(self, name: str, key: str) -> Union[Frames, None]:
+        """The checkpoint of a stage for a key, or None if there is none."""
+        manifest = self.path(name, key)
+        if not os.path.exists(manifest):
+            return None
+        with open(manifest) as f:
+            parts = json.load(f)["parts"]
+        return {part: gpd.read_parquet(self.path(name, key, part)) for part in parts}
+
+    def save(self, name: str, key: str, frames: Frames):
+        for part, frame in frames.items():
+            path = self.path(name, key, part)
+            frame.to_parquet(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+        # The manifest is written last, so an interrupted stage is run again
+        manifest = self.path(name, key)
+        with open(manifest + ".tmp", "w") as f:
+            json.dump({"name": name, "parts": list(frames)}, f)
+        os.replace(manifest + ".tmp", manifest)
+
+        # Checkpoints of earlier inputs of the stage are not used anymore
+        prefix = os.path.basename(manifest)[: -len(".json")]
+        stem = prefix.rsplit("-", 1)[0]
+        for path in glob.glob(os.path.join(self.directory, f"{stem}-*")):
+            if not os.path.basename(path).startswith(prefix):
+                os.remove(path)
+
+    def run_stage(self, name: str, key: str, function: Callable, args: tuple):
+        frames = function(*args)
+        self.save(name, key, frames)
+        return frames
+
+    def run(
+        self,
+        name: str,
+        inputs,
+        function: Callable,
+        *args,
+        force: bool = False,
+        outputs_exist: Union[Callable[[], bool], None] = None,
+    ) -> Frames:
+        """Result of function(*args), from the checkpoint if inputs are unchanged.
+
+        Args:
+            name (str): stage name, one checkpoint is kept per name
+            inputs: everything the result depends on, see StageCache
+            force (bool): run the stage even if a checkpoint exists
+            outputs_exist (Callable): for stages writing files or database tables,
+                whether these are still in place. The stage is run again if not,
+                even if its inputs did not change.
+        """
+        key = self.keys[name] = self.key(name, inputs)
+        frames = None if force else self.load(name, key)
+        if frames is not None and outputs_exist is not None and not outputs_exist():
+            logging.info(f"Outputs of stage {name} are missing")
+            frames = None
+        if frames is not None:
+            logging.info(f"Stage {name} unchanged, loaded checkpoint {key}")
+            return frames
+
+        logging.info(f"Running stage {name}")
+        return self.run_stage(name, key, function, args)
+
+    def run_parallel(
+        self,
+        stages: List[Tuple[str, dict, Callable, tuple]],
+        workers: int,
+        force: bool = False,
+    ) -> List[Frames]:
+        """Run independent stages in worker processes, see run.
+
+        Each worker writes its own checkpoint, which is then read here, so results
+        are not pickled back. Functions must be importable (module level).
+
+        Args:
+            stages: (name, inputs, function, args) per stage
+
+        Returns:
+            List[Frames]: the result of each stage, in order
+        """
+        pending = []
+        for name, inputs, function, args in stages:
+            key = self.keys[name] = self.key(name, inputs)
+            if force or not os.path.exists(self.path(name, key)):
+                pending.append((name, key, function, args))
+            else:
+                logging.info(f"Stage {name} unchanged, using checkpoint {key}")
+
+        if pending:
+            logging.info(
+                f"Running stages {', '.join(name for name, *_ in pending)} with "
+                f"{workers} workers"
+            )
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(run_in_worker, self, *stage) for stage in pending
+                ]
+                for future in futures:
+                    future.result()
+
+        return [self.load(name, self.keys[name]) for name, *_ in stages]
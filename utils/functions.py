@@ -3,15 +3,29 @@ import pandas as pd
 import matplotlib.patches as mpatches
 import matplotlib.colors as mcolors
 import matplotlib.cm as cm
-import overpy
-import time
 import os
+import io
 import numpy as np
+import shapely
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine, text
-from geoalchemy2 import Geometry, WKTElement
 import geopandas as gpd
 import logging
 
+from utils.Shared.Overpass import OverpassClient
+
+# Coordinate system of all geometries in the database
+SRID = 4326
+
+# Rows per COPY in write_geodf_to_postgis, and the number of COPYs run at once
+COPY_CHUNK_ROWS = 50000
+COPY_WORKERS = min(4, os.cpu_count() or 1)
+# Marks missing values in the CSV streamed by copy_chunk
+COPY_NULL = r"\N"
+
+# Assigned by CategoryRules when no rule matches an edge
+DEFAULT_CATEGORY = "Road without bike lane"
+
 logger = logging.getLogger()
 logging.basicConfig(
     format="%(asctime)s %(levelname)-8s %(message)s",
@@ -20,128 +34,143 @@ logging.basicConfig(
 )
 
 
-def enrich_graph_with_osm_tags(G, categories, batch_size=1000):
-    # Enrich data in G
-    api = overpy.Overpass()
-
-    n_edges = len(G.edges)
-
-    edges = [(u, v, key, data) for u, v, key, data in G.edges(keys=True, data=True)]
-
-    counter = 0
-    for i in range(0, len(edges), batch_size):
-        batch = edges[i : i + batch_size]
-
-        # Construct a query for all edges in the batch
-        query = "("
-        for u, v, key, data in batch:
-            osmid = data["osmid"]
-            query += f"way({osmid});"
-        query += "); out body;"
-
-        # Query the Overpass API
-        result = api.query(query)
+def enrich_graph_with_osm_tags(G, rules, client: OverpassClient = None):
+    """Add the OSM tags of each edge's way(s) to its data and categorize it.
 
-        # Process the response
-        for way in result.ways:
-            for u, v, key, data in batch:
-                if str(data["osmid"]) == str(way.id):
-                    for tag in way.tags:
-                        # Add each tag as a separate data point in the edge data
-                        G[u][v][key][tag] = way.tags[tag]
+    Edges are indexed by way ID, so each way is fetched once however many edges it
+    was split into, and its tags are applied to all of them.
 
-                    # Categorize the type of road, for bicycles
-                    data["bike_category"] = categorize_edge(data, categories)
-                    # print(data["bike_category"])
-
-        counter += batch_size
-
-        print(counter / n_edges, end="\r")
-        time.sleep(2)
+    Args:
+        G: OSMnx MultiDiGraph, edges with a list of osmids get the tags of each way
+        rules (CategoryRules): sets the bike_category of each tagged edge
+        client (OverpassClient): defaults to a client on the public Overpass API
+    """
+    edges_by_way = {}
+    for _, _, data in G.edges(data=True):
+        osmids = data["osmid"] if isinstance(data["osmid"], list) else [data["osmid"]]
+        for osmid in osmids:
+            edges_by_way.setdefault(int(osmid), []).append(data)
+
+    tags = (client or OverpassClient()).way_tags(edges_by_way)
+
+    for way_id, edges in edges_by_way.items():
+        if tags.get(way_id) is None:
+            continue
+        for data in edges:
+            # Add each tag as a separate data point in the edge data
+            data.update(tags[way_id])
+            # Categorize the type of road, for bicycles
+            data["bike_category"] = rules.categorize(data)
 
     return G
 
 
-def assign_categories(gdf, categories, category_type):
-    def check_criteria(row):
-        for category in categories:
-            criteria = category["criteria"]
-            if criteria is None:
-                continue
-            if all(row.get(key) == value for key, value in criteria.items()):
-                return category[category_type]
+class CategoryRules:
+    """The rules of categories.json, compiled once for categorize_edges and
+    enrich_graph_with_osm_tags.
 
-        return "Road without bike lane"
+    Rules are tried in order, the first whose criteria all match an edge decides its
+    category and parent. Their scores are included when the rules have categoryScore
+    and parentScore (see populate_db.py), NaN for categories without one.
+    """
 
-    gdf[category_type] = gdf.apply(check_criteria, axis=1)
+    def __init__(self, categories: list, fields=("category", "parent")):
+        rules = [
+            category for category in categories if category["criteria"] is not None
+        ]
+        self.criteria = [tuple(rule["criteria"].items()) for rule in rules]
+        self.conditions = list(dict.fromkeys(c for rule in self.criteria for c in rule))
+
+        # Value per rule of each assigned column, the last entry is for no match
+        names = {
+            field: [rule[field] for rule in rules] + [DEFAULT_CATEGORY]
+            for field in fields
+        }
+        self.values = {field: np.array(names[field], dtype=object) for field in fields}
+        for field in fields:
+            scores = {
+                category[field]: category[f"{field}Score"]
+                for category in categories
+                if f"{field}Score" in category
+            }
+            if scores:
+                self.values[f"{field}Score"] = (
+                    pd.Series(names[field]).map(scores).to_numpy()
+                )
+
+    def match(self, data: dict) -> int:
+        """Index of the first rule matching an edge's tags."""
+        for i, criteria in enumerate(self.criteria):
+            if all(data.get(column) == value for column, value in criteria):
+                return i
+        return len(self.criteria)
+
+    def match_rows(self, df: pd.DataFrame) -> np.ndarray:
+        """Index of the first rule matching each row.
+
+        Each (column, value) condition is compared once over the whole column, rules
+        are then combined from these masks.
+        """
+        n = len(df)
+        equal = {}
+        for column, value in self.conditions:
+            if column in df.columns:
+                equal[column, value] = np.asarray(
+                    df[column].to_numpy(dtype=object) == value, dtype=bool
+                )
+            else:
+                equal[column, value] = np.zeros(n, dtype=bool)
+
+        # Later rules are applied first so earlier rules overwrite them
+        matched = np.full(n, len(self.criteria))
+        for i in reversed(range(len(self.criteria))):
+            mask = np.ones(n, dtype=bool)
+            for condition in self.criteria[i]:
+                mask &= equal[condition]
+            matched[mask] = i
+        return matched
+
+    def categorize(self, data: dict, field: str = "category"):
+        return self.values[field][self.match(data)]
+
+
+def categorize_edges(gdf, rules: CategoryRules):
+    """Assign category, parent and their scores to every edge in one pass."""
+    matched = rules.match_rows(gdf)
+    for column, values in rules.values.items():
+        gdf[column] = values[matched]
     return gdf
 
 
-def set_category_score(gdf, categories, category_type):
-    scores = {
-        category[category_type]: category[f"{category_type}Score"]
-        for category in categories
-    }
-
-    gdf[f"{category_type}Score"] = gdf[category_type].map(scores)
-
-    return gdf
-
+def make_gdf_directed(edges: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Expand the edges into one row per direction of travel, following OSM's
+    oneway tag.
+
+    Edges are numbered N = 1, 2, ... in order. Edges with oneway "yes" keep their
+    direction and get ID "N", oneway "-1" edges are reversed and get ID "N_r", other
+    edges get both: "N", followed by "N_r" with u and v swapped. The original ID is
+    kept as osmid. Rows are selected and rewritten column by column, without
+    creating a Series per edge.
+    """
+    oneway = edges["oneway"]
+    reverse_only = (oneway == "-1").to_numpy()
+    both = ~reverse_only & (oneway != "yes").to_numpy()
 
-def categorize_edge(data, categories):
-    # Iterate each category in the dictionary
-    for category in categories:
-        # Check criteria
-        criteria = category["criteria"]
-        if all(data.get(key) == value for key, value in criteria.items()):
-            bike_category = category["category"]
-            return bike_category
+    # Row position in edges of each output row, two-way edges appear twice in a row
+    positions = np.repeat(np.arange(len(edges)), np.where(both, 2, 1))
+    repeated = np.zeros(len(positions), dtype=bool)
+    repeated[1:] = positions[1:] == positions[:-1]
+    reverse = reverse_only[positions] | repeated
 
-    else:
-        return "Road with no bike lane"
+    new_edges = edges.take(positions)
+    new_edges["osmid"] = new_edges["id"]
 
+    u, v = new_edges["u"].to_numpy(), new_edges["v"].to_numpy()
+    new_edges["u"] = np.where(reverse, v, u)
+    new_edges["v"] = np.where(reverse, u, v)
 
-def make_gdf_directed(edges: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    # Create a list to hold the modified edges
-    new_edges_list = []
-
-    # Starting ID for new edges
-    counter = 1
-
-    # Iterate through each edge
-    for _, row in edges.iterrows():
-        # Add osmid as original ID
-        row["osmid"] = row["id"]
-
-        # If the edge is one-way in the reverse order
-        if row["oneway"] == "-1":
-            row["u"], row["v"] = row["v"], row["u"]  # swap u and v
-            row["id"] = str(counter) + "_r"
-            counter += 1
-            new_edges_list.append(row)
-
-        # If the edge is bi-directional
-        elif pd.isna(row["oneway"]) or row["oneway"] != "yes":
-            # Append the original edge with new ID
-            row["id"] = counter
-            new_edges_list.append(row)
-
-            # Create a duplicate edge with reversed u and v and an updated ID
-            new_row = row.copy()
-            new_row["id"] = str(counter) + "_r"
-            new_row["u"], new_row["v"] = row["v"], row["u"]
-            new_edges_list.append(new_row)
-
-            counter += 1
-
-        # If the edge is one-way in the forward order
-        else:
-            row["id"] = counter
-            counter += 1
-            new_edges_list.append(row)
-
-    # Convert the list of modified edges back to a GeoDataFrame
-    new_edges = gpd.GeoDataFrame(new_edges_list)
+    numbers = (positions + 1).astype(str)
+    new_edges["id"] = np.char.add(numbers, np.where(reverse, "_r", "")).astype(object)
 
     return new_edges
 
@@ -190,34 +219,124 @@ def plot_bike_roads_with_category(
     plt.close()
 
 
-def write_geodf_to_postgis(gdf, table_name, engine, index: list = None):
-    """
-    Write a GeoDataFrame to a PostGIS table.
-    """
+def postgres_type(dtype) -> str:
+    """Column type for a pandas dtype, the same to_sql would create."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "bigint"
+    if pd.api.types.is_float_dtype(dtype):
+        return "double precision"
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return "timestamp with time zone"
+    if pd.api.types.is_datetime64_dtype(dtype):
+        return "timestamp"
+    return "text"
 
-    # Convert geometry column to WKTElement
-    gdf["geom"] = gdf["geometry"].apply(lambda x: WKTElement(x.wkt, srid=4326))
 
-    # Drop original geometry column
-    gdf = gdf.drop("geometry", axis=1)
+def copy_chunk(engine, table_name: str, chunk: pd.DataFrame) -> int:
+    """Load a DataFrame into an existing table with COPY, as CSV.
+
+    Returns:
+        int: number of rows loaded
+    """
+    buffer = io.StringIO()
+    # Missing values are written as the NULL marker, so empty strings stay empty
+    chunk.to_csv(buffer, header=False, index=False, na_rep=COPY_NULL)
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{column}"' for column in chunk.columns)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.copy_expert(
+            f'COPY "{table_name}" ({columns}) FROM STDIN '
+            f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer,
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    return len(chunk)
 
-    # Write DataFrame to PostGIS table
-    gdf.to_sql(
-        table_name,
-        engine,
-        if_exists="replace",
-        index=False,
-        dtype={"geom": Geometry("GEOMETRY", srid=4326)},
-    )
 
-    if index:
-        with engine.connect() as connection:
-            for i in index:
-                query = f"""
-                CREATE INDEX idx_{i} ON "{table_name}"({i});
-                """
+def write_geodf_to_postgis(
+    gdf,
+    table_name,
+    engine,
+    index: list = None,
+    spatial_index: bool = True,
+    chunk_size: int = COPY_CHUNK_ROWS,
+    workers: int = COPY_WORKERS,
+):
+    """
+    Write a GeoDataFrame to a PostGIS table, replacing the table if it exists.
+
+    Geometries are encoded to hex EWKB in one vectorized call and the rows are
+    streamed with COPY in chunks of chunk_size, workers chunks at a time, into a
+    staging table. The staging table is then indexed and analyzed, and swapped in
+    within one transaction, so readers see either the old or the complete new table
+    with its indexes.
+
+    Args:
+        index (list): columns to create B-tree indexes on
+        spatial_index (bool): create a GiST index on the geometries
+        chunk_size (int): rows per COPY
+        workers (int): database connections loading chunks and building indexes at
+            once
+    """
+    staging = f"{table_name}_staging"
 
-                logging.info(f"Creating index on column {i}")
-                connection.execute(text(query))
+    # Hex EWKB with the SRID is read by PostGIS' geometry input as is
+    frame = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+    frame["geom"] = shapely.to_wkb(
+        shapely.set_srid(gdf.geometry.to_numpy(), SRID), hex=True, include_srid=True
+    )
 
-        connection.close()
+    columns = [
+        f'"{column}" {postgres_type(dtype)}'
+        for column, dtype in frame.dtypes.items()
+        if column != "geom"
+    ] + [f"geom geometry(Geometry, {SRID})"]
+    with engine.begin() as connection:
+        # Left behind if an earlier load failed
+        connection.execute(text(f'DROP TABLE IF EXISTS "{staging}"'))
+        connection.execute(text(f'CREATE TABLE "{staging}" ({", ".join(columns)})'))
+
+    logging.info(f"Copying {len(frame)} rows to {staging} with {workers} workers")
+    chunks = [frame.iloc[i : i + chunk_size] for i in range(0, len(frame), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        loaded = sum(pool.map(lambda chunk: copy_chunk(engine, staging, chunk), chunks))
+    logging.info(f"Copied {loaded} rows")
+
+    # Indexes are named after the final table once swapped in, Graph looks for
+    # idx_<table>_geom
+    indexes = {
+        column: f'CREATE INDEX "idx_{staging}_{column}" ON "{staging}" ("{column}")'
+        for column in index or []
+    }
+    if spatial_index:
+        indexes[
+            "geom"
+        ] = f'CREATE INDEX "idx_{staging}_geom" ON "{staging}" USING GIST (geom)'
+
+    def execute(query):
+        with engine.begin() as connection:
+            connection.execute(text(query))
+
+    logging.info(f"Creating indexes on {', '.join(indexes)}")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(execute, indexes.values()))
+    execute(f'ANALYZE "{staging}"')
+
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+        connection.execute(text(f'ALTER TABLE "{staging}" RENAME TO "{table_name}"'))
+        for column in indexes:
+            connection.execute(
+                text(
+                    f'ALTER INDEX "idx_{staging}_{column}" '
+                    f'RENAME TO "idx_{table_name}_{column}"'
+                )
+            )
+    logging.info(f"Replaced {table_name}")